@@ -6,7 +6,7 @@
 
 {
     "name": "ITA - Liquidazione IVA",
-    "version": "12.0.1.7.0",
+    "version": "12.0.1.10.0",
     'category': 'Localization/Italy',
     'summary': "Allow to create the 'VAT Statement'.",
     'license': 'AGPL-3',
@@ -27,6 +27,7 @@
         'wizard/remove_period.xml',
         'security/ir.model.access.csv',
         'security/security.xml',
+        'data/ir_cron.xml',
         'report/reports.xml',
         'views/report_vatperiodendstatement.xml',
         'views/config.xml',
@@ -0,0 +1,20 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # Totals are now appended for each move
+    cr.execute("""
+        ALTER TABLE account_vat_tax_total
+        DROP CONSTRAINT IF EXISTS account_vat_tax_total_tax_date_kind_uniq
+    """)
+    # Rebuilding the totals is now a repair action run manually
+    cr.execute("""
+        UPDATE ir_cron SET active = FALSE
+        WHERE id IN (
+            SELECT res_id FROM ir_model_data
+            WHERE module = 'account_vat_period_end_statement'
+                AND name = 'ir_cron_rebuild_vat_tax_totals'
+        )
+    """)
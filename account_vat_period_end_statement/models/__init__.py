@@ -2,3 +2,4 @@
 
 from . import config
 from . import account
+from . import vat_tax_total
@@ -600,28 +600,35 @@ class AccountVatPeriodEndStatement(models.Model):
                 statement.interests_debit_vat_amount = interest_amount
         return True
 
-    def _set_debit_lines(self, debit_tax, debit_line_ids, statement):
+    def _get_statement_periods(self, statement):
+        return [
+            (period.date_start, period.date_end)
+            for period in statement.date_range_ids]
+
+    def _set_debit_lines(
+            self, debit_tax, debit_line_ids, statement, totals=None):
+        if totals is None:
+            totals = debit_tax._compute_totals_taxes(
+                {'registry_type': 'customer'},
+                periods=self._get_statement_periods(statement))
         total = 0.0
-        for period in statement.date_range_ids:
-            total += debit_tax._compute_totals_tax({
-                'from_date': period.date_start,
-                'to_date': period.date_end,
-                'registry_type': 'customer',
-            })[3]  # position 3 is deductible part
+        for period_totals in totals[debit_tax.id]:
+            total += period_totals[3]  # position 3 is deductible part
         debit_line_ids.append({
             'account_id': debit_tax.vat_statement_account_id.id,
             'tax_id': debit_tax.id,
             'amount': total,
         })
 
-    def _set_credit_lines(self, credit_tax, credit_line_ids, statement):
+    def _set_credit_lines(
+            self, credit_tax, credit_line_ids, statement, totals=None):
+        if totals is None:
+            totals = credit_tax._compute_totals_taxes(
+                {'registry_type': 'supplier'},
+                periods=self._get_statement_periods(statement))
         total = 0.0
-        for period in statement.date_range_ids:
-            total += credit_tax._compute_totals_tax({
-                'from_date': period.date_start,
-                'to_date': period.date_end,
-                'registry_type': 'supplier',
-            })[3]  # position 3 is deductible part
+        for period_totals in totals[credit_tax.id]:
+            total += period_totals[3]  # position 3 is deductible part
         credit_line_ids.append({
             'account_id': credit_tax.vat_statement_account_id.id,
             'tax_id': credit_tax.id,
@@ -636,6 +643,8 @@ class AccountVatPeriodEndStatement(models.Model):
             ('vat_statement_account_id', '!=', False),
             ('type_tax_use', 'in', ['sale', 'purchase']),
         ])
+        debit_taxes = tax_model
+        credit_taxes = tax_model
         for tax in taxes:
             # se ho una tassa padre con figli cee_type, condidero le figlie
             if any(tax_ch for tax_ch in tax.children_tax_ids
@@ -643,18 +652,27 @@ class AccountVatPeriodEndStatement(models.Model):
 
                 for tax_ch in tax.children_tax_ids:
                     if tax_ch.cee_type == 'sale':
-                        self._set_debit_lines(tax_ch,
-                                              debit_line_ids,
-                                              statement)
+                        debit_taxes |= tax_ch
                     elif tax_ch.cee_type == 'purchase':
-                        self._set_credit_lines(tax_ch,
-                                               credit_line_ids,
-                                               statement)
+                        credit_taxes |= tax_ch
 
             elif tax.type_tax_use == 'sale':
-                self._set_debit_lines(tax, debit_line_ids, statement)
+                debit_taxes |= tax
             elif tax.type_tax_use == 'purchase':
-                self._set_credit_lines(tax, credit_line_ids, statement)
+                credit_taxes |= tax
+
+        # Totals of all the taxes and periods are read at once
+        periods = self._get_statement_periods(statement)
+        debit_totals = debit_taxes._compute_totals_taxes(
+            {'registry_type': 'customer'}, periods=periods)
+        credit_totals = credit_taxes._compute_totals_taxes(
+            {'registry_type': 'supplier'}, periods=periods)
+        for debit_tax in debit_taxes:
+            self._set_debit_lines(
+                debit_tax, debit_line_ids, statement, totals=debit_totals)
+        for credit_tax in credit_taxes:
+            self._set_credit_lines(
+                credit_tax, credit_line_ids, statement, totals=credit_totals)
 
         return credit_line_ids, debit_line_ids
 
@@ -745,6 +763,48 @@ class AccountTax(models.Model):
              "VAT statement"
     )
 
+    def _vat_tax_totals_domain_supported(self, from_date, to_date):
+        """Check that the move lines read by account_tax_balance
+        are exactly the ones summed up in account.vat.tax.total,
+        i.e. that no module extended the domains of the balances."""
+        tax = self[:1].with_context(from_date=from_date, to_date=to_date)
+        for tax_or_base, tax_field in (
+            ('tax', 'tax_line_id'),
+            ('base', 'tax_ids'),
+        ):
+            for leaf in tax.get_move_lines_domain(tax_or_base=tax_or_base):
+                if not isinstance(leaf, (list, tuple)):
+                    return False
+                field, operator, value = leaf
+                if field == 'move_id.state':
+                    if operator != 'in' or list(value) != ['posted']:
+                        return False
+                elif field == 'tax_exigible':
+                    if operator != '=' or value is not True:
+                        return False
+                elif field not in ('date', 'company_id', tax_field):
+                    return False
+        return True
+
+    def _get_totals_balance_rows(self, from_date, to_date, journal_ids=None):
+        if (
+            journal_ids or
+            self.env.context.get('target_move', 'posted') != 'posted' or
+            not self._vat_tax_totals_domain_supported(from_date, to_date)
+        ):
+            return super()._get_totals_balance_rows(
+                from_date, to_date, journal_ids=journal_ids)
+        company_id = self.env.context.get(
+            'company_id', self.env.user.company_id.id)
+        rows = self.env['account.vat.tax.total']._get_balance_rows(
+            self, from_date, to_date, company_id)
+        if rows is None:
+            # Move lines are restricted by record rules
+            # that can't be applied to the totals
+            return super()._get_totals_balance_rows(
+                from_date, to_date, journal_ids=journal_ids)
+        return rows
+
 
 class DateRange(models.Model):
     _inherit = "date.range"
@@ -0,0 +1,212 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import SUPERUSER_ID, api, fields, models, tools
+from odoo.osv import expression
+
+
+class AccountVatTaxTotal(models.Model):
+    """Balances of the move lines of each tax and day,
+    as read by account_tax_balance for posted moves.
+
+    Each posting or cancellation of a move appends its own rows,
+    so that concurrent postings never update the same row;
+    the total of a tax and day is the sum of its rows.
+    Rows of the same tax and day are merged by the scheduled compaction.
+    Changes made bypassing the ORM are fixed by rebuilding the totals."""
+    _name = 'account.vat.tax.total'
+    _description = "VAT totals by tax and date"
+    _log_access = False
+    _order = 'date, tax_id, kind'
+
+    company_id = fields.Many2one(
+        'res.company', required=True, readonly=True, index=True,
+        ondelete='cascade')
+    tax_id = fields.Many2one(
+        'account.tax', required=True, readonly=True, ondelete='cascade')
+    date = fields.Date(required=True, readonly=True)
+    kind = fields.Selection([
+        ('tax', 'Tax'),
+        ('base', 'Base'),
+    ], required=True, readonly=True)
+    balance = fields.Float(
+        readonly=True, help="Debit - credit of the move lines")
+    move_id = fields.Many2one(
+        'account.move', readonly=True, ondelete='set null',
+        help="Move that added this row, empty for compacted rows")
+
+    @api.model_cr
+    def init(self):
+        tools.create_index(
+            self.env.cr, 'account_vat_tax_total_tax_id_date_index',
+            self._table, ['tax_id', 'date'])
+        self.env.cr.execute(
+            'SELECT 1 FROM account_vat_tax_total LIMIT 1')
+        if not self.env.cr.fetchone():
+            # Module has just been installed
+            self._rebuild_totals()
+
+    @api.model
+    def _add_move_lines(self, where, params, sign=1):
+        """Append `sign` times the balances of the move lines
+        selected by `where` to the totals, one row for each move"""
+        tax_ids_field = self.env['account.move.line']._fields['tax_ids']
+        query = """
+            INSERT INTO account_vat_tax_total
+                (company_id, tax_id, date, kind, balance, move_id)
+            SELECT aml.company_id, aml.tax_line_id, aml.date, 'tax',
+                %(sign)s * SUM(aml.balance), aml.move_id
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            WHERE aml.tax_line_id IS NOT NULL
+                AND aml.tax_exigible
+                AND {where}
+            GROUP BY aml.company_id, aml.tax_line_id, aml.date, aml.move_id
+            UNION ALL
+            SELECT aml.company_id, tax_rel.{tax_column}, aml.date, 'base',
+                %(sign)s * SUM(aml.balance), aml.move_id
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            JOIN {tax_relation} tax_rel
+                ON tax_rel.{line_column} = aml.id
+            WHERE aml.tax_exigible
+                AND {where}
+            GROUP BY aml.company_id, tax_rel.{tax_column}, aml.date,
+                aml.move_id
+        """.format(
+            where=where,
+            tax_relation=tax_ids_field.relation,
+            line_column=tax_ids_field.column1,
+            tax_column=tax_ids_field.column2,
+        )
+        self.env.cr.execute(query, dict(params, sign=sign))
+        self.invalidate_cache()
+
+    @api.model
+    def _add_moves(self, moves, sign=1):
+        if moves:
+            self._add_move_lines(
+                'am.id IN %(move_ids)s', {'move_ids': tuple(moves.ids)},
+                sign=sign)
+
+    @api.model
+    def _rebuild_totals(self, from_date=None, to_date=None):
+        """Compute again the totals from the posted moves,
+        only between `from_date` and `to_date` if given"""
+        where = ["am.state = 'posted'"]
+        totals_where = ['TRUE']
+        params = {'from_date': from_date, 'to_date': to_date}
+        if from_date:
+            where.append('aml.date >= %(from_date)s')
+            totals_where.append('date >= %(from_date)s')
+        if to_date:
+            where.append('aml.date <= %(to_date)s')
+            totals_where.append('date <= %(to_date)s')
+        self.env.cr.execute(
+            'DELETE FROM account_vat_tax_total WHERE '
+            + ' AND '.join(totals_where), params)
+        self._add_move_lines(' AND '.join(where), params)
+
+    @api.model
+    def _compact_totals(self):
+        """Merge the rows of each tax, date and kind into one"""
+        self.env.cr.execute("""
+            WITH duplicated AS (
+                SELECT company_id, tax_id, date, kind
+                FROM account_vat_tax_total
+                GROUP BY company_id, tax_id, date, kind
+                HAVING COUNT(*) > 1
+            ), deleted AS (
+                DELETE FROM account_vat_tax_total total
+                USING duplicated
+                WHERE total.company_id = duplicated.company_id
+                    AND total.tax_id = duplicated.tax_id
+                    AND total.date = duplicated.date
+                    AND total.kind = duplicated.kind
+                RETURNING total.company_id, total.tax_id, total.date,
+                    total.kind, total.balance
+            )
+            INSERT INTO account_vat_tax_total
+                (company_id, tax_id, date, kind, balance)
+            SELECT company_id, tax_id, date, kind, SUM(balance)
+            FROM deleted
+            GROUP BY company_id, tax_id, date, kind
+        """)
+        self.invalidate_cache()
+
+    @api.model
+    def cron_compact_totals(self):
+        self._compact_totals()
+        return True
+
+    @api.model
+    def cron_rebuild_totals(self, from_date=None, to_date=None):
+        self._rebuild_totals(from_date=from_date, to_date=to_date)
+        return True
+
+    @api.model
+    def _get_move_line_rules_domain(self):
+        """Domain of the record rules of the move lines,
+        None if it does not only filter by company"""
+        if self._uid == SUPERUSER_ID:
+            return []
+        domain = self.env['ir.rule']._compute_domain(
+            'account.move.line', 'read') or []
+        for leaf in domain:
+            if expression.is_leaf(leaf) and \
+                    leaf not in (expression.TRUE_LEAF, expression.FALSE_LEAF) \
+                    and leaf[0] != 'company_id':
+                return None
+        return domain
+
+    @api.model
+    def _get_balance_rows(self, taxes, from_date, to_date, company_id):
+        """Same as account.tax._get_totals_balance_rows,
+        None if the record rules of the move lines can't be applied"""
+        rules_domain = self._get_move_line_rules_domain()
+        if rules_domain is None:
+            return None
+        domain = expression.AND([[
+            ('company_id', '=', company_id),
+            ('tax_id', 'in', taxes.ids),
+            ('date', '>=', from_date),
+            ('date', '<=', to_date),
+        ], rules_domain])
+        from_clause, where_clause, params = self.sudo()._where_calc(
+            domain).get_sql()
+        self.env.cr.execute("""
+            SELECT kind, tax_id, date, SUM(balance)
+            FROM {from_clause}
+            WHERE {where_clause}
+            GROUP BY kind, tax_id, date
+        """.format(
+            from_clause=from_clause,
+            where_clause=where_clause,
+        ), params)
+        return self.env.cr.fetchall()
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    @api.multi
+    def write(self, vals):
+        if 'state' not in vals:
+            return super().write(vals)
+        # Also covers modules writing the state directly,
+        # e.g. to add lines to a posted move
+        totals_model = self.env['account.vat.tax.total']
+        posted = self.filtered(lambda m: m.state == 'posted')
+        if vals['state'] != 'posted':
+            totals_model._add_moves(posted, sign=-1)
+        res = super().write(vals)
+        if vals['state'] == 'posted':
+            totals_model._add_moves(self - posted)
+        return res
+
+    @api.multi
+    def button_cancel(self):
+        # State is written with SQL
+        posted = self.filtered(lambda m: m.state == 'posted')
+        res = super().button_cancel()
+        self.env['account.vat.tax.total']._add_moves(posted, sign=-1)
+        return res
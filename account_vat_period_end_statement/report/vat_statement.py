@@ -42,17 +42,20 @@ class VatPeriodEndStatementReport(models.AbstractModel):
             tax_ids = []
         res = {}
         date_range = self.env['date.range'].browse(period_id)
-        tax_model = self.env['account.tax']
+        taxes = self.env['account.tax'].browse(tax_ids)
+        # Totals of the parents are needed for the base of their children
+        parents = taxes.filtered(
+            lambda t: t.cee_type and len(t.parent_tax_ids) == 1
+        ).mapped('parent_tax_ids')
+        totals = (taxes | parents)._compute_totals_taxes({
+            'from_date': date_range.date_start,
+            'to_date': date_range.date_end,
+            'registry_type': registry_type,
+        })
 
-        for tax_id in tax_ids:
-            tax = tax_model.browse(tax_id)
+        for tax in taxes:
             tax_name, base, tax_val, deductible, undeductible = (
-                tax._compute_totals_tax({
-                    'from_date': date_range.date_start,
-                    'to_date': date_range.date_end,
-                    'registry_type': registry_type,
-                })
-            )
+                totals[tax.id][0])
 
             if (
                 tax.cee_type and tax.parent_tax_ids and
@@ -61,14 +64,8 @@ class VatPeriodEndStatementReport(models.AbstractModel):
                 # In caso di integrazione iva l'imponibile è solo sulla
                 # padre
                 parent = tax.parent_tax_ids[0]
-
-                tax_data = parent._compute_totals_tax({
-                    'from_date': date_range.date_start,
-                    'to_date': date_range.date_end,
-                    'registry_type': registry_type,
-                    })
                 # return tax_name, base, tax_val, deductible, undeductible
-                base = tax_data[1]
+                base = totals[parent.id][0][1]
 
             res[tax_name] = {
                 'code': tax_name,
@@ -227,3 +227,161 @@ class TestTax(TransactionCase):
         self.assertTrue(self.vat_statement.move_id)
         self.assertEqual(self.vat_statement.move_id.amount, 122)
         # TODO payment
+
+    def test_compute_totals_taxes(self):
+        out_invoice_account = self.env['account.account'].search([
+            (
+                'user_type_id', '=',
+                self.env.ref('account.data_account_type_receivable').id
+            )
+        ], limit=1).id
+        out_invoice_line_account = self.env['account.account'].search([
+            (
+                'user_type_id', '=',
+                self.env.ref('account.data_account_type_expenses').id)
+        ], limit=1).id
+        out_invoice = self.invoice_model.create({
+            'date_invoice': self.recent_date,
+            'account_id': out_invoice_account,
+            'journal_id': self.sale_journal.id,
+            'partner_id': self.env.ref('base.res_partner_3').id,
+            'type': 'out_invoice',
+            })
+        self.invoice_line_model.create({
+            'invoice_id': out_invoice.id,
+            'account_id': out_invoice_line_account,
+            'name': 'service',
+            'price_unit': 100,
+            'quantity': 1,
+            'invoice_line_tax_ids': [(6, 0, [self.account_tax_22.id])],
+            })
+        out_invoice.compute_taxes()
+        out_invoice.action_invoice_open()
+
+        recent_period = self.env['date.range'].search([
+            ('type_id', '=', self.range_type.id),
+            ('date_start', '<=', self.recent_date),
+            ('date_end', '>=', self.recent_date),
+        ])
+        periods = [
+            (recent_period.date_start, recent_period.date_end),
+            (self.last_year_period.date_start,
+             self.last_year_period.date_end),
+        ]
+        taxes = self.account_tax_22 | self.account_tax_22_credit
+        totals = taxes._compute_totals_taxes(
+            {'registry_type': 'customer'}, periods=periods)
+        self.assertEqual(
+            totals[self.account_tax_22.id],
+            [('22%', 100, 22, 22, 0), ('22%', 0, 0, 0, 0)])
+        # Same totals as computing each tax and period on its own
+        for tax in taxes:
+            for period_index, (from_date, to_date) in enumerate(periods):
+                self.assertEqual(
+                    totals[tax.id][period_index],
+                    tax._compute_totals_tax({
+                        'from_date': from_date,
+                        'to_date': to_date,
+                        'registry_type': 'customer',
+                    }))
+
+    def _assert_vat_tax_totals(self, taxes, periods):
+        """Totals read from account.vat.tax.total
+        are the same as the ones read from the move lines"""
+        journal_ids = self.env['account.journal'].search([]).ids
+        totals = taxes._get_totals_balances(periods)
+        move_lines_totals = taxes._get_totals_balances(
+            periods, journal_ids=journal_ids)
+        self.assertEqual(
+            {key: round(value, 2) for key, value in totals.items()},
+            {key: round(value, 2) for key, value in move_lines_totals.items()})
+        return totals
+
+    def test_vat_tax_totals(self):
+        out_invoice_account = self.env['account.account'].search([
+            (
+                'user_type_id', '=',
+                self.env.ref('account.data_account_type_receivable').id
+            )
+        ], limit=1).id
+        out_invoice_line_account = self.env['account.account'].search([
+            (
+                'user_type_id', '=',
+                self.env.ref('account.data_account_type_expenses').id)
+        ], limit=1).id
+        out_invoice = self.invoice_model.create({
+            'date_invoice': self.recent_date,
+            'account_id': out_invoice_account,
+            'journal_id': self.sale_journal.id,
+            'partner_id': self.env.ref('base.res_partner_3').id,
+            'type': 'out_invoice',
+            })
+        self.invoice_line_model.create({
+            'invoice_id': out_invoice.id,
+            'account_id': out_invoice_line_account,
+            'name': 'service',
+            'price_unit': 100,
+            'quantity': 1,
+            'invoice_line_tax_ids': [(6, 0, [self.account_tax_22.id])],
+            })
+        out_invoice.compute_taxes()
+        taxes = self.account_tax_22 | self.account_tax_22_credit
+        periods = [(self.recent_date, self.recent_date)]
+        key = ('tax', self.account_tax_22.id, 0)
+        base_key = ('base', self.account_tax_22.id, 0)
+        previous = self._assert_vat_tax_totals(taxes, periods)
+
+        out_invoice.action_invoice_open()
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key] - previous[key], 22)
+        self.assertAlmostEqual(totals[base_key] - previous[base_key], 100)
+
+        out_invoice.journal_id.update_posted = True
+        out_invoice.action_cancel()
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key], previous[key])
+        self.assertAlmostEqual(totals[base_key], previous[base_key])
+
+        out_invoice.action_invoice_draft()
+        out_invoice.action_invoice_open()
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key] - previous[key], 22)
+
+        # Moves set to draft and posted again by writing the state
+        move = out_invoice.move_id
+        move.state = 'draft'
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key], previous[key])
+        move.state = 'posted'
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key] - previous[key], 22)
+
+        move.button_cancel()
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key], previous[key])
+        move.post()
+        self._assert_vat_tax_totals(taxes, periods)
+
+        # Each posting and cancellation appended its own rows,
+        # compacting merges them
+        totals_model = self.env['account.vat.tax.total']
+        totals_domain = [
+            ('tax_id', '=', self.account_tax_22.id),
+            ('date', '=', self.recent_date),
+            ('kind', '=', 'tax'),
+        ]
+        self.assertGreater(totals_model.search_count(totals_domain), 1)
+        totals_model.cron_compact_totals()
+        self.assertEqual(totals_model.search_count(totals_domain), 1)
+        self.assertFalse(totals_model.search(totals_domain).move_id)
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key] - previous[key], 22)
+
+        # Changes made with SQL are fixed by the rebuild of their dates
+        self.env.cr.execute(
+            "UPDATE account_move SET state = 'draft' WHERE id = %s",
+            (move.id, ))
+        totals_model.cron_rebuild_totals(
+            from_date=self.recent_date, to_date=self.recent_date)
+        totals = self._assert_vat_tax_totals(taxes, periods)
+        self.assertAlmostEqual(totals[key], previous[key])
@@ -5,3 +5,6 @@ from . import account_group
 from . import account_tax
 from . import account_type
 from . import res_company
+from . import chunked_report
+from . import ir_actions_report
+from . import ir_attachment
@@ -1,5 +1,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from collections import defaultdict
+
 from odoo import models, fields
 
 
@@ -34,28 +36,116 @@ class AccountTax(models.Model):
             name = self.parent_tax_ids[0].name
         return name
 
-    def _compute_totals_tax(self, data):
+    def _get_totals_move_lines_query(
+            self, tax_or_base, from_date, to_date, journal_ids=None):
+        """Query of the move lines of all the taxes in `self`,
+        selected as account_tax_balance does for a single tax."""
+        context = {
+            'from_date': from_date,
+            'to_date': to_date,
+        }
+        if journal_ids:
+            context['vat_registry_journal_ids'] = journal_ids
+        tax = self[:1].with_context(context)
+        domain = []
+        for leaf in tax.get_move_lines_domain(tax_or_base=tax_or_base):
+            if isinstance(leaf, (list, tuple)) and \
+                    leaf[0] in ('tax_line_id', 'tax_ids'):
+                leaf = (leaf[0], 'in', self.ids)
+            domain.append(leaf)
+        move_line_model = self.env['account.move.line']
+        query = move_line_model._where_calc(domain)
+        move_line_model._apply_ir_rules(query, 'read')
+        return query
+
+    def _get_totals_balance_rows(self, from_date, to_date, journal_ids=None):
+        """Read the tax and base balances of all the taxes in `self`
+        between the given dates, using a single query.
+
+        Returns:
+            A list of ('tax' or 'base', tax_id, date, balance) tuples,
+            balance being debit - credit of the move lines
+
         """
+        tax_from, tax_where, tax_params = self._get_totals_move_lines_query(
+            'tax', from_date, to_date, journal_ids=journal_ids).get_sql()
+        base_from, base_where, base_params = \
+            self._get_totals_move_lines_query(
+                'base', from_date, to_date, journal_ids=journal_ids
+            ).get_sql()
+        tax_ids_field = self.env['account.move.line']._fields['tax_ids']
+        query = """
+            SELECT 'tax', account_move_line.tax_line_id,
+                account_move_line.date, SUM(account_move_line.balance)
+            FROM {tax_from}
+            WHERE {tax_where}
+            GROUP BY account_move_line.tax_line_id, account_move_line.date
+            UNION ALL
+            SELECT 'base', tax_rel.{tax_column},
+                account_move_line.date, SUM(account_move_line.balance)
+            FROM {base_from}, {tax_relation} tax_rel
+            WHERE tax_rel.{line_column} = account_move_line.id
+                AND tax_rel.{tax_column} IN %s
+                AND {base_where}
+            GROUP BY tax_rel.{tax_column}, account_move_line.date
+        """.format(
+            tax_from=tax_from,
+            tax_where=tax_where or 'TRUE',
+            base_from=base_from,
+            base_where=base_where or 'TRUE',
+            tax_relation=tax_ids_field.relation,
+            line_column=tax_ids_field.column1,
+            tax_column=tax_ids_field.column2,
+        )
+        self.env.cr.execute(
+            query, tax_params + [tuple(self.ids)] + base_params)
+        return self.env.cr.fetchall()
+
+    def _get_totals_balances(self, periods, journal_ids=None):
+        """Compute the tax and base balances of all the taxes in `self`
+        for each period.
+
         Args:
-            data: date range, journals and registry_type
+            periods: list of (from_date, to_date) tuples
+            journal_ids: journals to be considered, all if empty
+        Returns:
+            A dictionary {('tax' or 'base', tax_id, period_index): balance}
+
+        """
+        balances = defaultdict(float)
+        periods = [
+            (fields.Date.to_date(from_date), fields.Date.to_date(to_date))
+            for from_date, to_date in periods]
+        if not self or not periods:
+            return balances
+        from_date = min(period[0] for period in periods)
+        to_date = max(period[1] for period in periods)
+        rows = self._get_totals_balance_rows(
+            from_date, to_date, journal_ids=journal_ids)
+        for tax_or_base, tax_id, date, balance in rows:
+            for period_index, (period_from, period_to) in enumerate(periods):
+                if period_from <= date <= period_to:
+                    # As in account_tax_balance, VAT on sales is positive
+                    balances[(tax_or_base, tax_id, period_index)] -= balance
+        return balances
+
+    def _compute_totals_tax_from_balances(
+            self, balances, period_index, registry_type):
+        """
+        Args:
+            balances: balances returned by _get_totals_balances,
+                including the balances of the children taxes
+            period_index: index of the period in balances
+            registry_type: 'customer' or 'supplier'
         Returns:
             A tuple: (tax_name, base, tax, deductible, undeductible)
 
         """
         self.ensure_one()
-        context = {
-            'from_date': data['from_date'],
-            'to_date': data['to_date'],
-        }
-        registry_type = data.get('registry_type', 'customer')
-        if data.get('journal_ids'):
-            context['vat_registry_journal_ids'] = data['journal_ids']
-
-        tax = self.env['account.tax'].with_context(context).browse(self.id)
-        tax_name = tax._get_tax_name()
-        if not tax.children_tax_ids:
-            base_balance = tax.base_balance
-            balance = tax.balance
+        tax_name = self._get_tax_name()
+        base_balance = balances[('base', self.id, period_index)]
+        if not self.children_tax_ids:
+            balance = balances[('tax', self.id, period_index)]
             if registry_type == 'supplier':
                 base_balance = -base_balance
                 balance = -balance
@@ -63,20 +153,18 @@ class AccountTax(models.Model):
                 tax_name, base_balance, balance, balance, 0
             )
         else:
-            base_balance = tax.base_balance
-
             tax_balance = 0
             deductible = 0
             undeductible = 0
-            for child in tax.children_tax_ids:
-                child_balance = child.balance
+            for child in self.children_tax_ids:
+                child_balance = balances[('tax', child.id, period_index)]
                 if (
                     (
-                        data['registry_type'] == 'customer' and
+                        registry_type == 'customer' and
                         child.cee_type == 'sale'
                     ) or
                     (
-                        data['registry_type'] == 'supplier' and
+                        registry_type == 'supplier' and
                         child.cee_type == 'purchase'
                     )
                 ):
@@ -100,3 +188,42 @@ class AccountTax(models.Model):
             return (
                 tax_name, base_balance, tax_balance, deductible, undeductible
             )
+
+    def _compute_totals_taxes(self, data, periods=None):
+        """
+        Compute the totals of all the taxes in `self` for each period,
+        reading the move lines once.
+
+        Args:
+            data: journals and registry_type; date range too,
+                if periods is not given
+            periods: list of (from_date, to_date) tuples
+        Returns:
+            A dictionary {tax_id: [(tax_name, base, tax, deductible,
+            undeductible) for each period]}
+
+        """
+        if periods is None:
+            periods = [(data['from_date'], data['to_date'])]
+        registry_type = data.get('registry_type', 'customer')
+        balances = (self | self.mapped('children_tax_ids'))\
+            ._get_totals_balances(
+                periods, journal_ids=data.get('journal_ids'))
+        return {
+            tax.id: [
+                tax._compute_totals_tax_from_balances(
+                    balances, period_index, registry_type)
+                for period_index in range(len(periods))]
+            for tax in self
+        }
+
+    def _compute_totals_tax(self, data):
+        """
+        Args:
+            data: date range, journals and registry_type
+        Returns:
+            A tuple: (tax_name, base, tax, deductible, undeductible)
+
+        """
+        self.ensure_one()
+        return self._compute_totals_taxes(data)[self.id][0]
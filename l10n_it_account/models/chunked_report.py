@@ -0,0 +1,77 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import io
+
+from PyPDF2 import PdfFileReader
+
+from odoo import api, models
+from odoo.tools.pdf import merge_pdf
+
+DEFAULT_REPORT_CHUNK_SIZE = 5000
+
+
+class ChunkedReportMixin(models.AbstractModel):
+    """Reports printing long lists of records (data['ids']),
+    rendered as PDF in chunks of records that are then merged.
+
+    Page numbers and any progressive value printed in the report
+    are carried over from a chunk to the next one
+    by `_prepare_next_chunk_form`."""
+    _name = 'l10n_it.chunked.report.mixin'
+    _description = "Report printed in chunks"
+
+    @api.model
+    def _get_chunk_size(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'l10n_it_account.report_chunk_size', DEFAULT_REPORT_CHUNK_SIZE))
+
+    @api.model
+    def _use_pdf_chunks(self, data):
+        """Whether the report of `data` can be rendered in chunks:
+        every chunk prints its header, so reports printing
+        no rows for some chunks must be rendered at once."""
+        return True
+
+    @api.model
+    def _prepare_chunk_form(self, form, chunk_ids, last):
+        """Values of data['form'] used to render `chunk_ids`.
+
+        :param last: True if this is the last chunk of the report
+        """
+        return dict(form)
+
+    @api.model
+    def _prepare_next_chunk_form(self, form, chunk_ids, page_count):
+        """Values of data['form'] of the chunk following `chunk_ids`,
+        that has been rendered in `page_count` pages using `form`."""
+        form = dict(form)
+        form['fiscal_page_base'] = form['fiscal_page_base'] + page_count
+        return form
+
+    @api.model
+    def _render_pdf_chunks(self, report, res_ids, data):
+        chunk_size = self._get_chunk_size()
+        ids = data['ids']
+        form = data['form']
+        report = report.with_context(l10n_it_report_chunk=True)
+        parts = []
+        content_type = 'pdf'
+        for index in range(0, len(ids), chunk_size):
+            chunk_ids = ids[index:index + chunk_size]
+            chunk_form = self._prepare_chunk_form(
+                form, chunk_ids, index + chunk_size >= len(ids))
+            content, content_type = report.render_qweb_pdf(
+                res_ids, data=dict(data, ids=chunk_ids, form=chunk_form))
+            parts.append(content)
+            page_count = 0
+            if content_type == 'pdf':
+                page_count = PdfFileReader(
+                    io.BytesIO(content), strict=False).getNumPages()
+            form = self._prepare_next_chunk_form(
+                chunk_form, chunk_ids, page_count)
+            # Records of the chunk are not needed anymore
+            self.invalidate_cache()
+        if content_type != 'pdf':
+            # Reports are rendered as HTML when running tests
+            return b''.join(parts), content_type
+        return merge_pdf(parts), content_type
@@ -0,0 +1,21 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class IrActionsReport(models.Model):
+    _inherit = 'ir.actions.report'
+
+    @api.multi
+    def render_qweb_pdf(self, res_ids=None, data=None):
+        report_model = self.env.get('report.%s' % self.report_name)
+        if (
+            data and data.get('ids') and
+            report_model is not None and
+            hasattr(report_model, '_render_pdf_chunks') and
+            not self.env.context.get('l10n_it_report_chunk') and
+            len(data['ids']) > report_model._get_chunk_size() and
+            report_model._use_pdf_chunks(data)
+        ):
+            return report_model._render_pdf_chunks(self, res_ids, data)
+        return super().render_qweb_pdf(res_ids=res_ids, data=data)
@@ -0,0 +1,66 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import base64
+import hashlib
+import os
+import tempfile
+
+from odoo import api, models
+
+# Bytes copied at a time when streaming files to the filestore
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    @api.model
+    def _prepare_raw_file_vals(self, file_obj):
+        """Values for creating an attachment with the content of
+        `file_obj`. When the filestore is used, the content is copied
+        there chunk by chunk, without being loaded nor base64 encoded.
+
+        Attachments created with these values must then be passed to
+        `_write_raw_file_vals`.
+        """
+        if self._storage() != 'file':
+            return {'datas': base64.b64encode(file_obj.read())}
+        sha = hashlib.sha1()
+        file_size = 0
+        tmp = tempfile.NamedTemporaryFile(
+            dir=self._filestore(), prefix='.tmp', delete=False)
+        try:
+            with tmp:
+                for chunk in iter(
+                        lambda: file_obj.read(STREAM_CHUNK_SIZE), b''):
+                    sha.update(chunk)
+                    tmp.write(chunk)
+                    file_size += len(chunk)
+            checksum = sha.hexdigest()
+            fname, full_path = self._get_path(b'', checksum)
+            if os.path.exists(full_path):
+                os.unlink(tmp.name)
+            else:
+                os.rename(tmp.name, full_path)
+                self._mark_for_gc(fname)
+        except Exception:
+            if os.path.exists(tmp.name):
+                os.unlink(tmp.name)
+            raise
+        return {
+            'store_fname': fname,
+            'file_size': file_size,
+            'checksum': checksum,
+        }
+
+    @api.multi
+    def _write_raw_file_vals(self, vals_list):
+        """Store the size and checksum prepared by
+        `_prepare_raw_file_vals`, that `create` would discard."""
+        for att, vals in zip(self, vals_list):
+            if 'checksum' in vals:
+                self.env.cr.execute(
+                    'UPDATE ir_attachment SET file_size = %s, checksum = %s '
+                    'WHERE id = %s',
+                    (vals['file_size'], vals['checksum'], att.id))
+        self.invalidate_cache(['file_size', 'checksum'])
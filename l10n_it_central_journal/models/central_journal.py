@@ -9,6 +9,7 @@ _logger = logging.getLogger(__name__)
 
 class ReportGiornale(models.AbstractModel):
     _name = 'report.l10n_it_central_journal.report_giornale'
+    _inherit = 'l10n_it.chunked.report.mixin'
     _description = "Journal report"
 
     @api.model
@@ -43,6 +44,18 @@ class ReportGiornale(models.AbstractModel):
             'account.move.line'].browse(move_ids)
         return move_list
 
+    @api.model
+    def _prepare_next_chunk_form(self, form, chunk_ids, page_count):
+        form = super()._prepare_next_chunk_form(form, chunk_ids, page_count)
+        totals = self.env['account.move.line'].read_group(
+            [('id', 'in', chunk_ids)], ['debit', 'credit'], [])[0]
+        form['start_row'] = form['start_row'] + len(chunk_ids)
+        form['progressive_debit'] = \
+            form['progressive_debit'] + (totals['debit'] or 0.0)
+        form['progressive_credit'] = \
+            form['progressive_credit'] + (totals['credit'] or 0.0)
+        return form
+
     def _save_print_info(self, daterange_id, print_state, end_date_print,
                          end_row, end_debit, end_credit):
         res = False
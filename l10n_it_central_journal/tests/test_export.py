@@ -0,0 +1,147 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import base64
+import csv
+import io
+import zipfile
+from datetime import date
+
+import mock
+
+from odoo.addons.account.tests.account_test_classes import AccountingTestCase
+from odoo.exceptions import Warning as UserError
+
+
+class TestExport(AccountingTestCase):
+
+    def setUp(self):
+        super(TestExport, self).setUp()
+        self.journal = self.env['account.journal'].create({
+            'name': 'Journal export test',
+            'code': 'JET',
+            'type': 'general',
+        })
+        range_type = self.env['date.range.type'].create({
+            'name': 'Journal export test',
+            'company_id': False,
+        })
+        self.daterange = self.env['date.range'].create({
+            'name': 'Journal export test',
+            'type_id': range_type.id,
+            'date_start': date(2100, 1, 1),
+            'date_end': date(2100, 1, 31),
+            'company_id': self.env.user.company_id.id,
+        })
+        accounts = self.env['account.account'].search([
+            ('user_type_id', '=',
+             self.env.ref('account.data_account_type_revenue').id),
+        ], limit=2)
+        self.move = self.env['account.move'].create({
+            'journal_id': self.journal.id,
+            'date': date(2100, 1, 15),
+            'ref': 'http://www.example.com',
+            'line_ids': [
+                (0, 0, {
+                    'account_id': accounts[0].id,
+                    'name': '=1+1',
+                    'debit': 100,
+                }),
+                (0, 0, {
+                    'account_id': accounts[-1].id,
+                    'name': '@SUM(1,1)',
+                    'credit': 100,
+                }),
+            ],
+        })
+        self.move.post()
+
+    def _get_wizard(self, export_format):
+        wizard = self.env['wizard.giornale'].create({
+            'daterange': self.daterange.id,
+            'date_move_line_from': self.daterange.date_start,
+            'date_move_line_to': self.daterange.date_end,
+            'journal_ids': [(6, 0, self.journal.ids)],
+            'fiscal_page_base': 0,
+            'start_row': 0,
+            'export_format': export_format,
+        })
+        wizard.on_change_daterange()
+        return wizard
+
+    def _get_export_content(self):
+        attachment = self.env['ir.attachment'].search([
+            ('res_model', '=', 'date.range'),
+            ('res_id', '=', self.daterange.id),
+        ], order='id desc', limit=1)
+        return base64.b64decode(attachment.datas)
+
+    def test_export_csv(self):
+        wizard = self._get_wizard('csv')
+        action = wizard.export_giornale()
+        self.assertEqual(action['type'], 'ir.actions.act_url')
+        rows = list(csv.reader(io.StringIO(
+            self._get_export_content().decode('utf-8'))))
+        # Header, initial balance, 2 move lines and final balance
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[2][0], '1')
+        self.assertEqual(rows[2][2], 'http://www.example.com')
+        self.assertEqual(rows[2][6], '=1+1')
+        self.assertEqual(rows[3][6], '@SUM(1,1)')
+        self.assertEqual(float(rows[4][9]), 100)
+        self.assertEqual(float(rows[4][10]), 100)
+        # Draft exports do not change the date range
+        self.assertFalse(self.daterange.date_last_print)
+
+    def test_export_xlsx(self):
+        wizard = self._get_wizard('xlsx')
+        wizard.export_giornale()
+        with zipfile.ZipFile(io.BytesIO(self._get_export_content())) as xlsx:
+            sheet = xlsx.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            names = xlsx.namelist()
+        # User text is written as is: no formulas and no links
+        self.assertNotIn('<f>', sheet)
+        self.assertNotIn('<hyperlink', sheet)
+        self.assertFalse([
+            name for name in names if name.startswith('xl/worksheets/_rels')])
+        self.assertIn('=1+1', sheet)
+        self.assertIn('@SUM(1,1)', sheet)
+        self.assertIn('http://www.example.com', sheet)
+
+    def test_export_xlsx_many_rows(self):
+        """Rows exceeding the worksheet limit go in a new worksheet"""
+        wizard = self._get_wizard('xlsx')
+        with mock.patch(
+            'odoo.addons.l10n_it_central_journal.wizard.print_giornale.'
+            'XLSX_MAX_ROWS', 3,
+        ):
+            wizard.export_giornale()
+        with zipfile.ZipFile(io.BytesIO(self._get_export_content())) as xlsx:
+            first_sheet = xlsx.read(
+                'xl/worksheets/sheet1.xml').decode('utf-8')
+            second_sheet = xlsx.read(
+                'xl/worksheets/sheet2.xml').decode('utf-8')
+            self.assertNotIn('xl/worksheets/sheet3.xml', xlsx.namelist())
+        # Header, initial balance and first move line
+        self.assertIn('Progressive credit', first_sheet)
+        self.assertIn('=1+1', first_sheet)
+        # Header, second move line and final balance
+        self.assertIn('Progressive credit', second_sheet)
+        self.assertIn('@SUM(1,1)', second_sheet)
+        self.assertIn('Final Balance', second_sheet)
+
+    def test_export_final(self):
+        wizard = self._get_wizard('csv')
+        wizard.export_giornale_final()
+        self.assertEqual(
+            self.daterange.date_last_print, self.daterange.date_end)
+        self.assertEqual(self.daterange.progressive_line_number, 2)
+        self.assertEqual(self.daterange.progressive_debit, 100)
+        self.assertEqual(self.daterange.progressive_credit, 100)
+        self.assertEqual(
+            self.env.user.company_id.period_lock_date,
+            self.daterange.date_end)
+
+        wizard = self._get_wizard('csv')
+        wizard.date_move_line_from = self.daterange.date_start
+        with self.assertRaises(UserError):
+            wizard.export_giornale_final()
@@ -1,10 +1,32 @@
 # Copyright 2018 Gianmarco Conte (gconte@dinamicheaziendali.it)
 
+import csv
+import io
+import logging
+import tempfile
+from contextlib import closing
 from odoo import models, fields, api, _
 from odoo.exceptions import Warning as UserError
 from datetime import timedelta
 from odoo.tools.misc import flatten
 
+_logger = logging.getLogger(__name__)
+
+try:
+    import xlsxwriter
+except (ImportError, IOError) as err:
+    _logger.debug(err)
+
+# Move lines fetched at a time by the server side cursor of exports
+EXPORT_FETCH_SIZE = 2000
+# Rows of an XLSX worksheet, exports continue in a new worksheet
+XLSX_MAX_ROWS = 1048576
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.'
+            'spreadsheetml.sheet',
+}
+
 
 class WizardGiornale(models.TransientModel):
     @api.model
@@ -52,6 +74,10 @@ class WizardGiornale(models.TransientModel):
     year_footer = fields.Char(string='Year for Footer',
                               help="Value printed near number "
                                    "of page in the footer")
+    export_format = fields.Selection([
+        ('csv', 'CSV'),
+        ('xlsx', 'XLSX'),
+    ], default='csv', required=True)
 
     @api.onchange('date_move_line_from_view')
     def get_year_footer(self):
@@ -85,33 +111,209 @@ class WizardGiornale(models.TransientModel):
             if self.last_def_date_print == self.daterange.date_end:
                 self.date_move_line_from_view = self.last_def_date_print
 
-    def get_line_ids(self):
+    def _get_line_query(self, select, joins=''):
+        """SQL query, with its parameters, of the move lines
+        to be printed, selecting `select`"""
         wizard = self
         if wizard.target_move == 'all':
             target_type = ['posted', 'draft']
         else:
             target_type = [wizard.target_move]
         sql = """
-            SELECT aml.id FROM account_move_line aml
+            SELECT {select} FROM account_move_line aml
             LEFT JOIN account_move am ON (am.id = aml.move_id)
+            {joins}
             WHERE
             aml.date >= %(date_from)s
             AND aml.date <= %(date_to)s
             AND am.state in %(target_type)s
             AND aml.journal_id in %(journal_ids)s
-            ORDER BY am.date, am.name
-        """
+            ORDER BY am.date, am.name, aml.id
+        """.format(select=select, joins=joins)
         params = {
             'date_from': wizard.date_move_line_from,
             'date_to': wizard.date_move_line_to,
             'target_type': tuple(target_type),
             'journal_ids': tuple(self.journal_ids.ids)
             }
+        return sql, params
+
+    def get_line_ids(self):
+        sql, params = self._get_line_query('aml.id')
         self.env.cr.execute(sql, params)
         res = self.env.cr.fetchall()
         move_line_ids = flatten(res)
         return move_line_ids
 
+    def _iter_export_rows(self, progressives):
+        """Rows of the journal as printed in the report, including
+        progressive row numbers and totals.
+        Move lines are read through a server side cursor,
+        so that they are never all loaded in memory.
+
+        :param progressives: dictionary updated with the row number,
+            debit and credit reached by the last yielded row
+        """
+        self.ensure_one()
+        currency = self.company_id.currency_id or \
+            self.env.user.company_id.currency_id
+        counter = self.start_row
+        tot_debit = self.progressive_debit2
+        tot_credit = self.progressive_credit
+        progressives.update(
+            row=counter, debit=tot_debit, credit=tot_credit, lines=0)
+        yield [
+            _('Row'), _('Date'), _('Ref.'), _('Account move'),
+            _('Account code'), _('Account name'), _('Name'),
+            _('Debit'), _('Credit'),
+            _('Progressive debit'), _('Progressive credit'),
+        ]
+        yield [
+            '', '', '', '', '', '', _('Initial Balance'),
+            tot_debit, tot_credit, tot_debit, tot_credit,
+        ]
+        sql, params = self._get_line_query(
+            """aml.date, aml.ref, am.name, aa.code, aa.name, aat.type,
+            rp.name, aml.name, aml.debit, aml.credit""",
+            joins="""
+            LEFT JOIN account_account aa ON (aa.id = aml.account_id)
+            LEFT JOIN account_account_type aat
+                ON (aat.id = aa.user_type_id)
+            LEFT JOIN res_partner rp ON (rp.id = aml.partner_id)""")
+        # Named cursors are server side cursors in the same transaction
+        with closing(self.env.cr._cnx.cursor(
+                'central_journal_export_%s' % self.id)) as cursor:
+            cursor.itersize = EXPORT_FETCH_SIZE
+            cursor.execute(sql, params)
+            for (date, ref, move_name, account_code, account_name,
+                    account_type, partner_name, name, debit,
+                    credit) in cursor:
+                counter += 1
+                tot_debit = currency.round(tot_debit + debit)
+                tot_credit = currency.round(tot_credit + credit)
+                if account_type in ('receivable', 'payable'):
+                    name = partner_name
+                progressives.update(
+                    row=counter, debit=tot_debit, credit=tot_credit,
+                    lines=progressives['lines'] + 1)
+                yield [
+                    counter, date, ref or '', move_name, account_code,
+                    account_name, name or '', debit, credit,
+                    tot_debit, tot_credit,
+                ]
+        yield [
+            '', '', '', '', '', '', _('Final Balance'),
+            tot_debit, tot_credit, tot_debit, tot_credit,
+        ]
+
+    def _write_export_csv(self, file_obj, progressives):
+        text_file = io.TextIOWrapper(file_obj, encoding='utf-8', newline='')
+        writer = csv.writer(text_file)
+        for row in self._iter_export_rows(progressives):
+            writer.writerow([
+                fields.Date.to_string(value) if hasattr(value, 'isoformat')
+                else value
+                for value in row])
+        text_file.flush()
+        # Leave `file_obj` open
+        text_file.detach()
+
+    def _write_export_xlsx(self, file_obj, progressives):
+        # In constant memory mode each row is flushed once written.
+        # Texts are written as they are, never as formulas or links
+        workbook = xlsxwriter.Workbook(file_obj, {
+            'constant_memory': True,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        bold = workbook.add_format({'bold': True})
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        rows = self._iter_export_rows(progressives)
+        header = next(rows)
+        sheet_name = _('General Journal')
+        sheet_count = 0
+        row_index = XLSX_MAX_ROWS
+        for row in rows:
+            if row_index >= XLSX_MAX_ROWS:
+                # Each worksheet starts with the header
+                sheet_count += 1
+                sheet = workbook.add_worksheet(
+                    sheet_name if sheet_count == 1
+                    else '%s (%s)' % (sheet_name, sheet_count))
+                for col_index, value in enumerate(header):
+                    sheet.write_string(0, col_index, value, bold)
+                row_index = 1
+            for col_index, value in enumerate(row):
+                if hasattr(value, 'isoformat'):
+                    sheet.write_datetime(
+                        row_index, col_index, value, date_format)
+                elif isinstance(value, (int, float)):
+                    sheet.write_number(row_index, col_index, value)
+                else:
+                    sheet.write_string(row_index, col_index, value)
+            row_index += 1
+        workbook.close()
+
+    def _export_giornale(self, final=False):
+        """Export the journal to a CSV or XLSX attachment,
+        saving the print info in the date range for final exports.
+
+        :return: action downloading the attachment
+        """
+        self.ensure_one()
+        progressives = {}
+        attachment_model = self.env['ir.attachment']
+        with tempfile.TemporaryFile() as file_obj:
+            if self.export_format == 'xlsx':
+                self._write_export_xlsx(file_obj, progressives)
+            else:
+                self._write_export_csv(file_obj, progressives)
+            if not progressives['lines']:
+                raise UserError(
+                    _('No documents found in the current selection'))
+            file_obj.seek(0)
+            file_vals = attachment_model._prepare_raw_file_vals(file_obj)
+        filename = 'giornale_%s_%s.%s' % (
+            fields.Date.to_string(self.date_move_line_from),
+            fields.Date.to_string(self.date_move_line_to),
+            self.export_format)
+        attachment = attachment_model.create(dict(
+            file_vals,
+            name=filename,
+            datas_fname=filename,
+            mimetype=EXPORT_MIMETYPES[self.export_format],
+            res_model='date.range',
+            res_id=self.daterange.id,
+        ))
+        attachment._write_raw_file_vals([file_vals])
+        if final:
+            self.env[
+                'report.l10n_it_central_journal.report_giornale'
+            ]._save_print_info(
+                self.daterange.id, 'def', self.date_move_line_to,
+                progressives['row'], progressives['debit'],
+                progressives['credit'])
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % attachment.id,
+            'target': 'self',
+        }
+
+    def export_giornale(self):
+        return self._export_giornale()
+
+    def export_giornale_final(self):
+        wizard = self
+        if wizard.last_def_date_print and \
+                wizard.date_move_line_from <= wizard.last_def_date_print:
+            raise UserError(_('Date already printed'))
+        res = self._export_giornale(final=True)
+        company = self.company_id
+        if not company.period_lock_date or company.period_lock_date \
+                < self.date_move_line_to:
+            company.sudo().period_lock_date = self.date_move_line_to
+        return res
+
     def _prepare_datas_form(self):
         wizard = self
         datas_form = {}
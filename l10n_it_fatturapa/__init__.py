@@ -4,3 +4,4 @@
 from . import models
 from . import bindings
 from . import controllers
+from . import tools
@@ -1,4 +1,10 @@
+import base64
 import logging
+import re
+import threading
+from copy import deepcopy
+from decimal import Decimal
+from io import BytesIO
 from odoo.modules.module import get_module_resource
 from lxml import etree
 
@@ -23,6 +29,15 @@ _CreateFromDocument = CreateFromDocument  # noqa: F405
 date_types = {}
 datetime_types = {}
 
+# Elements whose text is stripped
+STRIPPED_ELEMENTS = ('PECDestinatario', 'Email')
+
+# Indexes of date_types and datetime_types, see index_types
+date_elements = {}
+datetime_elements = {}
+# Tags of elements that may need a fix
+doctor_tags = ()
+
 
 def get_parent_element(e):
     for ancestor in e.iterancestors():
@@ -75,6 +90,81 @@ def collect_types():
     # complexType containing xs:dateTime children
     collect_elements_by_type_query(datetime_types, "//*[@type='xs:dateTime']")
 
+    global doctor_tags
+    date_elements.update(index_types(date_types))
+    datetime_elements.update(index_types(datetime_types))
+    doctor_tags = tuple(
+        set(date_elements) | set(datetime_elements) | set(STRIPPED_ELEMENTS))
+
+
+def index_types(types):
+    """Index `//Parent/Child` paths of `types` by tag name:
+    {Child: {Parent: mandatory}}"""
+    index = {}
+    for path, mandatory in types.items():
+        parent, tag = path[2:].split('/')
+        index.setdefault(tag, {})[parent] = mandatory
+    return index
+
+
+def fix_date_element(element, tree, problems):
+    # remove timezone from type `xs:date` if any or
+    # pyxb will fail to compare with
+    result = pyxb.binding.datatypes.date(element.text.strip())
+    if result.tzinfo is not None:
+        result = result.replace(tzinfo=None)
+        element.text = result.XsdLiteral(result)
+        msg = 'removed timezone information from date only element ' \
+              '%s: %s' % (tree.getpath(element), element.text)
+        problems.append(msg)
+        _logger.warn(msg)
+
+
+def fix_datetime_element(element, mandatory, tree, problems):
+    """Remove bogus dates accepted by ADE but not by python.
+
+    :return: True if element has to be removed"""
+    try:
+        pyxb.binding.datatypes.dateTime(element.text)
+    except OverflowError as e:
+        element_path = tree.getpath(element)
+        if mandatory:
+            _logger.error('element %s is invalid but is mandatory: '
+                          '%s' % (element_path, element.text))
+        else:
+            msg = 'removed invalid dateTime element %s: %s (%s)' % (
+                element_path, element.text, e)
+            problems.append(msg)
+            _logger.warn(msg)
+            return True
+    return False
+
+
+def fix_document(root):
+    """Apply the XML doctor fixes walking the tree once.
+
+    :return: list of the problems found"""
+    problems = []
+    tree = etree.ElementTree(root)
+    to_remove = []
+    for element in root.iter(*doctor_tags):
+        tag = element.tag
+        if tag in STRIPPED_ELEMENTS:
+            # fix trailing spaces in <PECDestinatario/> and <Email/>
+            element.text = element.text.strip()
+            continue
+        parent = element.getparent()
+        parent_tag = parent.tag if parent is not None else None
+        if parent_tag in date_elements.get(tag, ()):
+            fix_date_element(element, tree, problems)
+        mandatory = datetime_elements.get(tag, {}).get(parent_tag)
+        if mandatory is not None and fix_datetime_element(
+                element, mandatory, tree, problems):
+            to_remove.append(element)
+    for element in to_remove:
+        element.getparent().remove(element)
+    return problems
+
 
 def CreateFromDocument(xml_string):
     try:
@@ -83,49 +173,318 @@ def CreateFromDocument(xml_string):
         _logger.warn('lxml was unable to parse xml: %s' % e)
         return _CreateFromDocument(xml_string)
 
-    problems = []
-    tree = etree.ElementTree(root)
+    problems = fix_document(root)
 
-    # remove timezone from type `xs:date` if any or
-    # pyxb will fail to compare with
-    for path, mandatory in date_types.items():
-        for element in root.xpath(path):
-            result = pyxb.binding.datatypes.date(element.text.strip())
-            if result.tzinfo is not None:
-                result = result.replace(tzinfo=None)
-                element.text = result.XsdLiteral(result)
-                msg = 'removed timezone information from date only element ' \
-                      '%s: %s' % (tree.getpath(element), element.text)
-                problems.append(msg)
-                _logger.warn(msg)
-
-    # remove bogus dates accepted by ADE but not by python
-    for path, mandatory in datetime_types.items():
-        for element in root.xpath(path):
-            try:
-                pyxb.binding.datatypes.dateTime(element.text)
-            except OverflowError as e:
-                element_path = tree.getpath(element)
-                if mandatory:
-                    _logger.error('element %s is invalid but is mandatory: '
-                                  '%s' % (element_path, element.text))
-                else:
-                    element.getparent().remove(element)
-                    msg = 'removed invalid dateTime element %s: %s (%s)' % (
-                        element_path, element.text, e)
-                    problems.append(msg)
-                    _logger.warn(msg)
+    fatturapa = _CreateFromDocument(etree.tostring(root))
+    setattr(fatturapa, '_xmldoctor', problems)
+    return fatturapa
 
-    # fix trailing spaces in <PECDestinatario/> and <Email/>
-    for pec in root.xpath("//PECDestinatario"):
-        pec.text = pec.text.strip()
 
-    for email in root.xpath("//Email"):
-        email.text = email.text.strip()
+# Lightweight objects
+# -------------------
+# Instead of building pyxb instances, the XML tree parsed by lxml can be
+# mapped to plain python objects having the same attributes of pyxb ones:
+# repeatable elements are lists, missing optional elements are None
+# and simple values are converted according to their XSD type.
+# Document is not validated against the XSD: pyxb is still used
+# when strict validation is needed.
+
+XSD_WHITESPACE = {
+    'xs:string': 'preserve',
+    'xs:normalizedString': 'replace',
+}
+
+XSD_CONVERTERS = {
+    'xs:string': str,
+    'xs:normalizedString': str,
+    'xs:decimal': Decimal,
+    'xs:integer': int,
+    'xs:date': lambda text: pyxb.binding.datatypes.date(text),
+    'xs:dateTime': lambda text: pyxb.binding.datatypes.dateTime(text),
+    'xs:base64Binary': base64.b64decode,
+}
+
+_re_whitespace = re.compile(r'[\t\n\r]')
+
+simple_types = {}
+resolved_simple_types = {}
+complex_types = {}
+
+
+class UnknownElementError(ValueError):
+    pass
+
+
+class FatturaPAElement(object):
+    """Lightweight counterpart of a pyxb complex type instance"""
+    _children = {}
+    _attributes = {}
+    _plural = ()
+
+    def __init__(self):
+        for name in self._plural:
+            setattr(self, name, [])
+
+
+def get_simple_type(type_name):
+    """Return the XSD builtin type and the whitespace handling
+    of the simple type `type_name`"""
+    if type_name not in resolved_simple_types:
+        base = type_name
+        whitespace = None
+        while not base.startswith('xs:'):
+            base, type_whitespace = simple_types[base]
+            whitespace = whitespace or type_whitespace
+        resolved_simple_types[type_name] = (
+            base, whitespace or XSD_WHITESPACE.get(base, 'collapse'))
+    return resolved_simple_types[type_name]
+
+
+def collect_complex_types():
+    for element_type in _root.iterfind('{*}simpleType'):
+        restriction = element_type.find('{*}restriction')
+        whitespace = restriction.find('{*}whiteSpace')
+        simple_types[element_type.attrib['name']] = (
+            restriction.attrib['base'],
+            whitespace.attrib['value'] if whitespace is not None else None,
+        )
+
+    for element_type in _root.iterfind('{*}complexType'):
+        type_name = element_type.attrib['name']
+        children = {}
+        class_attributes = {}
+        for element in element_type.iter('{*}element'):
+            if 'name' not in element.attrib:
+                # ds:Signature, not mapped
+                class_attributes[element.attrib['ref'].split(':')[-1]] = None
+                continue
+            name = element.attrib['name']
+            plural = element.attrib.get('maxOccurs', '1') != '1'
+            mandatory = element.attrib.get('minOccurs') != '0'
+            children[name] = (
+                element.attrib['type'], plural, mandatory,
+                element.attrib.get('default'))
+            if not plural:
+                class_attributes[name] = None
+        attributes = {}
+        for attribute in element_type.iter('{*}attribute'):
+            attributes[attribute.attrib['name']] = attribute.attrib['type']
+            class_attributes[attribute.attrib['name']] = None
+        class_attributes.update({
+            '_children': children,
+            '_attributes': attributes,
+            '_plural': tuple(
+                name for name, child in children.items() if child[1]),
+        })
+        complex_types[type_name] = type(
+            str(type_name), (FatturaPAElement, ), class_attributes)
+
+
+def convert_simple_value(text, type_name):
+    base, whitespace = get_simple_type(type_name)
+    text = text or ''
+    if whitespace == 'replace':
+        text = _re_whitespace.sub(' ', text)
+    elif whitespace == 'collapse':
+        text = ' '.join(text.split())
+    return XSD_CONVERTERS[base](text)
+
+
+def map_simple_element(
+        element, type_name, mandatory, default, tree, problems):
+    """Convert the value of `element`, applying the same fixes of
+    CreateFromDocument.
+
+    :return: a tuple (keep, value), keep is False when element has to be
+    ignored"""
+    text = element.text
+    tag = element.tag
+    if not text and default is not None:
+        text = default
+    if tag in STRIPPED_ELEMENTS and text:
+        text = text.strip()
+    base = get_simple_type(type_name)[0]
+    if base == 'xs:date':
+        result = convert_simple_value(text, type_name)
+        if result.tzinfo is not None:
+            result = result.replace(tzinfo=None)
+            msg = 'removed timezone information from date only element ' \
+                  '%s: %s' % (tree.getpath(element), result.XsdLiteral(result))
+            problems.append(msg)
+            _logger.warn(msg)
+        return True, result
+    if base == 'xs:dateTime':
+        try:
+            return True, convert_simple_value(text, type_name)
+        except OverflowError as e:
+            element_path = tree.getpath(element)
+            if mandatory:
+                _logger.error('element %s is invalid but is mandatory: '
+                              '%s' % (element_path, text))
+                raise
+            msg = 'removed invalid dateTime element %s: %s (%s)' % (
+                element_path, text, e)
+            problems.append(msg)
+            _logger.warn(msg)
+            return False, None
+    return True, convert_simple_value(text, type_name)
+
+
+def map_element(element, type_name, tree, problems):
+    element_class = complex_types[type_name]
+    instance = element_class()
+    for name, value in element.attrib.items():
+        attribute_type = element_class._attributes.get(name)
+        if attribute_type:
+            setattr(
+                instance, name, convert_simple_value(value, attribute_type))
+    for child in element:
+        tag = child.tag
+        if not isinstance(tag, str):
+            # comments and processing instructions
+            continue
+        if tag.startswith('{'):
+            # ds:Signature
+            continue
+        child_info = element_class._children.get(tag)
+        if child_info is None:
+            raise UnknownElementError(
+                'Unknown element %s' % tree.getpath(child))
+        child_type, plural, mandatory, default = child_info
+        if child_type in complex_types:
+            value = map_element(child, child_type, tree, problems)
+        else:
+            keep, value = map_simple_element(
+                child, child_type, mandatory, default, tree, problems)
+            if not keep:
+                continue
+        if plural:
+            getattr(instance, tag).append(value)
+        else:
+            setattr(instance, tag, value)
+    return instance
+
+
+def CreateLightweightFromDocument(xml_string):
+    """Same as CreateFromDocument, but returns lightweight objects
+    built in a single pass over the XML tree.
+    Falls back to CreateFromDocument if the document can't be mapped."""
+    try:
+        root = etree.fromstring(xml_string)
+    except Exception as e:
+        _logger.warn('lxml was unable to parse xml: %s' % e)
+        return _CreateFromDocument(xml_string)
 
-    fatturapa = _CreateFromDocument(etree.tostring(root))
+    if etree.QName(root).localname != 'FatturaElettronica':
+        return CreateFromDocument(xml_string)
+
+    problems = []
+    try:
+        fatturapa = map_element(
+            root, 'FatturaElettronicaType', etree.ElementTree(root),
+            problems)
+    except (ValueError, ArithmeticError, pyxb.PyXBException) as e:
+        _logger.info(
+            'Unable to map xml to lightweight objects, '
+            'falling back to pyxb: %s' % e)
+        return CreateFromDocument(xml_string)
     setattr(fatturapa, '_xmldoctor', problems)
     return fatturapa
 
 
+# lxml writer
+# -----------
+# Instances, both pyxb and lightweight ones, can be written with lxml
+# following the XSD order of their elements, without building a DOM.
+# Written documents are validated against the XSD, loaded only once
+# for each thread.
+
+NS_FATTURAPA = 'http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2'
+NS_XMLDSIG = 'http://www.w3.org/2000/09/xmldsig#'
+NS_XSD = 'http://www.w3.org/2001/XMLSchema'
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8"?>'
+
+_schema_local = threading.local()
+
+
+def get_xml_schema():
+    """Return the FatturaPA schema.
+    The signature is not validated, to avoid downloading its schema."""
+    schema = getattr(_schema_local, 'schema', None)
+    if schema is None:
+        root = deepcopy(_root.getroot())
+        for element in root.iterfind('{%s}import' % NS_XSD):
+            root.remove(element)
+        for element in root.iter('{%s}element' % NS_XSD):
+            if element.get('ref') == 'ds:Signature':
+                element.tag = '{%s}any' % NS_XSD
+                del element.attrib['ref']
+                element.set('namespace', NS_XMLDSIG)
+                element.set('processContents', 'skip')
+        schema = _schema_local.schema = etree.XMLSchema(root)
+    return schema
+
+
+def simple_value_text(value):
+    if isinstance(value, pyxb.binding.datatypes.decimal) and \
+            hasattr(value, '_CF_pattern'):
+        # Same as FatturapaBDS: PyXB changes the text representation
+        # of decimals so that it breaks pattern matching
+        return str(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    xsd_literal = getattr(value, 'xsdLiteral', None)
+    if xsd_literal is not None:
+        return xsd_literal()
+    return str(value)
+
+
+def write_element(xf, tag, instance, type_name, attrib=None, nsmap=None):
+    element_class = complex_types[type_name]
+    attrib = dict(attrib or {})
+    for name in element_class._attributes:
+        value = getattr(instance, name, None)
+        if value is not None:
+            attrib[name] = simple_value_text(value)
+    with xf.element(tag, attrib, nsmap=nsmap):
+        for name, child_info in element_class._children.items():
+            child_type, plural, mandatory, default = child_info
+            values = getattr(instance, name, None)
+            if values is None:
+                continue
+            if not plural:
+                values = [values]
+            for value in values:
+                if value is None:
+                    continue
+                if child_type in complex_types:
+                    write_element(xf, name, value, child_type)
+                else:
+                    with xf.element(name):
+                        xf.write(simple_value_text(value))
+
+
+def ToXMLWithLxml(fatturapa, validate=True):
+    """Write instance `fatturapa` of FatturaElettronicaType.
+    Once parsed, the XML is the same written by
+    `fatturapa.toxml(encoding="UTF-8")` with FatturapaBDS;
+    the order of the root attributes and empty elements can differ.
+
+    :raise etree.DocumentInvalid: if `validate`
+        and the document is not valid
+    """
+    buf = BytesIO()
+    buf.write(XML_DECLARATION)
+    with etree.xmlfile(buf, encoding='UTF-8') as xf:
+        write_element(
+            xf, '{%s}FatturaElettronica' % NS_FATTURAPA, fatturapa,
+            'FatturaElettronicaType', nsmap={'ns1': NS_FATTURAPA})
+    xml_string = buf.getvalue()
+    if validate:
+        get_xml_schema().assertValid(etree.fromstring(xml_string))
+    return xml_string
+
+
 collect_types()
+collect_complex_types()
@@ -8,9 +8,7 @@ class FatturaElettronicaController(Controller):
     ], type='http', auth='user', website=True)
     def pdf_preview(self, attachment_id, **data):
         attach = request.env['ir.attachment'].browse(int(attachment_id))
-        html = attach.get_fattura_elettronica_preview()
-        pdf = request.env['ir.actions.report']._run_wkhtmltopdf(
-            [html])
+        pdf = attach.get_fattura_elettronica_preview_pdf()
 
         pdfhttpheaders = [
             ('Content-Type', 'application/pdf'), ('Content-Length', len(pdf)
@@ -4,3 +4,4 @@ from . import account
 from . import company
 from . import partner
 from . import ir_attachment
+from . import e_invoice_file
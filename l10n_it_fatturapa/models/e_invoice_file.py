@@ -0,0 +1,96 @@
+import logging
+import re
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Extensions of SdI files: a signed file can be named IT01234567890_00001.xml
+# or IT01234567890_00001.xml.p7m, possibly in upper case
+re_file_name_extensions = re.compile(r'(\.(xml|p7m))+$', re.IGNORECASE)
+
+
+def get_file_name_key(file_name):
+    """Key identifying an e-invoice file, regardless of its signature
+    and of the case of its extensions"""
+    if not file_name:
+        return False
+    return re_file_name_extensions.sub('', file_name.strip())
+
+
+def migrate_file_name_key(cr, table, file_name_sql):
+    """Fill the file name key of the existing files in `table`,
+    before the update of the module adds its unique constraint.
+    Only the most recent of the files sharing a key
+    (e.g. X.xml and X.xml.p7m) keeps it, the others are logged.
+
+    :param file_name_sql: SQL expression of the file name,
+        `ia` being the ir_attachment of the file
+    """
+    cr.execute("""
+        ALTER TABLE {table} ADD COLUMN IF NOT EXISTS file_name_key varchar
+    """.format(table=table))
+    # Same as get_file_name_key
+    query = """
+        UPDATE {table} f
+        SET file_name_key = NULLIF(regexp_replace(
+            regexp_replace({file_name}, %s, '', 'g'), %s, '', 'i'), '')
+        FROM ir_attachment ia
+        WHERE ia.id = f.ir_attachment_id
+    """.format(table=table, file_name=file_name_sql)
+    cr.execute(query, (r'^\s+|\s+$', r'(\.(xml|p7m))+$'))
+    cr.execute("""
+        SELECT f.file_name_key,
+            array_agg(f.id ORDER BY f.id DESC),
+            array_agg(ia.name ORDER BY f.id DESC)
+        FROM {table} f
+        JOIN ir_attachment ia ON ia.id = f.ir_attachment_id
+        WHERE f.file_name_key IS NOT NULL
+        GROUP BY f.file_name_key
+        HAVING COUNT(*) > 1
+    """.format(table=table))
+    duplicate_ids = []
+    for key, ids, names in cr.fetchall():
+        _logger.warning(
+            "E-invoice files %s (IDs %s of %s) have the same name %s: "
+            "only %s (ID %s) will be found by file name",
+            names, ids, table, key, names[0], ids[0])
+        duplicate_ids.extend(ids[1:])
+    if duplicate_ids:
+        cr.execute("""
+            UPDATE {table} SET file_name_key = NULL WHERE id IN %s
+        """.format(table=table), (tuple(duplicate_ids), ))
+
+
+class EInvoiceFileMixin(models.AbstractModel):
+    """E-invoice files, looked up by their file name.
+
+    Inheriting models `_inherits` ir.attachment and must declare
+    the dependencies of `_compute_file_name_key`."""
+    _name = 'fatturapa.file.mixin'
+    _description = "E-invoice file mixin"
+
+    file_name_key = fields.Char(
+        "File name key", compute='_compute_file_name_key', store=True,
+        index=True, readonly=True, copy=False,
+        help="File name without extensions, used to match the file "
+             "with the notifications of the Exchange System")
+
+    @api.multi
+    def _compute_file_name_key(self):
+        for att in self:
+            att.file_name_key = get_file_name_key(
+                att.datas_fname or att.name)
+
+    @api.model
+    def get_by_file_name(self, file_names):
+        """Files named as `file_names`, with or without signature.
+
+        :param file_names: a file name or a list of file names
+        """
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        keys = [key for key in map(get_file_name_key, file_names) if key]
+        if not keys:
+            return self.browse()
+        return self.search([('file_name_key', 'in', keys)])
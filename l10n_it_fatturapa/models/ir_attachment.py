@@ -3,11 +3,13 @@ import re
 import base64
 import binascii
 import logging
+import threading
 from io import BytesIO
 from odoo import models, api, fields
 from odoo.modules import get_module_resource
 from odoo.exceptions import UserError
 from odoo.tools.translate import _
+from odoo.addons.l10n_it_fatturapa.tools.lru_cache import SizedLRUCache
 
 _logger = logging.getLogger(__name__)
 
@@ -20,6 +22,16 @@ except (ImportError, IOError) as err:
 re_base64 = re.compile(
     br'^([A-Za-z0-9+/]{4})*([A-Za-z0-9+/]{3}=|[A-Za-z0-9+/]{2}==)?$')
 
+# Bytes needed to detect the envelope of a file
+XML_SNIFF_SIZE = 512
+re_base64_head = re.compile(br'^[A-Za-z0-9+/=\r\n]+$')
+UTF8_BOM = b'\xef\xbb\xbf'
+# Default maximum total size, in bytes, of the cached previews
+DEFAULT_PREVIEW_CACHE_SIZE = 32 * 1024 * 1024
+# XSLT objects must not be shared between threads
+_preview_xslt = threading.local()
+preview_cache = SizedLRUCache(DEFAULT_PREVIEW_CACHE_SIZE)
+
 
 def is_base64(s):
     s = s or b""
@@ -39,24 +51,31 @@ class Attachment(models.Model):
         for att in self:
             att.ftpa_preview_link = '/fatturapa/preview/%s' % att.id
 
-    def remove_xades_sign(self, xml):
+    def _parse_xml_recovering(self, xml):
         # Recovering parser is needed for files where strings like
         # xmlns:ds="http://www.w3.org/2000/09/xmldsig#&quot;"
         # are present: even if lxml raises
         # {XMLSyntaxError}xmlns:ds:
         # 'http://www.w3.org/2000/09/xmldsig#"' is not a valid URI
-        # such files are accepted by SDI
-        recovering_parser = ET.XMLParser(recover=True)
-        root = ET.XML(xml, parser=recovering_parser)
+        # such files are accepted by SDI.
+        # huge_tree is needed for big attachments (Allegati)
+        recovering_parser = ET.XMLParser(recover=True, huge_tree=True)
+        return ET.XML(xml, parser=recovering_parser)
+
+    @staticmethod
+    def _remove_signature_element(root):
         for elem in root.iter('*'):
             if elem.tag.find('Signature') > -1:
                 elem.getparent().remove(elem)
                 break
+
+    def remove_xades_sign(self, xml):
+        root = self._parse_xml_recovering(xml)
+        self._remove_signature_element(root)
         return ET.tostring(root)
 
     def strip_xml_content(self, xml):
-        recovering_parser = ET.XMLParser(recover=True)
-        root = ET.XML(xml, parser=recovering_parser)
+        root = self._parse_xml_recovering(xml)
         return ET.tostring(root)
 
     @staticmethod
@@ -65,13 +84,25 @@ class Attachment(models.Model):
         return info['content']['encap_content_info']['content'].native
 
     def cleanup_xml(self, xml_string):
-        xml_string = self.remove_xades_sign(xml_string)
-        xml_string = self.strip_xml_content(xml_string)
-        return xml_string
+        # A single parse both removes XAdES signature and strips content
+        root = self._parse_xml_recovering(xml_string)
+        self._remove_signature_element(root)
+        return ET.tostring(root)
 
-    def get_xml_string(self):
+    def _get_raw_datas(self):
+        """Content of the attachment, read directly from the filestore
+        when possible, avoiding base64 encoding and decoding"""
+        self.ensure_one()
+        if self.store_fname:
+            try:
+                with open(self._full_path(self.store_fname), 'rb') as f:
+                    return f.read()
+            except (IOError, OSError):
+                _logger.info(
+                    "Unable to read %s from filestore", self.store_fname,
+                    exc_info=True)
         try:
-            data = base64.b64decode(self.datas)
+            return base64.b64decode(self.datas)
         except binascii.Error as e:
             raise UserError(
                 _(
@@ -79,7 +110,40 @@ class Attachment(models.Model):
                 ) % e.args
             )
 
-        if is_base64(data):
+    def _open_raw_datas(self):
+        """Binary file object on the content of the attachment,
+        opened directly from the filestore when possible"""
+        self.ensure_one()
+        if self.store_fname:
+            try:
+                return open(self._full_path(self.store_fname), 'rb')
+            except (IOError, OSError):
+                _logger.info(
+                    "Unable to read %s from filestore", self.store_fname,
+                    exc_info=True)
+        return BytesIO(self._get_raw_datas())
+
+    @staticmethod
+    def _sniff_envelope(data):
+        """Detect the envelope of `data` looking at its first bytes.
+
+        :return: 'xml', 'base64' or 'cades' (anything else, supposed
+        to be DER encoded PKCS#7)
+        """
+        head = data[:XML_SNIFF_SIZE].lstrip()
+        if head.startswith(UTF8_BOM):
+            head = head[len(UTF8_BOM):].lstrip()
+        if head.startswith(b'<'):
+            return 'xml'
+        if re_base64_head.match(head):
+            return 'base64'
+        return 'cades'
+
+    def get_xml_string(self):
+        data = self._get_raw_datas()
+
+        envelope = self._sniff_envelope(data)
+        if envelope == 'base64':
             try:
                 data = base64.b64decode(data)
             except binascii.Error as e:
@@ -88,19 +152,21 @@ class Attachment(models.Model):
                         'Base64 encoded file %s.'
                     ) % e.args
                 )
+            envelope = self._sniff_envelope(data)
 
         # Amazon sends xml files without <?xml declaration,
-        # so they cannot be easily detected using a pattern.
-        # We first try to parse as asn1, if it fails we assume xml
+        # so they are detected by their first tag.
+        # Anything else is parsed as asn1, if it fails we assume xml
 
         # asn1crypto parser will raise ValueError
         # if the asn1 cannot be parsed
         # KeyError is raised if one of the needed key is not
         # in the asn1 structure (info->content->encap_content_info->content)
-        try:
-            data = self.extract_cades(data)
-        except (ValueError, KeyError):
-            pass
+        if envelope != 'xml':
+            try:
+                data = self.extract_cades(data)
+            except (ValueError, KeyError):
+                pass
 
         try:
             return self.cleanup_xml(data)
@@ -113,15 +179,59 @@ class Attachment(models.Model):
                 ) % e.args
             )
 
-    def get_fattura_elettronica_preview(self):
-        xsl_path = get_module_resource(
-            'l10n_it_fatturapa', 'data',
-            self.env.user.company_id.fatturapa_preview_style)
-        xslt = ET.parse(xsl_path)
+    @api.model
+    def _get_preview_xslt(self, style):
+        """Compiled XSLT of the preview style sheet `style`.
+        Style sheets are compiled once per thread."""
+        transforms = getattr(_preview_xslt, 'transforms', None)
+        if transforms is None:
+            transforms = _preview_xslt.transforms = {}
+        if style not in transforms:
+            xsl_path = get_module_resource('l10n_it_fatturapa', 'data', style)
+            transforms[style] = ET.XSLT(ET.parse(xsl_path))
+        return transforms[style]
+
+    @api.model
+    def _get_preview_cache(self):
+        cache_size = self.env['ir.config_parameter'].sudo().get_param(
+            'fatturapa.preview.cache.size', DEFAULT_PREVIEW_CACHE_SIZE)
+        preview_cache.resize(int(cache_size))
+        return preview_cache
+
+    def _get_cached_preview(self, kind, style, render):
+        """Rendered preview of kind `kind`, cached by file content
+        and style sheet."""
+        self.ensure_one()
+        cache = self._get_preview_cache()
+        cache_key = None
+        if self.checksum:
+            cache_key = (self.checksum, style, kind)
+            preview = cache.get(cache_key)
+            if preview is not None:
+                return preview
+        preview = render()
+        if cache_key is not None:
+            cache.put(cache_key, preview, len(preview))
+        return preview
+
+    def _render_fattura_elettronica_preview(self, style):
         xml_string = self.get_xml_string()
         xml_file = BytesIO(xml_string)
         recovering_parser = ET.XMLParser(recover=True)
         dom = ET.parse(xml_file, parser=recovering_parser)
-        transform = ET.XSLT(xslt)
+        transform = self._get_preview_xslt(style)
         newdom = transform(dom)
         return ET.tostring(newdom, pretty_print=True)
+
+    def get_fattura_elettronica_preview(self):
+        style = self.env.user.company_id.fatturapa_preview_style
+        return self._get_cached_preview(
+            'html', style,
+            lambda: self._render_fattura_elettronica_preview(style))
+
+    def get_fattura_elettronica_preview_pdf(self):
+        style = self.env.user.company_id.fatturapa_preview_style
+        return self._get_cached_preview(
+            'pdf', style,
+            lambda: self.env['ir.actions.report']._run_wkhtmltopdf(
+                [self.get_fattura_elettronica_preview()]))
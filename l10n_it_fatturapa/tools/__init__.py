@@ -0,0 +1 @@
+from . import lru_cache
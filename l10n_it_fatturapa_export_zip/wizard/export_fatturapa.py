@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
-import base64
-import io
+import shutil
+import tempfile
 import zipfile
 from datetime import datetime
 from odoo import models, api, fields, _
 from odoo.exceptions import UserError
 
+# Bytes in a megabyte, for the volume size
+MEGABYTE = 1024 * 1024
+
 
 class WizardAccountInvoiceExport(models.TransientModel):
     _name = "wizard.fatturapa.export"
@@ -19,6 +22,49 @@ class WizardAccountInvoiceExport(models.TransientModel):
 
     data = fields.Binary("File", readonly=True)
     name = fields.Char('Filename', default=_default_name, required=True)
+    volume_size = fields.Integer(
+        "Maximum ZIP size (MB)",
+        help="Files are split into several ZIP files "
+             "not bigger than this size. 0 means no limit.")
+
+    def _split_volumes(self, attachments):
+        """Group `attachments` so that the files of each group
+        do not exceed the volume size."""
+        max_size = self.volume_size * MEGABYTE
+        volumes = []
+        volume = attachments.browse()
+        volume_size = 0
+        for att in attachments:
+            if (
+                max_size and volume and
+                volume_size + att.file_size > max_size
+            ):
+                volumes.append(volume)
+                volume = attachments.browse()
+                volume_size = 0
+            volume |= att
+            volume_size += att.file_size
+        if volume:
+            volumes.append(volume)
+        return volumes
+
+    def _create_zip_attachment(self, name, attachments):
+        """Write the files of `attachments` to a temporary ZIP file,
+        reading them from the filestore, and store it in a new
+        attachment"""
+        ir_attachment = self.env['ir.attachment']
+        with tempfile.TemporaryFile() as fp:
+            with zipfile.ZipFile(fp, mode="w") as zf:
+                for att in attachments:
+                    with att.ir_attachment_id._open_raw_datas() as src, \
+                            zf.open(att.datas_fname, mode='w') as dst:
+                        shutil.copyfileobj(src, dst)
+            fp.seek(0)
+            file_vals = ir_attachment._prepare_raw_file_vals(fp)
+        attach_vals = dict(file_vals, name=name, datas_fname=name)
+        zip_att = ir_attachment.create(attach_vals)
+        zip_att._write_raw_file_vals([file_vals])
+        return zip_att
 
     @api.multi
     def export_zip(self):
@@ -30,30 +76,34 @@ class WizardAccountInvoiceExport(models.TransientModel):
                 raise UserError(_(
                     "Attachment %s already exported. Remove ZIP file first"
                 ) % att.display_name)
-            if not att.datas or not att.datas_fname:
+            if not att.datas_fname or not att.file_size:
                 raise UserError(
                     _("Attachment %s does not have XML file")
                     % att.display_name)
 
-        fp = io.BytesIO()
-        with zipfile.ZipFile(fp, mode="w") as zf:
-            for att in attachments:
-                zf.writestr(att.datas_fname, base64.b64decode(att.datas))
-        fp.seek(0)
-        data = fp.read()
-        attach_vals = {
-            'name': self.name + '.zip',
-            'datas_fname': self.name + '.zip',
-            'datas': base64.encodestring(data),
-        }
-        zip_att = self.env['ir.attachment'].create(attach_vals)
-        for att in attachments:
-            att.exported_zip = zip_att
-        return {
+        volumes = self._split_volumes(attachments)
+        zip_atts = self.env['ir.attachment'].browse()
+        for index, volume in enumerate(volumes, 1):
+            name = self.name
+            if len(volumes) > 1:
+                name = '%s_%d' % (name, index)
+            zip_att = self._create_zip_attachment(name + '.zip', volume)
+            volume.write({'exported_zip': zip_att.id})
+            zip_atts |= zip_att
+        action = {
             'view_type': 'form',
             'name': _("Export E-Invoices"),
-            'res_id': zip_att.id,
-            'view_mode': 'form',
             'res_model': 'ir.attachment',
             'type': 'ir.actions.act_window',
         }
+        if len(zip_atts) == 1:
+            action.update({
+                'res_id': zip_atts.id,
+                'view_mode': 'form',
+            })
+        else:
+            action.update({
+                'view_mode': 'tree,form',
+                'domain': [('id', 'in', zip_atts.ids)],
+            })
+        return action
@@ -6,7 +6,7 @@
 
 {
     'name': 'ITA - Fattura elettronica - Ricezione',
-    'version': '12.0.2.7.0',
+    'version': '12.0.2.10.0',
     "development_status": "Beta",
     'category': 'Localization/Italy',
     'summary': 'Ricezione fatture elettroniche',
@@ -28,6 +28,7 @@
         'views/company_view.xml',
         'security/ir.model.access.csv',
         'security/rules.xml',
+        'data/ir_cron.xml',
     ],
     "installable": True
 }
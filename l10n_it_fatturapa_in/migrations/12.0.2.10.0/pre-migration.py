@@ -0,0 +1,11 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.addons.l10n_it_fatturapa.models.e_invoice_file import (
+    migrate_file_name_key)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # The key of an e-bill comes from its name
+    migrate_file_name_key(cr, 'fatturapa_attachment_in', 'ia.name')
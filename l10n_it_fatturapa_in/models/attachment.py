@@ -2,13 +2,15 @@
 import base64
 from odoo import fields, models, api, _
 from odoo.tools import format_date
+from odoo.addons.l10n_it_fatturapa.models.e_invoice_file import (
+    get_file_name_key)
 
 
 class FatturaPAAttachmentIn(models.Model):
     _name = "fatturapa.attachment.in"
     _description = "E-bill import file"
     _inherits = {'ir.attachment': 'ir_attachment_id'}
-    _inherit = ['mail.thread']
+    _inherit = ['mail.thread', 'fatturapa.file.mixin']
     _order = 'id desc'
 
     ir_attachment_id = fields.Many2one(
@@ -43,11 +45,32 @@ class FatturaPAAttachmentIn(models.Model):
     e_invoice_validation_message = fields.Text(
         compute='_compute_e_invoice_validation_error')
 
+    import_batch_id = fields.Many2one(
+        'fatturapa.import.batch', string="Import batch", readonly=True,
+        copy=False, ondelete='set null')
+    import_state = fields.Selection([
+        ('queued', 'Queued'),
+        ('done', 'Imported'),
+        ('error', 'Failed'),
+    ], string="Background import", readonly=True, copy=False, index=True)
+    import_error = fields.Text(
+        "Background import error", readonly=True, copy=False)
+
     _sql_constraints = [(
         'ftpa_attachment_in_name_uniq',
         'unique(att_name)',
+        'The name of the e-bill file must be unique!'), (
+        'ftpa_attachment_in_file_name_key_uniq',
+        'unique(file_name_key)',
         'The name of the e-bill file must be unique!')]
 
+    @api.multi
+    @api.depends('ir_attachment_id.name')
+    def _compute_file_name_key(self):
+        # The name is the unique file name of the e-bill
+        for att in self:
+            att.file_name_key = get_file_name_key(att.name)
+
     @api.depends('in_invoice_ids.e_invoice_validation_error')
     def _compute_e_invoice_validation_error(self):
         for att in self:
@@ -78,12 +101,28 @@ class FatturaPAAttachmentIn(models.Model):
         self._compute_xml_data()
         self._compute_registered()
 
+    @api.multi
+    def action_requeue_import(self):
+        """Put failed files back in the background import queue"""
+        to_requeue = self.filtered(
+            lambda a: a.import_state == 'error' and a.import_batch_id)
+        to_requeue.write({
+            'import_state': 'queued',
+            'import_error': False,
+        })
+        to_requeue.mapped('import_batch_id').write({'state': 'queued'})
+        return True
+
     @api.multi
     @api.depends('ir_attachment_id.datas')
     def _compute_xml_data(self):
+        partner_index = self.env['wizard.import.fatturapa'] \
+            ._prepare_partner_index(self, company_scoped=True)
         for att in self:
             wiz_obj = self.env['wizard.import.fatturapa'] \
-                .with_context(from_attachment=att)
+                .with_context(
+                    from_attachment=att,
+                    fatturapa_partner_index=partner_index)
             fatt = wiz_obj.get_invoice_obj(att)
             cedentePrestatore = fatt.FatturaElettronicaHeader.CedentePrestatore
             partner_id = wiz_obj.getCedPrest(cedentePrestatore)
@@ -0,0 +1,143 @@
+import logging
+import threading
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_IMPORT_CHUNK_SIZE = 50
+
+
+class FatturaPAImportBatch(models.Model):
+    _name = "fatturapa.import.batch"
+    _description = "E-bill background import batch"
+    _order = 'id'
+
+    name = fields.Char(
+        required=True, readonly=True,
+        default=lambda self: fields.Datetime.to_string(
+            fields.Datetime.now()))
+    user_id = fields.Many2one(
+        'res.users', string="Requested by", required=True, readonly=True,
+        default=lambda self: self.env.user,
+        help="Bills are created using the rights and company of this user")
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('done', 'Done'),
+    ], default='queued', required=True, readonly=True)
+    e_invoice_detail_level = fields.Selection([
+        ('0', 'Minimum'),
+        ('1', 'Tax rate'),
+        ('2', 'Maximum'),
+    ], string="E-bills Detail Level", required=True, readonly=True)
+    price_decimal_digits = fields.Integer(
+        "Prices decimal digits", required=True, readonly=True)
+    quantity_decimal_digits = fields.Integer(
+        "Quantities decimal digits", required=True, readonly=True)
+    discount_decimal_digits = fields.Integer(
+        "Discounts decimal digits", required=True, readonly=True)
+    attachment_ids = fields.One2many(
+        'fatturapa.attachment.in', 'import_batch_id',
+        string="E-bill files", readonly=True)
+
+    def _prepare_wizard_values(self):
+        self.ensure_one()
+        return {
+            'e_invoice_detail_level': self.e_invoice_detail_level,
+            'price_decimal_digits': self.price_decimal_digits,
+            'quantity_decimal_digits': self.quantity_decimal_digits,
+            'discount_decimal_digits': self.discount_decimal_digits,
+        }
+
+    def _commit_progress(self):
+        # Tests run in a single transaction that must not be committed
+        if not getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def _import_queued_attachment(self, wizard, attachment):
+        """Import one file in its own savepoint, so that a failure
+        only rolls back the bills of that file, and record the outcome
+        on the file."""
+        partner_index = wizard.env.context.get('fatturapa_partner_index')
+        if partner_index is not None:
+            indexed_partners = {
+                key: list(partner_ids)
+                for key, partner_ids in partner_index.items()}
+        try:
+            with self.env.cr.savepoint():
+                wizard._import_attachment(attachment)
+        except Exception as e:
+            if partner_index is not None:
+                # Partners created for this file have been rolled back
+                partner_index.clear()
+                partner_index.update(indexed_partners)
+            lookup_cache = wizard.env.context.get('fatturapa_lookup_cache')
+            if lookup_cache is not None:
+                # and so have banks and bank accounts
+                lookup_cache.clear()
+            _logger.info(
+                "Background import of e-bill file %s failed",
+                attachment.name, exc_info=True)
+            # `str` on Odoo exceptions does not return
+            # a nice representation of the error
+            attachment.write({
+                'import_state': 'error',
+                'import_error': getattr(e, 'name', None) or str(e),
+            })
+        else:
+            attachment.write({
+                'import_state': 'done',
+                'import_error': False,
+            })
+        self._commit_progress()
+
+    @api.multi
+    def process_queued_attachments(self, limit=None):
+        """Import the queued files of the batches, committing after
+        each file.
+
+        :param limit: maximum number of files to import, None for all
+        :return: number of processed files
+        """
+        processed = 0
+        for batch in self:
+            attachments = batch.attachment_ids.filtered(
+                lambda a: a.import_state == 'queued')
+            if limit is not None:
+                attachments = attachments[:limit - processed]
+            if attachments:
+                wizard = self.env['wizard.import.fatturapa'].sudo(
+                    batch.user_id
+                ).with_context(
+                    active_ids=attachments.ids,
+                ).create(batch._prepare_wizard_values())
+                wizard = wizard.with_context(
+                    fatturapa_partner_index=wizard._prepare_partner_index(
+                        attachments.sudo(batch.user_id)),
+                    fatturapa_lookup_cache={})
+                to_restore = wizard._set_import_precisions()
+                try:
+                    for attachment in attachments:
+                        batch._import_queued_attachment(
+                            wizard, attachment.sudo(batch.user_id))
+                        processed += 1
+                finally:
+                    wizard._restore_import_precisions(to_restore)
+            if not batch.attachment_ids.filtered(
+                    lambda a: a.import_state == 'queued'):
+                batch.state = 'done'
+                self._commit_progress()
+            if limit is not None and processed >= limit:
+                break
+        return processed
+
+    @api.model
+    def cron_import_queued(self):
+        """Import a chunk of queued files.
+        Files left in queue are imported by the next run."""
+        chunk_size = int(self.env['ir.config_parameter'].sudo().get_param(
+            'fatturapa.import.chunk.size', DEFAULT_IMPORT_CHUNK_SIZE))
+        batches = self.search([('state', '=', 'queued')])
+        processed = batches.process_queued_attachments(limit=chunk_size)
+        _logger.info("Imported %d queued e-bill files", processed)
+        return True
@@ -4,6 +4,10 @@ from datetime import date
 
 from odoo.tools import mute_logger
 from .fatturapa_common import FatturapaCommon
+from odoo.addons.l10n_it_fatturapa_in.tools.invoice_obj_cache import \
+    estimate_parsed_size, invoice_obj_cache
+from odoo.addons.l10n_it_fatturapa.models.ir_attachment import \
+    preview_cache
 from odoo.exceptions import UserError
 
 
@@ -768,6 +772,99 @@ class TestFatturaPAXMLValidation(FatturapaCommon):
         invoice = self.invoice_model.browse(invoice_id)
         self.assertEqual(invoice.carrier_id.vat, "IT04102770965")
 
+    def test_50_xml_import_lightweight_parser(self):
+        self.env['ir.config_parameter'].set_param(
+            'fatturapa.in.lightweight.parser', 'True')
+        res = self.run_wizard('test50', 'IT05979361218_004.xml')
+        self.env['ir.config_parameter'].set_param(
+            'fatturapa.in.lightweight.parser', 'False')
+        invoice_id = res.get('domain')[0][2][0]
+        invoice = self.invoice_model.browse(invoice_id)
+        self.assertEqual(invoice.reference, 'FT/2015/0009')
+        self.assertEqual(invoice.date_invoice, date(2015, 2, 16))
+        self.assertAlmostEqual(invoice.amount_untaxed, 1173.60)
+        self.assertEqual(invoice.amount_tax, 258.19)
+        self.assertEqual(invoice.amount_total, 1431.79)
+        self.assertEqual(invoice.e_invoice_validation_error, False)
+        self.assertEqual(invoice.invoice_line_ids[0].admin_ref, 'D122353')
+        self.assertEqual(len(invoice.e_invoice_line_ids), 2)
+
+    def test_51_xml_parse_cache(self):
+        cache = invoice_obj_cache
+        attachment = self.attach_model.create({
+            'name': 'test51',
+            'datas': self.getFile('IT05979361218_003.xml')[1],
+            'datas_fname': 'IT05979361218_003.xml',
+        })
+        hits = cache.hits
+        fatt = self.wizard_model.get_invoice_obj(attachment)
+        self.assertIs(self.wizard_model.get_invoice_obj(attachment), fatt)
+        self.assertEqual(cache.hits, hits + 2)
+        # Entries are weighted by the estimated size of the parsed file
+        self.assertGreaterEqual(
+            cache.size, estimate_parsed_size(attachment.file_size, False))
+        self.assertGreater(
+            estimate_parsed_size(attachment.file_size, False),
+            attachment.file_size)
+
+        res = self.run_wizard('test51b', 'IT05979361218_003.xml')
+        invoice = self.invoice_model.browse(res.get('domain')[0][2][0])
+        self.assertEqual(invoice.reference, 'FT/2015/0008')
+
+        # Disable the cache
+        self.env['ir.config_parameter'].set_param(
+            'fatturapa.in.parse.cache.size', '0')
+        self.assertIsNot(self.wizard_model.get_invoice_obj(attachment), fatt)
+        self.assertEqual(len(cache), 0)
+        self.env['ir.config_parameter'].set_param(
+            'fatturapa.in.parse.cache.size', False)
+
+    def test_52_xml_import_partner_index(self):
+        attachment = self.attach_model.create({
+            'name': 'test52',
+            'datas': self.getFile('IT01234567890_FPR16.xml')[1],
+            'datas_fname': 'IT01234567890_FPR16.xml',
+        })
+        partner_index = self.wizard_model._prepare_partner_index(attachment)
+        self.assertIn(
+            attachment.xml_supplier_id.id,
+            partner_index[(None, 'sanitized_vat', 'IT02780790107')])
+        self.assertIn(
+            (None, 'sanitized_vat', 'IT04102770965'), partner_index)
+
+        wizard = self.wizard_model.with_context(
+            active_ids=attachment.ids).create({})
+        res = wizard.importFatturaPA()
+        invoice = self.invoice_model.browse(res.get('domain')[0][2][0])
+        self.assertEqual(invoice.partner_id, attachment.xml_supplier_id)
+        self.assertEqual(invoice.carrier_id.vat, "IT04102770965")
+
+    def test_53_xml_import_lookup_cache(self):
+        lookup_cache = {}
+        wizard = self.wizard_model.with_context(
+            fatturapa_lookup_cache=lookup_cache)
+        taxes = wizard.get_account_taxes('22.00', None)
+        self.assertTrue(taxes)
+        cached_keys = set(lookup_cache)
+        self.assertEqual(wizard.get_account_taxes('22.00', None), taxes)
+        self.assertEqual(set(lookup_cache), cached_keys)
+        self.assertEqual(
+            wizard.get_credit_account(), wizard.get_credit_account())
+        self.assertIn(('credit_account', False), lookup_cache)
+
+    def test_54_xml_preview_cache(self):
+        attachment = self.attach_model.create({
+            'name': 'test54',
+            'datas': self.getFile('IT05979361218_003.xml')[1],
+            'datas_fname': 'IT05979361218_003.xml',
+        }).ir_attachment_id
+        hits = preview_cache.hits
+        preview = attachment.get_fattura_elettronica_preview()
+        self.assertIn(b'FT/2015/0008', preview)
+        self.assertEqual(
+            attachment.get_fattura_elettronica_preview(), preview)
+        self.assertEqual(preview_cache.hits, hits + 1)
+
     def test_01_xml_link(self):
         """
         E-invoice lines are created.
@@ -984,3 +1081,72 @@ class TestFatturaPAEnasarco(FatturapaCommon):
             in invoice.e_invoice_validation_message)
         self.assertEqual(invoice.amount_total, 12.2)
         self.assertEqual(invoice.amount_net_pay, 12.2)
+
+
+class TestFatturaPAImportQueue(FatturapaCommon):
+
+    def create_attachments(self, file_name_list):
+        attachments = self.attach_model.browse()
+        for file_name in file_name_list:
+            attachments |= self.attach_model.create({
+                'name': 'queued_%s' % file_name,
+                'datas': self.getFile(file_name)[1],
+                'datas_fname': file_name,
+            })
+        return attachments
+
+    def queue_attachments(self, attachments):
+        wizard = self.wizard_model.with_context(
+            active_ids=attachments.ids,
+            active_model='fatturapa.attachment.in',
+        ).create({})
+        wizard.action_queue_import()
+        return attachments.mapped('import_batch_id')
+
+    def test_01_queued_import(self):
+        attachments = self.create_attachments([
+            'IT05979361218_003.xml', 'IT02780790107_11004.xml'])
+        batch = self.queue_attachments(attachments)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(
+            attachments.mapped('import_state'), ['queued', 'queued'])
+        self.assertFalse(attachments.mapped('in_invoice_ids'))
+
+        # Only one file per run
+        self.assertEqual(batch.process_queued_attachments(limit=1), 1)
+        self.assertEqual(
+            sorted(attachments.mapped('import_state')), ['done', 'queued'])
+        self.assertEqual(batch.state, 'queued')
+
+        self.env['fatturapa.import.batch'].cron_import_queued()
+        self.assertEqual(
+            attachments.mapped('import_state'), ['done', 'done'])
+        self.assertEqual(batch.state, 'done')
+        for attachment in attachments:
+            self.assertTrue(attachment.in_invoice_ids)
+            self.assertTrue(attachment.registered)
+
+    def test_02_queued_import_error(self):
+        # No withholding tax with payment reason A is configured
+        attachments = self.create_attachments([
+            'IT05979361218_009.xml', 'IT05979361218_004.xml'])
+        failing, working = attachments
+        batch = self.queue_attachments(attachments)
+        batch.process_queued_attachments()
+        self.assertEqual(failing.import_state, 'error')
+        self.assertIn('payment reason A', failing.import_error)
+        self.assertFalse(failing.in_invoice_ids)
+        self.assertEqual(working.import_state, 'done')
+        self.assertTrue(working.in_invoice_ids)
+        self.assertEqual(batch.state, 'done')
+
+        self.create_wt()
+        failing.action_requeue_import()
+        self.assertEqual(failing.import_state, 'queued')
+        self.assertEqual(batch.state, 'queued')
+        with self.assertRaises(UserError):
+            self.queue_attachments(failing)
+        batch.process_queued_attachments()
+        self.assertEqual(failing.import_state, 'done')
+        self.assertFalse(failing.import_error)
+        self.assertTrue(failing.in_invoice_ids)
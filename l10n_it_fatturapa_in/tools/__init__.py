@@ -0,0 +1 @@
+from . import invoice_obj_cache
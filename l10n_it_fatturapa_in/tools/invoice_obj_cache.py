@@ -0,0 +1,33 @@
+from odoo.addons.l10n_it_fatturapa.tools.lru_cache import SizedLRUCache
+
+# Default maximum total size, in bytes, of the memory estimated
+# to be used by the parsed e-invoices kept in cache
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+# Memory used by a parsed e-invoice for each byte of its file,
+# as measured with tracemalloc on the files of the tests:
+# PyXB bindings take up to about 20 times the file,
+# lightweight instances up to about 3 times when the file has no attachments
+PARSED_SIZE_FACTORS = {
+    False: 20,
+    True: 3,
+}
+
+
+def estimate_parsed_size(file_size, lightweight):
+    """Estimate the memory used by an e-invoice parsed from
+    a file of `file_size` bytes, by the lightweight parser or PyXB."""
+    return file_size * PARSED_SIZE_FACTORS[bool(lightweight)]
+
+
+class InvoiceObjCache(SizedLRUCache):
+    """Process-local LRU cache of parsed e-invoices.
+
+    Entries are weighted by the memory estimated by `estimate_parsed_size`.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        super(InvoiceObjCache, self).__init__(max_size)
+
+
+invoice_obj_cache = InvoiceObjCache()
@@ -8,6 +8,8 @@ from odoo.exceptions import UserError
 
 from odoo.addons.l10n_it_fatturapa.bindings import fatturapa
 from odoo.addons.base_iban.models.res_partner_bank import pretty_iban
+from odoo.addons.l10n_it_fatturapa_in.tools.invoice_obj_cache import (
+    DEFAULT_CACHE_SIZE, estimate_parsed_size, invoice_obj_cache)
 
 _logger = logging.getLogger(__name__)
 
@@ -144,57 +146,142 @@ class WizardImportFatturapa(models.TransientModel):
                 % (DatiAnagrafici.Anagrafica.Cognome, partner.lastname)
             )
 
+    def _get_partner_vat(self, DatiAnagrafici):
+        if not DatiAnagrafici.IdFiscaleIVA:
+            return False
+        # Format Italian VAT ID to always have 11 char
+        # to avoid validation error when creating the given partner
+        if DatiAnagrafici.IdFiscaleIVA.IdPaese.upper() == 'IT':
+            if DatiAnagrafici.IdFiscaleIVA.IdCodice.startswith("IT"):
+                return DatiAnagrafici.IdFiscaleIVA.IdCodice.rjust(13, '0')[:13]
+            return "%s%s" % (
+                DatiAnagrafici.IdFiscaleIVA.IdPaese.upper(),
+                DatiAnagrafici.IdFiscaleIVA.IdCodice.rjust(11, '0')[:11]
+            )
+        return "%s%s" % (
+            DatiAnagrafici.IdFiscaleIVA.IdPaese.upper(),
+            re.sub(r'\W+', '', DatiAnagrafici.IdFiscaleIVA.IdCodice).upper()
+        )
+
+    def _get_partner_company_scope(self, attachment=None):
+        """Company the partners of an e-bill file must belong to,
+        None when partners of any company can be used."""
+        attachment = attachment or self.env.context.get('from_attachment')
+        if not attachment:
+            return None
+        res_partner_rule = self.env['ir.model.data'].sudo().xmlid_to_object(
+            "base.res_partner_rule", raise_if_not_found=False)
+        if not (res_partner_rule and res_partner_rule.active):
+            return None
+        return attachment.company_id.id
+
+    def _get_partner_company_domain(self, company_scope):
+        if company_scope is None:
+            return []
+        return [
+            '|',
+            ('company_id', 'child_of', company_scope),
+            ('company_id', '=', False)
+        ]
+
+    def _get_partners_data(self, fatt):
+        """Yield the DatiAnagrafici of every partner of parsed e-bill file
+        `fatt`."""
+        header = fatt.FatturaElettronicaHeader
+        yield header.CedentePrestatore.DatiAnagrafici
+        if header.RappresentanteFiscale:
+            yield header.RappresentanteFiscale.DatiAnagrafici
+        if header.TerzoIntermediarioOSoggettoEmittente:
+            yield header.TerzoIntermediarioOSoggettoEmittente.DatiAnagrafici
+        for fattura in fatt.FatturaElettronicaBody:
+            DatiTrasporto = fattura.DatiGenerali.DatiTrasporto
+            if DatiTrasporto and DatiTrasporto.DatiAnagraficiVettore:
+                yield DatiTrasporto.DatiAnagraficiVettore
+
+    def _index_partners(self, partner_index, company_scope, partners):
+        """Add `partners` to the values already indexed in `partner_index`.
+        Other values are not added because their partners
+        might not be all there."""
+        for partner in partners:
+            for field_name in ('sanitized_vat', 'fiscalcode'):
+                partner_ids = partner_index.get(
+                    (company_scope, field_name, partner[field_name]))
+                if partner_ids is not None and partner.id not in partner_ids:
+                    partner_ids.append(partner.id)
+
+    def _prepare_partner_index(self, attachments, company_scoped=False):
+        """Find the partners of all the e-bill files `attachments`,
+        with one search for each company.
+
+        The result has to be put in context key `fatturapa_partner_index`
+        and is used, and kept updated, by `getPartnerBase`.
+
+        :param company_scoped: True if partners will be looked up
+            with the e-bill file in context key `from_attachment`
+        :return: dictionary (company scope, field name, value): partner IDs
+        """
+        keys_by_scope = {}
+        for attachment in attachments:
+            try:
+                fatt = self.get_invoice_obj(attachment)
+            except Exception:
+                # The error is raised again, and reported,
+                # when the file is processed
+                _logger.debug(
+                    "Partners of e-bill file %s not indexed",
+                    attachment.name, exc_info=True)
+                continue
+            company_scope = self._get_partner_company_scope(
+                attachment) if company_scoped else None
+            vats, fiscalcodes = keys_by_scope.setdefault(
+                company_scope, (set(), set()))
+            for DatiAnagrafici in self._get_partners_data(fatt):
+                vat = self._get_partner_vat(DatiAnagrafici)
+                if vat:
+                    vats.add(vat)
+                if DatiAnagrafici.CodiceFiscale:
+                    fiscalcodes.add(DatiAnagrafici.CodiceFiscale)
+
+        partner_index = {}
+        for company_scope, (vats, fiscalcodes) in keys_by_scope.items():
+            # Values not found are indexed too,
+            # so that they are not searched again
+            for vat in vats:
+                partner_index[(company_scope, 'sanitized_vat', vat)] = []
+            for fiscalcode in fiscalcodes:
+                partner_index[(company_scope, 'fiscalcode', fiscalcode)] = []
+            if not vats and not fiscalcodes:
+                continue
+            partners = self.env['res.partner'].search([
+                '|',
+                ('sanitized_vat', 'in', list(vats)),
+                ('fiscalcode', 'in', list(fiscalcodes)),
+            ] + self._get_partner_company_domain(company_scope))
+            self._index_partners(partner_index, company_scope, partners)
+        return partner_index
+
+    def _search_partners(self, field_name, value):
+        partner_model = self.env['res.partner']
+        company_scope = self._get_partner_company_scope()
+        partner_index = self.env.context.get('fatturapa_partner_index')
+        key = (company_scope, field_name, value)
+        if partner_index is not None and key in partner_index:
+            return partner_model.browse(partner_index[key])
+        return partner_model.search(
+            [(field_name, '=', value)] +
+            self._get_partner_company_domain(company_scope))
+
     def getPartnerBase(self, DatiAnagrafici, supplier=True):
         if not DatiAnagrafici:
             return False
         partner_model = self.env['res.partner']
         cf = DatiAnagrafici.CodiceFiscale or False
-        vat = False
-        if DatiAnagrafici.IdFiscaleIVA:
-            # Format Italian VAT ID to always have 11 char
-            # to avoid validation error when creating the given partner
-            if DatiAnagrafici.IdFiscaleIVA.IdPaese.upper() == 'IT':
-                if DatiAnagrafici.IdFiscaleIVA.IdCodice.startswith("IT"):
-                    vat = DatiAnagrafici.IdFiscaleIVA.IdCodice.rjust(13, '0')[:13]
-                else:
-                    vat = "%s%s" % (
-                        DatiAnagrafici.IdFiscaleIVA.IdPaese.upper(),
-                        DatiAnagrafici.IdFiscaleIVA.IdCodice.rjust(11, '0')[:11]
-                    )
-            else:
-                vat = "%s%s" % (
-                    DatiAnagrafici.IdFiscaleIVA.IdPaese.upper(),
-                    re.sub(r'\W+', '', DatiAnagrafici.IdFiscaleIVA.IdCodice).upper()
-                )
+        vat = self._get_partner_vat(DatiAnagrafici)
         partners = partner_model
-        res_partner_rule = self.env['ir.model.data'].sudo().xmlid_to_object(
-            "base.res_partner_rule", raise_if_not_found=False)
         if vat:
-            domain = [('sanitized_vat', '=', vat)]
-            if (
-                self.env.context.get('from_attachment') and
-                res_partner_rule and res_partner_rule.active
-            ):
-                att = self.env.context.get('from_attachment')
-                domain.extend([
-                    '|',
-                    ('company_id', 'child_of', att.company_id.id),
-                    ('company_id', '=', False)
-                ])
-            partners = partner_model.search(domain)
+            partners = self._search_partners('sanitized_vat', vat)
         if not partners and cf:
-            domain = [('fiscalcode', '=', cf)]
-            if (
-                self.env.context.get('from_attachment') and
-                res_partner_rule and res_partner_rule.active
-            ):
-                att = self.env.context.get('from_attachment')
-                domain.extend([
-                    '|',
-                    ('company_id', 'child_of', att.company_id.id),
-                    ('company_id', '=', False)
-                ])
-            partners = partner_model.search(domain)
+            partners = self._search_partners('fiscalcode', cf)
         commercial_partner_id = False
         if len(partners) > 1:
             for partner in partners:
@@ -243,7 +330,12 @@ class WizardImportFatturapa(models.TransientModel):
             if DatiAnagrafici.Anagrafica.Denominazione:
                 vals['name'] = DatiAnagrafici.Anagrafica.Denominazione
 
-            return partner_model.create(vals).id
+            partner = partner_model.create(vals)
+            partner_index = self.env.context.get('fatturapa_partner_index')
+            if partner_index is not None:
+                self._index_partners(
+                    partner_index, self._get_partner_company_scope(), partner)
+            return partner.id
 
     def getCedPrest(self, cedPrest):
         partner_model = self.env['res.partner']
@@ -371,19 +463,51 @@ class WizardImportFatturapa(models.TransientModel):
             retLine['invoice_line_tax_ids'] = [(6, 0, [account_taxes[0].id])]
         return retLine
 
-    def get_account_taxes(self, AliquotaIVA, Natura):
-        account_tax_model = self.env['account.tax']
-        # check if a default tax exists and generate def_purchase_tax object
-        ir_values = self.env['ir.default']
+    def _memoize(self, key, compute):
+        """Return the value of `compute()`, computed only once for each
+        `key` during an import.
+
+        Values are kept in the dictionary in context key
+        `fatturapa_lookup_cache`, if any."""
+        lookup_cache = self.env.context.get('fatturapa_lookup_cache')
+        if lookup_cache is None:
+            return compute()
+        if key not in lookup_cache:
+            lookup_cache[key] = compute()
+        return lookup_cache[key]
+
+    def _memoized_search(self, model_name, domain, order=None, limit=None):
+        model = self.env[model_name]
+        return model.browse(self._memoize(
+            ('search', model_name, tuple(domain), order, limit),
+            lambda: model.search(domain, order=order, limit=limit).ids))
+
+    def _forget_memoized_search(
+            self, model_name, domain, order=None, limit=None):
+        """To be called when records matching `domain` are created."""
+        lookup_cache = self.env.context.get('fatturapa_lookup_cache')
+        if lookup_cache is not None:
+            lookup_cache.pop(
+                ('search', model_name, tuple(domain), order, limit), None)
+
+    def _get_default_purchase_tax_ids(self):
         company_id = self.env['res.company']._company_default_get(
             'account.invoice.line').id
-        supplier_taxes_ids = ir_values.get(
+        return self.env['ir.default'].get(
             'product.product', 'supplier_taxes_id', company_id=company_id)
+
+    def get_account_taxes(self, AliquotaIVA, Natura):
+        account_tax_model = self.env['account.tax']
+        # check if a default tax exists and generate def_purchase_tax object
+        supplier_taxes_ids = self._memoize(
+            ('default_purchase_tax_ids', ),
+            self._get_default_purchase_tax_ids)
         def_purchase_tax = False
         if supplier_taxes_ids:
             def_purchase_tax = account_tax_model.browse(supplier_taxes_ids)[0]
         if float(AliquotaIVA) == 0.0 and Natura:
-            account_taxes = account_tax_model.search(
+            account_taxes = self._memoized_search(
+                'account.tax',
                 [
                     ('type_tax_use', '=', 'purchase'),
                     ('kind_id.code', '=', Natura),
@@ -402,7 +526,8 @@ class WizardImportFatturapa(models.TransientModel):
                     % (AliquotaIVA, Natura,
                        account_taxes[0].description))
         else:
-            account_taxes = account_tax_model.search(
+            account_taxes = self._memoized_search(
+                'account.tax',
                 [
                     ('type_tax_use', '=', 'purchase'),
                     ('amount', '=', float(AliquotaIVA)),
@@ -437,16 +562,16 @@ class WizardImportFatturapa(models.TransientModel):
 
     def get_line_product(self, line, partner):
         product = None
-        supplier_info = self.env['product.supplierinfo']
         if len(line.CodiceArticolo) == 1:
             supplier_code = line.CodiceArticolo[0].CodiceValore
-            supplier_infos = supplier_info.search([
+            supplier_infos = self._memoized_search('product.supplierinfo', [
                 ('product_code', '=', supplier_code),
                 ('name', '=', partner.id)
             ])
             if not supplier_infos:
                 supplier_name = line.Descrizione
-                supplier_infos = supplier_info.search(
+                supplier_infos = self._memoized_search(
+                    'product.supplierinfo',
                     [("product_name", "=", supplier_name), ("name", "=", partner.id)]
                 )
             if supplier_infos:
@@ -529,7 +654,22 @@ class WizardImportFatturapa(models.TransientModel):
 
         return retLine
 
-    def _prepareRelDocsLine(self, invoice_id, line, doc_type):
+    def _get_invoice_line_ids_by_sequence(self, invoice_id):
+        """Map the sequence of the lines of bill `invoice_id`
+        to the ID of the first line having that sequence."""
+        invoice_lines = self.env['account.invoice.line'].search([
+            ('invoice_id', '=', invoice_id),
+        ])
+        invoice_line_ids = {}
+        for invoice_line in invoice_lines:
+            invoice_line_ids.setdefault(invoice_line.sequence, invoice_line.id)
+        return invoice_line_ids
+
+    def _prepareRelDocsLine(
+            self, invoice_id, line, doc_type, invoice_line_ids=None):
+        """:param invoice_line_ids: result of
+            `_get_invoice_line_ids_by_sequence`, computed if not provided
+        """
         res = []
         lineref = line.RiferimentoNumeroLinea or False
         IdDoc = line.IdDocumento or 'Error'
@@ -540,16 +680,11 @@ class WizardImportFatturapa(models.TransientModel):
         Cup = line.CodiceCUP or ''
         invoice_lineid = False
         if lineref:
+            if invoice_line_ids is None:
+                invoice_line_ids = self._get_invoice_line_ids_by_sequence(
+                    invoice_id)
             for numline in lineref:
-                invoice_lineid = False
-                invoice_line_model = self.env['account.invoice.line']
-                invoice_lines = invoice_line_model.search(
-                    [
-                        ('invoice_id', '=', invoice_id),
-                        ('sequence', '=', int(numline)),
-                    ])
-                if invoice_lines:
-                    invoice_lineid = invoice_lines[0].id
+                invoice_lineid = invoice_line_ids.get(int(numline), False)
                 val = {
                     'type': doc_type,
                     'name': IdDoc,
@@ -700,11 +835,11 @@ class WizardImportFatturapa(models.TransientModel):
         details = line.DettaglioPagamento or False
         if details:
             PaymentModel = self.env['fatturapa.payment.detail']
-            PaymentMethodModel = self.env['fatturapa.payment_method']
             BankModel = self.env['res.bank']
             PartnerBankModel = self.env['res.partner.bank']
             for dline in details:
-                method = PaymentMethodModel.search(
+                method = self._memoized_search(
+                    'fatturapa.payment_method',
                     [('code', '=', dline.ModalitaPagamento)]
                 )
                 if not method:
@@ -761,9 +896,8 @@ class WizardImportFatturapa(models.TransientModel):
                 bank = False
                 payment_bank_id = False
                 if dline.BIC:
-                    banks = BankModel.search(
-                        [('bic', '=', dline.BIC.strip())]
-                    )
+                    bank_domain = [('bic', '=', dline.BIC.strip())]
+                    banks = self._memoized_search('res.bank', bank_domain)
                     if not banks:
                         if not dline.IstitutoFinanziario:
                             self.log_inconsistency(
@@ -777,6 +911,8 @@ class WizardImportFatturapa(models.TransientModel):
                                     'bic': dline.BIC,
                                 }
                             )
+                            self._forget_memoized_search(
+                                'res.bank', bank_domain)
                     else:
                         bank = banks[0]
                 if dline.IBAN:
@@ -789,7 +925,8 @@ class WizardImportFatturapa(models.TransientModel):
                         ('partner_id', '=', partner_id),
                     ]
                     payment_bank_id = False
-                    payment_banks = PartnerBankModel.search(SearchDom)
+                    payment_banks = self._memoized_search(
+                        'res.partner.bank', SearchDom)
                     if not payment_banks and not bank:
                         self.log_inconsistency(
                             _(
@@ -804,10 +941,12 @@ class WizardImportFatturapa(models.TransientModel):
                             )
                         )
                     elif not payment_banks and bank:
-                        existing_account = PartnerBankModel.search([
+                        existing_account_domain = [
                             ("acc_number", "=", iban),
                             ("company_id", "=", invoice.company_id.id)
-                        ])
+                        ]
+                        existing_account = self._memoized_search(
+                            'res.partner.bank', existing_account_domain)
                         if existing_account:
                             self.log_inconsistency(
                                 _("Bank account %s already exists") % iban)
@@ -821,6 +960,10 @@ class WizardImportFatturapa(models.TransientModel):
                                     'bank_bic': dline.BIC or bank.bic
                                 }
                             ).id
+                            self._forget_memoized_search(
+                                'res.partner.bank', SearchDom)
+                            self._forget_memoized_search(
+                                'res.partner.bank', existing_account_domain)
                     if payment_banks:
                         payment_bank_id = payment_banks[0].id
 
@@ -846,8 +989,8 @@ class WizardImportFatturapa(models.TransientModel):
                 CedentePrestatore.StabileOrganizzazione.Nazione)
 
     def get_purchase_journal(self, company):
-        journal_model = self.env['account.journal']
-        journals = journal_model.search(
+        journals = self._memoized_search(
+            'account.journal',
             [
                 ('type', '=', 'purchase'),
                 ('company_id', '=', company.id)
@@ -862,7 +1005,7 @@ class WizardImportFatturapa(models.TransientModel):
             )
         return journals[0]
 
-    def create_e_invoice_line(self, line):
+    def _prepare_e_invoice_line(self, line):
         vals = {
             'line_number': int(line.NumeroLinea or 0),
             'service_type': line.TipoCessionePrestazione,
@@ -878,38 +1021,52 @@ class WizardImportFatturapa(models.TransientModel):
             'tax_kind': line.Natura,
             'admin_ref': line.RiferimentoAmministrazione,
         }
-        einvoiceline = self.env['einvoice.line'].create(vals)
         if line.CodiceArticolo:
-            for caline in line.CodiceArticolo:
-                self.env['fatturapa.article.code'].create(
-                    {
-                        'name': caline.CodiceTipo or '',
-                        'code_val': caline.CodiceValore or '',
-                        'e_invoice_line_id': einvoiceline.id
-                    }
-                )
+            vals['cod_article_ids'] = [
+                (0, 0, {
+                    'name': caline.CodiceTipo or '',
+                    'code_val': caline.CodiceValore or '',
+                })
+                for caline in line.CodiceArticolo
+            ]
         if line.ScontoMaggiorazione:
+            vals['discount_rise_price_ids'] = []
             for DiscRisePriceLine in line.ScontoMaggiorazione:
                 DiscRisePriceVals = self.with_context(
                     drtype='e_invoice_line_id'
                 )._prepareDiscRisePriceLine(
-                    einvoiceline.id, DiscRisePriceLine
+                    False, DiscRisePriceLine
                 )
-                self.env['discount.rise.price'].create(DiscRisePriceVals)
+                # Set when the e-bill line is created
+                DiscRisePriceVals.pop('e_invoice_line_id', None)
+                vals['discount_rise_price_ids'].append(
+                    (0, 0, DiscRisePriceVals))
         if line.AltriDatiGestionali:
-            for dato in line.AltriDatiGestionali:
-                self.env['einvoice.line.other.data'].create(
-                    {
-                        'name': dato.TipoDato,
-                        'text_ref': dato.RiferimentoTesto,
-                        'num_ref': float(dato.RiferimentoNumero or 0),
-                        'date_ref': dato.RiferimentoData,
-                        'e_invoice_line_id': einvoiceline.id
-                    }
-                )
-        return einvoiceline
+            vals['other_data_ids'] = [
+                (0, 0, {
+                    'name': dato.TipoDato,
+                    'text_ref': dato.RiferimentoTesto,
+                    'num_ref': float(dato.RiferimentoNumero or 0),
+                    'date_ref': dato.RiferimentoData,
+                })
+                for dato in line.AltriDatiGestionali
+            ]
+        return vals
+
+    def create_e_invoice_line(self, line):
+        return self.env['einvoice.line'].create(
+            self._prepare_e_invoice_line(line))
 
     def get_credit_account(self, product=None):
+        """
+        Get default credit account for invoice line,
+        see `_get_credit_account`.
+        """
+        return self.env['account.account'].browse(self._memoize(
+            ('credit_account', product.id if product else False),
+            lambda: self._get_credit_account(product).ids))
+
+    def _get_credit_account(self, product=None):
         """
         Try to get default credit account for invoice line looking in
 
@@ -1076,15 +1233,20 @@ class WizardImportFatturapa(models.TransientModel):
             'invoice': FatturaBody.DatiGenerali.DatiFattureCollegate,
         }
 
+        rel_docs_data = []
+        invoice_line_ids = None
         for rel_doc_key, rel_doc_data in rel_docs_dict.items():
             if not rel_doc_data:
                 continue
+            if invoice_line_ids is None:
+                invoice_line_ids = self._get_invoice_line_ids_by_sequence(
+                    invoice_id)
             for rel_doc in rel_doc_data:
-                doc_datas = self._prepareRelDocsLine(
-                    invoice_id, rel_doc, rel_doc_key)
-                for doc_data in doc_datas:
-                    # Note for v12: must take advantage of batch creation
-                    rel_docs_model.create(doc_data)
+                rel_docs_data.extend(self._prepareRelDocsLine(
+                    invoice_id, rel_doc, rel_doc_key,
+                    invoice_line_ids=invoice_line_ids))
+        if rel_docs_data:
+            rel_docs_model.create(rel_docs_data)
 
         # 2.1.7
         self.set_activity_progress(FatturaBody, invoice_id)
@@ -1163,11 +1325,11 @@ class WizardImportFatturapa(models.TransientModel):
         DdtDatas = FatturaBody.DatiGenerali.DatiDDT
         if not DdtDatas:
             return
-        invoice_line_model = self.env['account.invoice.line']
-        DdTModel = self.env['fatturapa.related_ddt']
+        invoice_line_ids = self._get_invoice_line_ids_by_sequence(invoice_id)
+        ddts_data = []
         for DdtDataLine in DdtDatas:
             if not DdtDataLine.RiferimentoNumeroLinea:
-                DdTModel.create(
+                ddts_data.append(
                     {
                         'name': DdtDataLine.NumeroDDT or '',
                         'date': DdtDataLine.DataDDT or False,
@@ -1176,22 +1338,16 @@ class WizardImportFatturapa(models.TransientModel):
                 )
             else:
                 for numline in DdtDataLine.RiferimentoNumeroLinea:
-                    invoice_lines = invoice_line_model.search(
-                        [
-                            ('invoice_id', '=', invoice_id),
-                            ('sequence', '=', int(numline)),
-                        ])
-                    invoice_lineid = False
-                    if invoice_lines:
-                        invoice_lineid = invoice_lines[0].id
-                    DdTModel.create(
+                    ddts_data.append(
                         {
                             'name': DdtDataLine.NumeroDDT or '',
                             'date': DdtDataLine.DataDDT or False,
                             'invoice_id': invoice_id,
-                            'invoice_line_id': invoice_lineid
+                            'invoice_line_id':
+                                invoice_line_ids.get(int(numline), False)
                         }
                     )
+        self.env['fatturapa.related_ddt'].create(ddts_data)
 
     def set_art73(self, FatturaBody, invoice_data):
         if FatturaBody.DatiGenerali.DatiGeneraliDocumento.Art73:
@@ -1262,15 +1418,14 @@ class WizardImportFatturapa(models.TransientModel):
     def set_activity_progress(self, FatturaBody, invoice_id):
         SalDatas = FatturaBody.DatiGenerali.DatiSAL
         if SalDatas:
-            SalModel = self.env['faturapa.activity.progress']
-            for SalDataLine in SalDatas:
-                SalModel.create(
-                    {
-                        'fatturapa_activity_progress':
-                            SalDataLine.RiferimentoFase or 0,
-                        'invoice_id': invoice_id
-                    }
-                )
+            self.env['faturapa.activity.progress'].create([
+                {
+                    'fatturapa_activity_progress':
+                        SalDataLine.RiferimentoFase or 0,
+                    'invoice_id': invoice_id
+                }
+                for SalDataLine in SalDatas
+            ])
 
     def _get_last_due_date(self, DatiPagamento):
         dates = []
@@ -1292,14 +1447,14 @@ class WizardImportFatturapa(models.TransientModel):
                 self.env['account.invoice'].browse(invoice_id).date_due = due_dates[0]
         if PaymentsData:
             PaymentDataModel = self.env['fatturapa.payment.data']
-            PaymentTermsModel = self.env['fatturapa.payment_term']
             for PaymentLine in PaymentsData:
                 cond = PaymentLine.CondizioniPagamento or False
                 if not cond:
                     raise UserError(
                         _('Payment method code not found in document.')
                     )
-                terms = PaymentTermsModel.search([('code', '=', cond)])
+                terms = self._memoized_search(
+                    'fatturapa.payment_term', [('code', '=', cond)])
                 if not terms:
                     raise UserError(
                         _('Payment method code %s is incorrect.') % cond
@@ -1323,7 +1478,7 @@ class WizardImportFatturapa(models.TransientModel):
         invoice_data['ftpa_withholding_ids'] = []
         wt_founds = []
         for Withholding in Withholdings:
-            wts = self.env['withholding.tax'].search([
+            wts = self._memoized_search('withholding.tax', [
                 ('causale_pagamento_id.code', '=', Withholding.CausalePagamento)
             ])
             if not wts:
@@ -1369,9 +1524,11 @@ class WizardImportFatturapa(models.TransientModel):
             return
 
         WelfareFundLineModel = self.env['welfare.fund.data.line']
+        welfare_lines_data = []
+        invoice_lines_data = []
         for welfareLine in Welfares:
             WalfarLineVals = self._prepareWelfareLine(invoice.id, welfareLine)
-            WelfareFundLineModel.create(WalfarLineVals)
+            welfare_lines_data.append(WalfarLineVals)
 
             if welfareLine.TipoCassa == 'TC07':
                 continue
@@ -1400,7 +1557,9 @@ class WizardImportFatturapa(models.TransientModel):
                 self.adjust_accounting_data(
                     cassa_previdenziale_product, line_vals
                 )
-            self.env['account.invoice.line'].create(line_vals)
+            invoice_lines_data.append(line_vals)
+        WelfareFundLineModel.create(welfare_lines_data)
+        self.env['account.invoice.line'].create(invoice_lines_data)
 
     def set_delivery_data(self, FatturaBody, invoice):
         Delivery = FatturaBody.DatiGenerali.DatiTrasporto
@@ -1439,6 +1598,7 @@ class WizardImportFatturapa(models.TransientModel):
         Summary_datas = FatturaBody.DatiBeniServizi.DatiRiepilogo
         summary_data_model = self.env['faturapa.summary.data']
         if Summary_datas:
+            summary_lines = []
             for summary in Summary_datas:
                 summary_line = {
                     'tax_rate': summary.AliquotaIVA or 0.0,
@@ -1451,25 +1611,26 @@ class WizardImportFatturapa(models.TransientModel):
                     'law_reference': summary.RiferimentoNormativo or '',
                     'invoice_id': invoice_id,
                 }
-                summary_data_model.create(summary_line)
+                summary_lines.append(summary_line)
+            summary_data_model.create(summary_lines)
 
     def set_e_invoice_lines(self, FatturaBody, invoice_data):
-        e_invoice_lines = self.env['einvoice.line'].browse()
-        for line in FatturaBody.DatiBeniServizi.DettaglioLinee:
-            e_invoice_lines |= self.create_e_invoice_line(line)
-        if e_invoice_lines:
+        e_invoice_lines_vals = [
+            self._prepare_e_invoice_line(line)
+            for line in FatturaBody.DatiBeniServizi.DettaglioLinee]
+        if e_invoice_lines_vals:
+            e_invoice_lines = self.env['einvoice.line'].create(
+                e_invoice_lines_vals)
             invoice_data['e_invoice_line_ids'] = [(6, 0, e_invoice_lines.ids)]
 
-    def _set_invoice_lines(self, product, invoice_line_data, invoice_lines,
-                           invoice_line_model):
+    def _set_invoice_lines(self, product, invoice_line_data,
+                           invoice_lines_data):
 
         if product:
             invoice_line_data['product_id'] = product.id
             self.adjust_accounting_data(product, invoice_line_data)
 
-        invoice_line_id = invoice_line_model.create(
-            invoice_line_data).id
-        invoice_lines.append(invoice_line_id)
+        invoice_lines_data.append(invoice_line_data)
 
     def set_invoice_line_ids(
             self, FatturaBody, credit_account_id, partner, wt_founds,
@@ -1478,26 +1639,29 @@ class WizardImportFatturapa(models.TransientModel):
         if self.e_invoice_detail_level == '0':
             return
 
-        invoice_lines = []
-        invoice_line_model = self.env['account.invoice.line']
+        invoice_lines_data = []
         if self.e_invoice_detail_level == '1':
             for nline, line in enumerate(FatturaBody.DatiBeniServizi.DatiRiepilogo):
                 invoice_line_data = self._prepareInvoiceLineAliquota(
                     credit_account_id, line, nline)
 
                 product = partner.e_invoice_default_product_id
-                self._set_invoice_lines(product, invoice_line_data, invoice_lines,
-                                        invoice_line_model)
+                self._set_invoice_lines(
+                    product, invoice_line_data, invoice_lines_data)
 
         elif self.e_invoice_detail_level == '2':
             for line in FatturaBody.DatiBeniServizi.DettaglioLinee:
                 invoice_line_data = self._prepareInvoiceLine(
                     credit_account_id, line, wt_founds)
                 product = self.get_line_product(line, partner)
-                self._set_invoice_lines(product, invoice_line_data, invoice_lines,
-                                        invoice_line_model)
+                self._set_invoice_lines(
+                    product, invoice_line_data, invoice_lines_data)
 
-        invoice_data['invoice_line_ids'] = [(6, 0, invoice_lines)]
+        # Lines are not linked to the bill yet,
+        # so bill totals are computed once, when it is created
+        invoice_lines = self.env['account.invoice.line'].create(
+            invoice_lines_data)
+        invoice_data['invoice_line_ids'] = [(6, 0, invoice_lines.ids)]
 
     def check_invoice_amount(self, invoice, FatturaElettronicaBody):
         if (
@@ -1536,9 +1700,42 @@ class WizardImportFatturapa(models.TransientModel):
                     % (invoice.amount_untaxed, amount_untaxed)
                 )
 
+    def _use_lightweight_parser(self):
+        param = self.env['ir.config_parameter'].sudo().get_param(
+            'fatturapa.in.lightweight.parser', 'False')
+        return param.lower() in ('1', 'true')
+
+    def _get_invoice_obj_cache(self):
+        cache_size = self.env['ir.config_parameter'].sudo().get_param(
+            'fatturapa.in.parse.cache.size', DEFAULT_CACHE_SIZE)
+        invoice_obj_cache.resize(int(cache_size))
+        return invoice_obj_cache
+
     def get_invoice_obj(self, fatturapa_attachment):
+        """Parse the e-invoice file.
+        Parsed files are cached by checksum: do not modify the result."""
+        lightweight = self._use_lightweight_parser()
+        cache = self._get_invoice_obj_cache()
+        cache_key = None
+        if fatturapa_attachment.checksum:
+            cache_key = (fatturapa_attachment.checksum, lightweight)
+            fatt = cache.get(cache_key)
+            if fatt is not None:
+                return fatt
+
         xml_string = fatturapa_attachment.get_xml_string()
-        return fatturapa.CreateFromDocument(xml_string)
+        if lightweight:
+            fatt = fatturapa.CreateLightweightFromDocument(xml_string)
+        else:
+            fatt = fatturapa.CreateFromDocument(xml_string)
+
+        if cache_key:
+            cache.put(
+                cache_key, fatt, estimate_parsed_size(
+                    fatturapa_attachment.file_size or len(xml_string),
+                    lightweight))
+            _logger.debug("E-invoice parse cache: %s", cache.stats())
+        return fatt
 
     def _set_decimal_precision(self, precision_name, field_name):
         precision = self.env["decimal.precision"].search([
@@ -1569,103 +1766,122 @@ class WizardImportFatturapa(models.TransientModel):
             new_price_precision.sudo().write({"digits": original_precision})
             new_cr.commit()
 
-    @api.multi
-    def importFatturaPA(self):
-        self.ensure_one()
-        fatturapa_attachment_obj = self.env['fatturapa.attachment.in']
-        fatturapa_attachment_ids = self.env.context.get('active_ids', False)
-        invoice_model = self.env['account.invoice']
+    def _set_import_precisions(self):
+        """Apply the decimal precisions chosen in the wizard.
 
-        price_precision, different_price_precisions, original_price_precision =\
-            self._set_decimal_precision(
-                "Product Price", "price_decimal_digits")
-        qty_precision, different_qty_precisions, original_qty_precision =\
-            self._set_decimal_precision(
-                "Product Unit of Measure", "quantity_decimal_digits")
-        discount_precision, different_discount_precisions,\
-            original_discount_precision = self._set_decimal_precision(
-                "Discount", "discount_decimal_digits")
+        :return: list of (precision, original digits) to be restored
+        """
+        to_restore = []
+        for precision_name, field_name in [
+            ("Product Price", "price_decimal_digits"),
+            ("Product Unit of Measure", "quantity_decimal_digits"),
+            ("Discount", "discount_decimal_digits"),
+        ]:
+            precision, different_precisions, original_precision = \
+                self._set_decimal_precision(precision_name, field_name)
+            if precision and different_precisions:
+                to_restore.append((precision, original_precision))
+        return to_restore
+
+    def _restore_import_precisions(self, to_restore):
+        for precision, original_precision in to_restore:
+            self._restore_original_precision(precision, original_precision)
+
+    def _import_attachment(self, fatturapa_attachment):
+        """Create the bills of a single e-bill file.
+
+        :return: list of created bill IDs
+        """
+        invoice_model = self.env['account.invoice']
+        self.__dict__.update(
+            self.with_context(inconsistencies='').__dict__
+        )
+        if fatturapa_attachment.in_invoice_ids:
+            raise UserError(
+                _("File is linked to bills yet."))
+        fatt = self.get_invoice_obj(fatturapa_attachment)
+        cedentePrestatore = fatt.FatturaElettronicaHeader.CedentePrestatore
+        # 1.2
+        partner_id = self.getCedPrest(cedentePrestatore)
+        # 1.3
+        TaxRappresentative = fatt.FatturaElettronicaHeader.\
+            RappresentanteFiscale
+        # 1.5
+        Intermediary = fatt.FatturaElettronicaHeader.\
+            TerzoIntermediarioOSoggettoEmittente
+
+        generic_inconsistencies = ''
+        if self.env.context.get('inconsistencies'):
+            generic_inconsistencies = (
+                self.env.context['inconsistencies'] + '\n\n')
+
+        xmlproblems = getattr(fatt, '_xmldoctor', None)
+        if xmlproblems:  # None or []
+            generic_inconsistencies += '\n'.join(xmlproblems) + '\n\n'
 
         new_invoices = []
-        for fatturapa_attachment_id in fatturapa_attachment_ids:
+        # 2
+        for fattura in fatt.FatturaElettronicaBody:
+
+            # reset inconsistencies
             self.__dict__.update(
                 self.with_context(inconsistencies='').__dict__
             )
-            fatturapa_attachment = fatturapa_attachment_obj.browse(
-                fatturapa_attachment_id)
-            if fatturapa_attachment.in_invoice_ids:
-                raise UserError(
-                    _("File is linked to bills yet."))
-            fatt = self.get_invoice_obj(fatturapa_attachment)
-            cedentePrestatore = fatt.FatturaElettronicaHeader.CedentePrestatore
-            # 1.2
-            partner_id = self.getCedPrest(cedentePrestatore)
-            # 1.3
-            TaxRappresentative = fatt.FatturaElettronicaHeader.\
-                RappresentanteFiscale
-            # 1.5
-            Intermediary = fatt.FatturaElettronicaHeader.\
-                TerzoIntermediarioOSoggettoEmittente
-
-            generic_inconsistencies = ''
-            if self.env.context.get('inconsistencies'):
-                generic_inconsistencies = (
-                    self.env.context['inconsistencies'] + '\n\n')
 
-            xmlproblems = getattr(fatt, '_xmldoctor', None)
-            if xmlproblems:  # None or []
-                generic_inconsistencies += '\n'.join(xmlproblems) + '\n\n'
-
-            # 2
-            for fattura in fatt.FatturaElettronicaBody:
-
-                # reset inconsistencies
-                self.__dict__.update(
-                    self.with_context(inconsistencies='').__dict__
+            invoice_id = self.invoiceCreate(
+                fatt, fatturapa_attachment, fattura, partner_id)
+            invoice = invoice_model.browse(invoice_id)
+            self.set_StabileOrganizzazione(cedentePrestatore, invoice)
+            if TaxRappresentative:
+                tax_partner_id = self.getPartnerBase(
+                    TaxRappresentative.DatiAnagrafici, supplier=False)
+                invoice.write(
+                    {
+                        'tax_representative_id': tax_partner_id
+                    }
+                )
+            if Intermediary:
+                Intermediary_id = self.getPartnerBase(
+                    Intermediary.DatiAnagrafici, supplier=False)
+                invoice.write(
+                    {
+                        'intermediary': Intermediary_id
+                    }
                 )
+            new_invoices.append(invoice_id)
+            self.check_invoice_amount(invoice, fattura)
 
-                invoice_id = self.invoiceCreate(
-                    fatt, fatturapa_attachment, fattura, partner_id)
-                invoice = invoice_model.browse(invoice_id)
-                self.set_StabileOrganizzazione(cedentePrestatore, invoice)
-                if TaxRappresentative:
-                    tax_partner_id = self.getPartnerBase(
-                        TaxRappresentative.DatiAnagrafici, supplier=False)
-                    invoice.write(
-                        {
-                            'tax_representative_id': tax_partner_id
-                        }
-                    )
-                if Intermediary:
-                    Intermediary_id = self.getPartnerBase(
-                        Intermediary.DatiAnagrafici, supplier=False)
-                    invoice.write(
-                        {
-                            'intermediary': Intermediary_id
-                        }
-                    )
-                new_invoices.append(invoice_id)
-                self.check_invoice_amount(invoice, fattura)
+            invoice.set_einvoice_data(fattura)
 
-                invoice.set_einvoice_data(fattura)
+            if self.env.context.get('inconsistencies'):
+                invoice_inconsistencies = (
+                    self.env.context['inconsistencies'])
+            else:
+                invoice_inconsistencies = ''
+            invoice.inconsistencies = (
+                generic_inconsistencies + invoice_inconsistencies)
+        return new_invoices
 
-                if self.env.context.get('inconsistencies'):
-                    invoice_inconsistencies = (
-                        self.env.context['inconsistencies'])
-                else:
-                    invoice_inconsistencies = ''
-                invoice.inconsistencies = (
-                    generic_inconsistencies + invoice_inconsistencies)
-
-        if price_precision and different_price_precisions:
-            self._restore_original_precision(
-                price_precision, original_price_precision)
-        if qty_precision and different_qty_precisions:
-            self._restore_original_precision(
-                qty_precision, original_qty_precision)
-        if discount_precision and different_discount_precisions:
-            self._restore_original_precision(
-                discount_precision, original_discount_precision)
+    @api.multi
+    def importFatturaPA(self):
+        self.ensure_one()
+        fatturapa_attachment_obj = self.env['fatturapa.attachment.in']
+        fatturapa_attachment_ids = self.env.context.get('active_ids', False)
+        fatturapa_attachments = fatturapa_attachment_obj.browse(
+            fatturapa_attachment_ids)
+        self = self.with_context(
+            fatturapa_partner_index=self._prepare_partner_index(
+                fatturapa_attachments),
+            fatturapa_lookup_cache={})
+
+        to_restore = self._set_import_precisions()
+        new_invoices = []
+        try:
+            for fatturapa_attachment in fatturapa_attachments:
+                new_invoices.extend(
+                    self._import_attachment(fatturapa_attachment))
+        finally:
+            self._restore_import_precisions(to_restore)
 
         return {
             'view_type': 'form',
@@ -1675,3 +1891,28 @@ class WizardImportFatturapa(models.TransientModel):
             'type': 'ir.actions.act_window',
             'domain': [('id', 'in', new_invoices)],
         }
+
+    @api.multi
+    def action_queue_import(self):
+        """Queue the selected files, to be imported in background
+        by the 'Import queued e-bills' scheduled action."""
+        self.ensure_one()
+        attachments = self.env['fatturapa.attachment.in'].browse(
+            self.env.context.get('active_ids', []))
+        for attachment in attachments:
+            if attachment.import_state == 'queued':
+                raise UserError(
+                    _("File %s is already queued for import.")
+                    % attachment.name)
+        self.env['fatturapa.import.batch'].create({
+            'e_invoice_detail_level': self.e_invoice_detail_level,
+            'price_decimal_digits': self.price_decimal_digits,
+            'quantity_decimal_digits': self.quantity_decimal_digits,
+            'discount_decimal_digits': self.discount_decimal_digits,
+            'attachment_ids': [(6, 0, attachments.ids)],
+        })
+        attachments.write({
+            'import_state': 'queued',
+            'import_error': False,
+        })
+        return {'type': 'ir.actions.act_window_close'}
@@ -0,0 +1,12 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.addons.l10n_it_fatturapa.models.e_invoice_file import (
+    migrate_file_name_key)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    migrate_file_name_key(
+        cr, 'fatturapa_attachment_out',
+        "COALESCE(NULLIF(ia.datas_fname, ''), ia.name)")
@@ -5,3 +5,4 @@ from . import attachment
 from . import account
 from . import company
 from . import partner
+from . import progressivo_invio
@@ -1,15 +1,24 @@
 # Copyright 2014 Davide Corio
 # Copyright 2016-2018 Lorenzo Battistini - Agile Business Group
 
+import re
+from collections import defaultdict
+
 from odoo import fields, models, api, _
 from odoo.exceptions import UserError
+from odoo.addons.l10n_it_fatturapa.models.e_invoice_file import (
+    get_file_name_key)
+
+# VAT_XXXXX.xml, possibly signed (.xml.p7m) or compressed
+FILE_NAME_PATTERN = re.compile(
+    r'^(?P<vat>[^_]+)_(?P<file_id>[a-zA-Z0-9]{1,5})\.')
 
 
 class FatturaPAAttachment(models.Model):
     _name = "fatturapa.attachment.out"
     _description = "E-invoice Export File"
     _inherits = {'ir.attachment': 'ir_attachment_id'}
-    _inherit = ['mail.thread']
+    _inherit = ['mail.thread', 'fatturapa.file.mixin']
     _order = 'id desc'
 
     ir_attachment_id = fields.Many2one(
@@ -48,6 +57,9 @@ class FatturaPAAttachment(models.Model):
     _sql_constraints = [(
         'ftpa_attachment_out_name_uniq',
         'unique(att_name)',
+        'The name of the e-invoice file must be unique!'), (
+        'ftpa_attachment_out_file_name_key_uniq',
+        'unique(file_name_key)',
         'The name of the e-invoice file must be unique!')]
 
     @api.model
@@ -70,12 +82,31 @@ class FatturaPAAttachment(models.Model):
 
     def file_name_exists(self, file_id):
         vat = self.get_file_vat()
-        partial_fname = r'%s\_%s.' % (vat, file_id)  # escaping _ SQL
         # Not trying to perfect match file extension, because user could have
         # downloaded, signed and uploaded again the file, thus having changed
         # file extension
-        return bool(self.search(
-            [('datas_fname', '=like', '%s%%' % partial_fname)]))
+        return bool(self.get_by_file_name('%s_%s' % (vat, file_id)))
+
+    @api.multi
+    def _register_progressivo_invio(self):
+        """Mark the progressive numbers used by the file names
+        so that they are not allocated again."""
+        file_ids_by_vat = defaultdict(set)
+        for att in self:
+            for file_name in (att.name, att.datas_fname):
+                match = FILE_NAME_PATTERN.match(file_name or '')
+                if match:
+                    file_ids_by_vat[match.group('vat')].add(
+                        match.group('file_id'))
+        ProgressivoInvio = self.env['fatturapa.progressivo.invio'].sudo()
+        for vat, file_ids in file_ids_by_vat.items():
+            ProgressivoInvio.register(vat, sorted(file_ids))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attachments = super(FatturaPAAttachment, self).create(vals_list)
+        attachments._register_progressivo_invio()
+        return attachments
 
     @api.multi
     @api.depends('out_invoice_ids')
@@ -85,12 +116,20 @@ class FatturaPAAttachment(models.Model):
             if len(partners) == 1:
                 att.invoice_partner_id = partners.id
 
+    @api.multi
+    @api.depends('ir_attachment_id.datas_fname', 'ir_attachment_id.name')
+    def _compute_file_name_key(self):
+        return super(FatturaPAAttachment, self)._compute_file_name_key()
+
     @api.multi
     @api.constrains('datas_fname')
     def _check_datas_fname(self):
         for att in self:
-            res = self.search([('datas_fname', '=', att.datas_fname)])
-            if len(res) > 1:
+            key = get_file_name_key(att.datas_fname)
+            if key and self.search_count([
+                ('file_name_key', '=', key),
+                ('id', '!=', att.id),
+            ]):
                 raise UserError(
                     _("File %s already present.") %
                     att.datas_fname)
@@ -127,6 +166,8 @@ class FatturaPAAttachment(models.Model):
     @api.multi
     def write(self, vals):
         res = super(FatturaPAAttachment, self).write(vals)
+        if 'name' in vals or 'datas_fname' in vals:
+            self._register_progressivo_invio()
         if 'datas' in vals and 'message_ids' not in vals:
             for attachment in self:
                 attachment.message_post(
@@ -0,0 +1,83 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import string
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+PROGRESSIVO_INVIO_SIZE = 5
+PROGRESSIVO_INVIO_CHARS = string.digits + string.ascii_uppercase
+
+
+class FatturaPAProgressivoInvio(models.Model):
+    """Progressive numbers (ProgressivoInvio) already used in the names
+    of the e-invoice files of each transmitter VAT."""
+    _name = "fatturapa.progressivo.invio"
+    _description = "E-invoice file progressive number"
+    _log_access = False
+
+    name = fields.Char(
+        "Progressive number", required=True, readonly=True)
+    vat = fields.Char("TIN", required=True, readonly=True)
+
+    _sql_constraints = [(
+        'fatturapa_progressivo_invio_uniq',
+        'unique(vat, name)',
+        'The progressive number of the e-invoice file must be unique!')]
+
+    def _sequence_name(self):
+        return '%s_number_seq' % self._table
+
+    @api.model_cr
+    def init(self):
+        # Numbers are drawn from a sequence: it is not transactional,
+        # so concurrent exports never wait for each other
+        self.env.cr.execute(
+            'CREATE SEQUENCE IF NOT EXISTS %s' % self._sequence_name())
+
+    @api.model
+    def _format_number(self, number):
+        chars = []
+        while number:
+            number, digit = divmod(number, len(PROGRESSIVO_INVIO_CHARS))
+            chars.append(PROGRESSIVO_INVIO_CHARS[digit])
+        name = ''.join(reversed(chars)).rjust(PROGRESSIVO_INVIO_SIZE, '0')
+        if len(name) > PROGRESSIVO_INVIO_SIZE:
+            raise UserError(_(
+                "All the e-invoice file progressive numbers "
+                "have been used."))
+        return name
+
+    @api.model
+    def register(self, vat, file_ids):
+        """Mark `file_ids` as used for `vat`.
+
+        :return: the ids of `file_ids` that were not used yet,
+            in the same order
+        """
+        if not file_ids:
+            return []
+        self.env.cr.execute(
+            'INSERT INTO %s (vat, name) '
+            'SELECT %%s, unnest(%%s) '
+            'ON CONFLICT (vat, name) DO NOTHING '
+            'RETURNING name' % self._table,
+            (vat, list(file_ids)))
+        registered = {row[0] for row in self.env.cr.fetchall()}
+        return [file_id for file_id in file_ids if file_id in registered]
+
+    @api.model
+    def allocate(self, vat, count=1):
+        """Allocate `count` unused progressive numbers for `vat`."""
+        file_ids = []
+        while len(file_ids) < count:
+            self.env.cr.execute(
+                'SELECT nextval(%s) FROM generate_series(1, %s)',
+                (self._sequence_name(), count - len(file_ids)))
+            candidates = [
+                self._format_number(row[0])
+                for row in self.env.cr.fetchall()]
+            # Numbers of files created before the table existed
+            # are registered too: skip them
+            file_ids += self.register(vat, candidates)
+        return file_ids
@@ -3,11 +3,19 @@
 # Copyright 2018-2019 Alex Comba - Agile Business Group
 
 import base64
+import glob
+import os
 import re
 
+from lxml import etree
 from psycopg2 import IntegrityError
 
+from odoo.modules.module import get_module_resource
 from odoo.tools import mute_logger
+from odoo.addons.l10n_it_fatturapa.bindings.fatturapa import (
+    CreateFromDocument, ToXMLWithLxml)
+from odoo.addons.l10n_it_fatturapa_out.wizard.wizard_export_fatturapa import \
+    FatturapaBDSPool, fatturapa_bds_pool
 from .fatturapa_common import FatturaPACommon
 
 
@@ -599,6 +607,111 @@ class TestFatturaPAXMLValidation(FatturaPACommon):
         xml_content = base64.decodebytes(attachment.datas)
         self.check_content(xml_content, 'IT06363391001_00013.xml')
 
+    def test_14_xml_export_lxml_writer(self):
+        self.env['ir.config_parameter'].set_param(
+            'fatturapa.out.lxml.writer', 'True')
+        self.set_sequences(14, '2020-01-07')
+        invoice = self.invoice_model.create({
+            'date_invoice': '2020-01-07',
+            'partner_id': self.res_partner_fatturapa_5.id,
+            'journal_id': self.sales_journal.id,
+            'account_id': self.a_recv.id,
+            'payment_term_id': self.account_payment_term.id,
+            'user_id': self.user_demo.id,
+            'type': 'out_invoice',
+            'currency_id': self.EUR.id,
+            'invoice_line_ids': [
+                (0, 0, {
+                    'account_id': self.a_sale.id,
+                    'product_id': self.product_product_10.id,
+                    'name': 'Mouse Optical',
+                    'quantity': 1,
+                    'uom_id': self.product_uom_unit.id,
+                    'price_unit': 10,
+                    'invoice_line_tax_ids': [(6, 0, {
+                        self.tax_22.id})]
+                })],
+        })
+        invoice.action_invoice_open()
+        res = self.run_wizard(invoice.id)
+        self.env['ir.config_parameter'].set_param(
+            'fatturapa.out.lxml.writer', 'False')
+        attachment = self.attach_model.browse(res['res_id'])
+        xml_content = base64.decodebytes(attachment.datas)
+        self.assertTrue(xml_content.startswith(
+            b'<?xml version="1.0" encoding="UTF-8"?>'))
+        xml = etree.fromstring(xml_content)
+        self.assertEqual(
+            xml.find('.//DatiGeneraliDocumento/Numero').text, invoice.number)
+        self.assertEqual(
+            xml.find('.//DatiRiepilogo/Imposta').text, '2.20')
+
+    def test_bds_pool(self):
+        pool = FatturapaBDSPool(size=1)
+        with pool.bds() as bds:
+            with pool.bds() as other_bds:
+                self.assertIsNot(bds, other_bds)
+        # Only one instance is kept
+        with pool.bds() as reused_bds:
+            self.assertIn(reused_bds, (bds, other_bds))
+            with pool.bds() as new_bds:
+                self.assertNotIn(new_bds, (bds, other_bds))
+
+    def test_progressivo_invio_allocation(self):
+        progressivo_model = self.env['fatturapa.progressivo.invio']
+        vat = self.attach_model.get_file_vat()
+        file_ids = progressivo_model.allocate(vat, count=3)
+        self.assertEqual(len(set(file_ids)), 3)
+        for file_id in file_ids:
+            self.assertTrue(re.match('^[0-9A-Z]{5}$', file_id))
+        # Numbers used by existing files are skipped
+        self.assertEqual(progressivo_model.register(vat, file_ids), [])
+        self.assertEqual(
+            progressivo_model.register('IT00000000000', file_ids), file_ids)
+
+        e_invoice = self._create_e_invoice()
+        file_id = e_invoice.att_name.split('_')[1].split('.')[0]
+        self.assertFalse(progressivo_model.register(vat, [file_id]))
+
+    def test_get_by_file_name(self):
+        e_invoice = self._create_e_invoice()
+        self.set_e_invoice_file_id(e_invoice, 'IT06363391001_00020.xml')
+        self.assertEqual(e_invoice.file_name_key, 'IT06363391001_00020')
+        for file_name in (
+            'IT06363391001_00020.xml',
+            'IT06363391001_00020.xml.p7m',
+            'IT06363391001_00020.XML.P7M',
+        ):
+            self.assertEqual(
+                self.attach_model.get_by_file_name(file_name), e_invoice)
+        self.assertFalse(
+            self.attach_model.get_by_file_name('IT06363391001_00021.xml'))
+        self.assertTrue(self.attach_model.file_name_exists('00020'))
+
+    def test_15_lxml_writer_same_as_pyxb(self):
+        """Both backends write the same XML, once parsed:
+        only the order of the root attributes
+        and the form of empty elements can differ"""
+        def parsed(xml_string):
+            element = etree.fromstring(xml_string)
+            return [
+                (e.tag, dict(e.attrib), e.text or '', e.tail or '')
+                for e in element.iter()]
+
+        data_dir = get_module_resource(
+            'l10n_it_fatturapa_out', 'tests', 'data')
+        file_paths = glob.glob(os.path.join(data_dir, '*.xml'))
+        self.assertTrue(file_paths)
+        for file_path in file_paths:
+            with open(file_path, 'rb') as xml_file:
+                fatturapa = CreateFromDocument(xml_file.read())
+            with fatturapa_bds_pool.bds() as bds:
+                pyxb_xml = fatturapa.toxml(encoding="UTF-8", bds=bds)
+            lxml_xml = ToXMLWithLxml(fatturapa)
+            self.assertEqual(
+                parsed(pyxb_xml), parsed(lxml_xml),
+                os.path.basename(file_path))
+
     def test_unlink(self):
         e_invoice = self._create_e_invoice()
         e_invoice.unlink()
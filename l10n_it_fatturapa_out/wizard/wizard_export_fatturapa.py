@@ -8,9 +8,11 @@
 import base64
 import logging
 import os
-import string
-import random
 import itertools
+import threading
+from contextlib import contextmanager
+
+from lxml import etree
 
 from odoo import api, fields, models
 from odoo.tools.translate import _
@@ -48,13 +50,20 @@ from odoo.addons.l10n_it_fatturapa.bindings.fatturapa import (
     AllegatiType,
     ScontoMaggiorazioneType,
     CodiceArticoloType,
-    AltriDatiGestionaliType
+    AltriDatiGestionaliType,
+    ToXMLWithLxml,
 )
 from odoo.addons.l10n_it_fatturapa.models.account import (
     RELATED_DOCUMENT_TYPES)
 
 _logger = logging.getLogger(__name__)
 
+# Number of export files created at once
+EXPORT_CREATE_CHUNK_SIZE = 100
+
+# Number of idle FatturapaBDS instances kept for reuse
+BDS_POOL_SIZE = 4
+
 try:
     from pyxb.utils import domutils
     from pyxb.binding.datatypes import decimal as pyxb_decimal
@@ -64,13 +73,6 @@ except ImportError as err:
     _logger.debug(err)
 
 
-def id_generator(
-    size=5, chars=string.ascii_uppercase + string.digits +
-    string.ascii_lowercase
-):
-    return ''.join(random.choice(chars) for dummy in range(size))
-
-
 class FatturapaBDS(domutils.BindingDOMSupport):
 
     def valueAsText(self, value, enable_default_namespace=True):
@@ -84,6 +86,33 @@ class FatturapaBDS(domutils.BindingDOMSupport):
             .valueAsText(value, enable_default_namespace)
 
 
+class FatturapaBDSPool(object):
+    """Pool of FatturapaBDS instances.
+
+    A FatturapaBDS keeps the namespaces of the document being serialized,
+    so each instance must only be used by one serialization at a time."""
+
+    def __init__(self, size=BDS_POOL_SIZE):
+        self._size = size
+        self._lock = threading.Lock()
+        self._idle = [FatturapaBDS() for dummy in range(size)]
+
+    @contextmanager
+    def bds(self):
+        with self._lock:
+            bds = self._idle.pop() if self._idle else FatturapaBDS()
+        try:
+            yield bds
+        finally:
+            bds.reset()
+            with self._lock:
+                if len(self._idle) < self._size:
+                    self._idle.append(bds)
+
+
+fatturapa_bds_pool = FatturapaBDSPool()
+
+# Shared by every thread: use fatturapa_bds_pool instead
 fatturapaBDS = FatturapaBDS()
 
 
@@ -103,21 +132,52 @@ class WizardExportFatturapa(models.TransientModel):
         domain=_domain_ir_values,
         help='This report will be automatically included in the created XML')
 
-    def saveAttachment(self, fatturapa, number):
-        attach_obj = self.env['fatturapa.attachment.out']
-        vat = attach_obj.get_file_vat()
-
-        attach_str = fatturapa.toxml(
-            encoding="UTF-8",
-            bds=fatturapaBDS,
-        )
-        fatturapaBDS.reset()
-        attach_vals = {
+    def _use_lxml_writer(self):
+        param = self.env['ir.config_parameter'].sudo().get_param(
+            'fatturapa.out.lxml.writer', 'False')
+        return param.lower() in ('1', 'true')
+
+    def _fatturapa_to_xml(self, fatturapa):
+        if self._use_lxml_writer():
+            try:
+                return ToXMLWithLxml(fatturapa)
+            except etree.DocumentInvalid as e:
+                raise UserError(
+                    _("E-invoice XML is not valid:\n%s") % e)
+        with fatturapa_bds_pool.bds() as bds:
+            return fatturapa.toxml(
+                encoding="UTF-8",
+                bds=bds,
+            )
+
+    def _prepare_attachment_vals(self, fatturapa, number, vat=None):
+        if vat is None:
+            vat = self.env['fatturapa.attachment.out'].get_file_vat()
+        attach_str = self._fatturapa_to_xml(fatturapa)
+        return {
             'name': '%s_%s.xml' % (vat, number),
             'datas_fname': '%s_%s.xml' % (vat, number),
             'datas': base64.encodestring(attach_str),
         }
-        return attach_obj.create(attach_vals)
+
+    def saveAttachment(self, fatturapa, number):
+        attach_obj = self.env['fatturapa.attachment.out']
+        return attach_obj.create(
+            self._prepare_attachment_vals(fatturapa, number))
+
+    def _create_attachments(self, attachments_data):
+        """Create the export files and link them to their invoices.
+
+        :param attachments_data: list of
+            (values of the export file, invoices in the file)
+        :return: the created export files
+        """
+        attachments = self.env['fatturapa.attachment.out'].create(
+            [attach_vals for attach_vals, invoices in attachments_data])
+        for attach, (attach_vals, invoices) in zip(
+                attachments, attachments_data):
+            invoices.write({'fatturapa_attachment_out_id': attach.id})
+        return attachments
 
     def setProgressivoInvio(self, fatturapa, attach=False):
         # if the attachment is given than we will reuse its file_id
@@ -126,10 +186,14 @@ class WizardExportFatturapa(models.TransientModel):
             # to get XXXXX
             file_id = attach.name.split('_')[1].split('.')[0]
         else:
-            file_id = id_generator()
-            Attachment = self.env['fatturapa.attachment.out']
-            while Attachment.file_name_exists(file_id):
-                file_id = id_generator()
+            # Numbers can be allocated in advance for the whole export
+            file_ids = self.env.context.get('fatturapa_file_ids')
+            if file_ids:
+                file_id = file_ids.pop(0)
+            else:
+                vat = self.env['fatturapa.attachment.out'].get_file_vat()
+                file_id = self.env['fatturapa.progressivo.invio'].sudo(
+                ).allocate(vat)[0]
 
         try:
             fatturapa.FatturaElettronicaHeader.DatiTrasmissione.\
@@ -895,8 +959,8 @@ class WizardExportFatturapa(models.TransientModel):
         try:
             self.with_context(context). \
                 setFatturaElettronicaHeader(company, partner, fatturapa)
-            for invoice_id in invoice_ids:
-                inv = invoice_obj.with_context(context).browse(invoice_id)
+            # Browse the invoices together, so that their data is prefetched
+            for inv in invoice_obj.with_context(context).browse(invoice_ids):
                 if inv.type not in ["out_invoice", "out_refund"]:
                     raise UserError(
                         _("Impossible to generate XML: not a customer invoice"))
@@ -926,7 +990,16 @@ class WizardExportFatturapa(models.TransientModel):
         attachments = self.env['fatturapa.attachment.out']
         invoices_by_partner = self.group_invoices_by_partner()
         company = self.env.user.company_id
-
+        vat = attachments.get_file_vat()
+        self = self.with_context(
+            fatturapa_file_ids=self.env[
+                'fatturapa.progressivo.invio'
+            ].sudo().allocate(vat, count=sum(
+                len(groups) for groups in invoices_by_partner.values())))
+
+        # Each XML tree is serialized as soon as it is built,
+        # export files are created in chunks
+        attachments_data = []
         for partner in invoices_by_partner:
             context_partner = self.env.context.copy()
             context_partner.update({'lang': partner.lang})
@@ -934,12 +1007,15 @@ class WizardExportFatturapa(models.TransientModel):
                 fatturapa, number = self.exportInvoiceXML(
                     company, partner, invoice_ids, context=context_partner)
 
-                attach = self.saveAttachment(fatturapa, number)
-                attachments |= attach
-
-                for invoice_id in invoice_ids:
-                    inv = invoice_obj.browse(invoice_id)
-                    inv.write({'fatturapa_attachment_out_id': attach.id})
+                attachments_data.append((
+                    self._prepare_attachment_vals(fatturapa, number, vat=vat),
+                    invoice_obj.browse(invoice_ids),
+                ))
+                if len(attachments_data) >= EXPORT_CREATE_CHUNK_SIZE:
+                    attachments |= self._create_attachments(attachments_data)
+                    attachments_data = []
+        if attachments_data:
+            attachments |= self._create_attachments(attachments_data)
 
         action = {
             'view_type': 'form',
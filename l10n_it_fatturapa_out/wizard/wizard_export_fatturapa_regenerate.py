@@ -8,10 +8,6 @@ import logging
 from odoo import models, _
 from odoo.exceptions import ValidationError
 
-from odoo.addons.l10n_it_fatturapa_out.wizard.wizard_export_fatturapa import (
-    fatturapaBDS
-)
-
 _logger = logging.getLogger(__name__)
 
 
@@ -19,11 +15,7 @@ class WizardExportFatturapa(models.TransientModel):
     _inherit = "wizard.export.fatturapa"
 
     def updateAttachment(self, attach, fatturapa):
-        attach_str = fatturapa.toxml(
-            encoding="UTF-8",
-            bds=fatturapaBDS,
-        )
-        fatturapaBDS.reset()
+        attach_str = self._fatturapa_to_xml(fatturapa)
         attach.write({
             'datas': base64.encodestring(attach_str),
             'state': 'ready',
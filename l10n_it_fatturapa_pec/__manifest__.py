@@ -8,7 +8,7 @@
 
 {
     'name': 'ITA - Fattura elettronica - Supporto PEC',
-    'version': '12.0.1.9.2',
+    'version': '12.0.1.10.1',
     'category': 'Localization/Italy',
     'summary': 'Invio fatture elettroniche tramite PEC',
     'author': 'Openforce Srls Unipersonale, Odoo Community Association (OCA)',
@@ -28,6 +28,7 @@
         'views/fetchmail_view.xml',
         'security/ir.model.access.csv',
         'data/fetchmail_data.xml',
+        'data/ir_cron.xml',
         'views/company_view.xml',
     ],
     'installable': True
@@ -5,12 +5,13 @@
 
 import logging
 import re
+import smtplib
+import threading
 
 from lxml import etree
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
-from odoo.addons.base.models.ir_mail_server import MailDeliveryException
 
 _logger = logging.getLogger(__name__)
 
@@ -25,6 +26,10 @@ class FatturaPAAttachmentOut(models.Model):
         string='Last Response from Exchange System', default='No response yet',
         readonly=True)
     sending_user = fields.Many2one("res.users", "Sending User", readonly=True)
+    pec_send_queued = fields.Boolean(
+        "Queued for PEC sending", readonly=True, copy=False, index=True,
+        help="The file will be sent by the scheduled action, "
+             "respecting the sending rate of the PEC provider")
 
     @api.model
     def _check_fetchmail(self):
@@ -36,10 +41,20 @@ class FatturaPAAttachmentOut(models.Model):
             raise UserError(_(
                 "No incoming PEC server found. Please configure it."))
 
+    @api.model
+    def _get_pec_send_rate(self):
+        """Maximum number of files to be sent per minute, 0 for no limit"""
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'fatturapa.pec.send.rate', 0))
+
     @api.multi
-    def send_via_pec(self):
+    def _check_pec_sending(self):
         self._check_fetchmail()
         self.env.user.company_id.sdi_channel_id.check_first_pec_sending()
+
+    @api.multi
+    def send_via_pec(self):
+        self._check_pec_sending()
         states = self.mapped('state')
         if set(states) != set(['ready']):
             raise UserError(
@@ -48,45 +63,141 @@ class FatturaPAAttachmentOut(models.Model):
         for att in self:
             if not att.datas or not att.datas_fname:
                 raise UserError(_("File content and file name are mandatory"))
-            mail_message = self.env['mail.message'].create({
-                'model': self._name,
-                'res_id': att.id,
-                'subject': att.name,
-                'body': 'XML file for FatturaPA {} sent to Exchange System to '
-                        'the email address {}.'
-                .format(
-                    att.name,
-                    self.env.user.company_id.email_exchange_system),
-                'attachment_ids': [(6, 0, att.ir_attachment_id.ids)],
-                'email_from': (
-                    self.env.user.company_id.email_from_for_fatturaPA),
-                'reply_to': (
-                    self.env.user.company_id.email_from_for_fatturaPA),
-                'mail_server_id': self.env.user.company_id.sdi_channel_id.
-                pec_server_id.id,
+        if self._get_pec_send_rate() > 0:
+            # Sent by the scheduled action, so that waiting for the
+            # PEC provider does not keep the request open
+            self.write({
+                'pec_send_queued': True,
+                'sending_user': self.env.user.id,
             })
+        else:
+            self._send_pec_files()
+
+    @api.multi
+    def _create_pec_mail(self, mail_server):
+        self.ensure_one()
+        company = self.env.user.company_id
+        mail_message = self.env['mail.message'].create({
+            'model': self._name,
+            'res_id': self.id,
+            'subject': self.name,
+            'body': 'XML file for FatturaPA {} sent to Exchange System to '
+                    'the email address {}.'
+            .format(
+                self.name,
+                company.email_exchange_system),
+            'attachment_ids': [(6, 0, self.ir_attachment_id.ids)],
+            'email_from': company.email_from_for_fatturaPA,
+            'reply_to': company.email_from_for_fatturaPA,
+            'mail_server_id': mail_server.id,
+        })
+        return self.env['mail.mail'].create({
+            'mail_message_id': mail_message.id,
+            'body_html': mail_message.body,
+            'email_to': company.email_exchange_system,
+            'headers': {
+                'Return-Path': company.email_from_for_fatturaPA
+            }
+        })
 
-            mail = self.env['mail.mail'].create({
-                'mail_message_id': mail_message.id,
-                'body_html': mail_message.body,
-                'email_to': self.env.user.company_id.email_exchange_system,
-                'headers': {
-                    'Return-Path':
-                    self.env.user.company_id.email_from_for_fatturaPA
-                }
+    def _commit_progress(self):
+        # Tests run in a single transaction that must not be committed
+        if not getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    @api.multi
+    def _update_after_pec_sending(self, mail, channel):
+        self.ensure_one()
+        if mail.state == 'exception':
+            mail.body = mail.failure_reason
+            self.write({
+                'state': 'sender_error',
+                'pec_send_queued': False,
             })
+        else:
+            self.write({
+                'state': 'sent',
+                'pec_send_queued': False,
+                'sending_date': fields.Datetime.now(),
+                'sending_user': self.env.user.id,
+            })
+            channel.update_after_first_pec_sending()
+
+    @api.multi
+    def _send_pec_files(self, commit=False):
+        """Send the files through one connection to the PEC server,
+        writing the state of each file as soon as its mail is sent.
 
-            if mail:
-                try:
-                    mail.send(raise_exception=True)
-                    att.state = 'sent'
-                    att.sending_date = fields.Datetime.now()
-                    att.sending_user = self.env.user.id
-                    self.env.user.company_id.sdi_channel_id.\
-                        update_after_first_pec_sending()
-                except MailDeliveryException as e:
-                    att.state = 'sender_error'
-                    mail.body = str(e)
+        The mail of each file is created right before sending it:
+        an outgoing mail committed before being sent
+        would also be sent by the mail queue.
+
+        :param commit: commit after each file, so that files already
+            delivered to the PEC server are never sent again
+        """
+        channel = self.env.user.company_id.sdi_channel_id
+        mail_server = channel.pec_server_id
+        smtp_session = None
+        connection_error = None
+        try:
+            for att in self:
+                mail = att._create_pec_mail(mail_server)
+                if smtp_session is None and connection_error is None:
+                    try:
+                        smtp_session = self.env['ir.mail_server'].connect(
+                            mail_server_id=mail_server.id)
+                    except Exception as e:
+                        _logger.info(
+                            "Connection to PEC server %s failed",
+                            mail_server.name, exc_info=True)
+                        connection_error = str(e)
+                if connection_error is not None:
+                    mail.write({
+                        'state': 'exception',
+                        'failure_reason': connection_error,
+                    })
+                else:
+                    try:
+                        mail._send(
+                            raise_exception=False,
+                            smtp_session=smtp_session)
+                    except smtplib.SMTPServerDisconnected as e:
+                        # The provider closed the session:
+                        # following mails are sent through a new one
+                        mail.write({
+                            'state': 'exception',
+                            'failure_reason': str(e),
+                        })
+                        smtp_session = None
+                att._update_after_pec_sending(mail, channel)
+                if commit:
+                    self._commit_progress()
+        finally:
+            if smtp_session:
+                smtp_session.quit()
+
+    @api.model
+    def cron_send_queued_pec(self):
+        """Send the queued files, no more than the sending rate
+        of the PEC provider: files left in queue are sent by the next run,
+        one minute later."""
+        rate = self._get_pec_send_rate()
+        atts = self.search([
+            ('pec_send_queued', '=', True),
+            ('state', '=', 'ready'),
+        ], order='id', limit=rate or None)
+        for user in atts.mapped('sending_user'):
+            user_atts = atts.filtered(
+                lambda a: a.sending_user == user).sudo(user)
+            try:
+                user_atts._check_pec_sending()
+            except UserError as e:
+                _logger.info(
+                    "Queued e-invoice files of user %s can't be sent: %s",
+                    user.name, e.name)
+                continue
+            user_atts._send_pec_files(commit=True)
+        return True
 
     @api.multi
     def parse_pec_response(self, message_dict):
@@ -109,10 +220,7 @@ class FatturaPAAttachmentOut(models.Model):
 
             if file_name is not None:
                 file_name = file_name.text
-                fatturapa_attachment_out = self.search(
-                    ['|',
-                     ('datas_fname', '=', file_name),
-                     ('datas_fname', '=', file_name.replace('.p7m', ''))])
+                fatturapa_attachment_out = self.get_by_file_name(file_name)
                 if len(fatturapa_attachment_out) > 1:
                     _logger.info('More than 1 out invoice found for incoming'
                                  'message')
@@ -2,10 +2,17 @@
 # Copyright 2018 Lorenzo Battistini <https://github.com/eLBati>
 
 import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from odoo import models, api, fields, _
 
 _logger = logging.getLogger(__name__)
 MAX_POP_MESSAGES = 50
+IMAP_FETCH_BATCH_SIZE = 50
+DEFAULT_PEC_WORKERS = 4
+IMAP_UID_RE = re.compile(br'UID (\d+)')
 
 
 class Fetchmail(models.Model):
@@ -26,114 +33,182 @@ class Fetchmail(models.Model):
 
     @api.multi
     def fetch_mail(self):
-        for server in self:
-            if not server.is_fatturapa_pec:
-                super(Fetchmail, server).fetch_mail()
-            else:
-                additional_context = {
-                    'fetchmail_cron_running': True
-                }
-                # Setting fetchmail_cron_running to avoid to disable cron while
-                # cron is running (otherwise it would be done by setting
-                # server.state = 'draft',
-                # see _update_cron method)
-                server = server.with_context(**additional_context)
-                MailThread = self.env['mail.thread']
-                _logger.info(
-                    'start checking for new e-invoices on %s server %s',
-                    server.type, server.name)
-                additional_context['fetchmail_server_id'] = server.id
-                additional_context['server_type'] = server.type
-                imap_server = None
-                pop_server = None
-                error_messages = list()
-                if server.type == 'imap':
-                    try:
-                        imap_server = server.connect()
-                        imap_server.select()
-                        result, data = imap_server.search(None, '(UNSEEN)')
-                        for num in data[0].split():
-                            result, data = imap_server.fetch(num, '(RFC822)')
-                            imap_server.store(num, '-FLAGS', '\\Seen')
-                            try:
-                                MailThread.with_context(
-                                    **additional_context
-                                ).message_process(
-                                    server.object_id.model, data[0][1],
-                                    save_original=server.original,
-                                    strip_attachments=(not server.attach)
-                                )
-                                # if message is processed without exceptions
-                                server.last_pec_error_message = ''
-                            except Exception as e:
-                                server.manage_pec_failure(e, error_messages)
-                                continue
-                            imap_server.store(num, '+FLAGS', '\\Seen')
-                            # We need to commit because message is processed:
-                            # Possible next exceptions, out of try, should not
-                            # rollback processed messages
-                            self._cr.commit()  # pylint: disable=invalid-commit
-                    except Exception as e:
-                        server.manage_pec_failure(e, error_messages)
-                    finally:
-                        if imap_server:
-                            imap_server.close()
-                            imap_server.logout()
-                elif server.type == 'pop':
-                    try:
-                        while True:
-                            pop_server = server.connect()
-                            (num_messages, total_size) = pop_server.stat()
-                            pop_server.list()
-                            for num in range(
-                                    1, min(MAX_POP_MESSAGES, num_messages) + 1
-                            ):
-                                (header, messages, octets) = pop_server.retr(
-                                    num)
-                                message = '\n'.join(messages)
-                                try:
-                                    MailThread.with_context(
-                                        **additional_context
-                                    ).message_process(
-                                        server.object_id.model, message,
-                                        save_original=server.original,
-                                        strip_attachments=(not server.attach)
-                                    )
-                                    pop_server.dele(num)
-                                    # See the comments in the IMAP part
-                                    server.last_pec_error_message = ''
-                                except Exception as e:
-                                    server.manage_pec_failure(
-                                        e, error_messages)
-                                    continue
-                                # pylint: disable=invalid-commit
-                                self._cr.commit()
-                            if num_messages < MAX_POP_MESSAGES:
-                                break
-                            pop_server.quit()
-                    except Exception as e:
-                        server.manage_pec_failure(e, error_messages)
-                    finally:
-                        if pop_server:
-                            pop_server.quit()
-                if error_messages:
-                    server.notify_or_log(error_messages)
-                    server.pec_error_count += 1
-                    max_retry = self.env['ir.config_parameter'].get_param(
-                        'fetchmail.pec.max.retry')
-                    if server.pec_error_count > int(max_retry):
-                        # Setting to draft prevents new e-invoices to
-                        # be sent via PEC.
-                        # Resetting server state only after N fails.
-                        # So that the system can try to fetch again after
-                        # temporary connection errors
-                        server.state = 'draft'
-                        server.notify_about_server_reset()
-                else:
-                    server.pec_error_count = 0
-            server.write({'date': fields.Datetime.now()})
+        pec_servers = self.filtered('is_fatturapa_pec')
+        for server in self - pec_servers:
+            super(Fetchmail, server).fetch_mail()
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'fetchmail.pec.workers', DEFAULT_PEC_WORKERS))
+        if (
+            len(pec_servers) < 2 or workers < 2 or
+            # Tests run in a single transaction
+            getattr(threading.currentThread(), 'testing', False)
+        ):
+            for server in pec_servers:
+                server._fetch_pec_mail()
+        else:
+            # Each server is fetched by a worker, in its own transaction
+            with ThreadPoolExecutor(
+                    max_workers=min(workers, len(pec_servers))) as executor:
+                for server_id in pec_servers.ids:
+                    executor.submit(self._fetch_pec_mail_new_cursor, server_id)
+            pec_servers.invalidate_cache()
         return True
 
+    def _fetch_pec_mail_new_cursor(self, server_id):
+        with api.Environment.manage():
+            with self.pool.cursor() as cr:
+                env = api.Environment(cr, self.env.uid, self.env.context)
+                try:
+                    env['fetchmail.server'].browse(server_id)._fetch_pec_mail()
+                except Exception:
+                    _logger.exception(
+                        "Failure when fetching e-invoices "
+                        "using server %s", server_id)
+                    cr.rollback()
+
+    @api.multi
+    def _fetch_pec_mail(self):
+        self.ensure_one()
+        additional_context = {
+            'fetchmail_cron_running': True
+        }
+        # Setting fetchmail_cron_running to avoid to disable cron while
+        # cron is running (otherwise it would be done by setting
+        # server.state = 'draft',
+        # see _update_cron method)
+        server = self.with_context(**additional_context)
+        _logger.info(
+            'start checking for new e-invoices on %s server %s',
+            server.type, server.name)
+        additional_context['fetchmail_server_id'] = server.id
+        additional_context['server_type'] = server.type
+        error_messages = list()
+        if server.type == 'imap':
+            server._fetch_pec_imap(additional_context, error_messages)
+        elif server.type == 'pop':
+            server._fetch_pec_pop(additional_context, error_messages)
+        if error_messages:
+            server.notify_or_log(error_messages)
+            server.pec_error_count += 1
+            max_retry = self.env['ir.config_parameter'].get_param(
+                'fetchmail.pec.max.retry')
+            if server.pec_error_count > int(max_retry):
+                # Setting to draft prevents new e-invoices to
+                # be sent via PEC.
+                # Resetting server state only after N fails.
+                # So that the system can try to fetch again after
+                # temporary connection errors
+                server.state = 'draft'
+                server.notify_about_server_reset()
+        else:
+            server.pec_error_count = 0
+        server.write({'date': fields.Datetime.now()})
+
+    @api.multi
+    def _process_pec_message(self, message, additional_context,
+                             error_messages):
+        """Process `message` in a savepoint, so that a failure only
+        rolls back what has been done for this message.
+
+        :return: True if the message has been processed
+        """
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                self.env['mail.thread'].with_context(
+                    **additional_context
+                ).message_process(
+                    self.object_id.model, message,
+                    save_original=self.original,
+                    strip_attachments=(not self.attach)
+                )
+        except Exception as e:
+            # The cache could contain values that have been rolled back
+            self.env.clear()
+            self.manage_pec_failure(e, error_messages)
+            return False
+        # if message is processed without exceptions
+        self.last_pec_error_message = ''
+        return True
+
+    @staticmethod
+    def _parse_imap_fetch(data):
+        """Extract (uid, message) pairs from the response
+        of a UID FETCH command."""
+        messages = []
+        for item in data:
+            if isinstance(item, tuple):
+                messages.append([IMAP_UID_RE.search(item[0]), item[1]])
+            elif item and messages and messages[-1][0] is None:
+                # Some servers send the UID after the message body
+                messages[-1][0] = IMAP_UID_RE.search(item)
+        return [
+            (match.group(1).decode(), message)
+            for match, message in messages if match]
+
+    @api.multi
+    def _fetch_pec_imap(self, additional_context, error_messages):
+        self.ensure_one()
+        imap_server = None
+        try:
+            imap_server = self.connect()
+            imap_server.select()
+            result, data = imap_server.uid('search', None, '(UNSEEN)')
+            uids = data[0].split()
+            for index in range(0, len(uids), IMAP_FETCH_BATCH_SIZE):
+                batch_uids = b','.join(
+                    uids[index:index + IMAP_FETCH_BATCH_SIZE]).decode()
+                # BODY.PEEK does not set the \Seen flag:
+                # only processed messages are flagged
+                result, data = imap_server.uid(
+                    'fetch', batch_uids, '(UID BODY.PEEK[])')
+                processed_uids = [
+                    uid for uid, message in self._parse_imap_fetch(data)
+                    if self._process_pec_message(
+                        message, additional_context, error_messages)]
+                if processed_uids:
+                    imap_server.uid(
+                        'store', ','.join(processed_uids),
+                        '+FLAGS', '\\Seen')
+                # We need to commit because messages are processed:
+                # Possible next exceptions should not
+                # rollback processed messages
+                self._cr.commit()  # pylint: disable=invalid-commit
+        except Exception as e:
+            self.manage_pec_failure(e, error_messages)
+        finally:
+            if imap_server:
+                imap_server.close()
+                imap_server.logout()
+
+    @api.multi
+    def _fetch_pec_pop(self, additional_context, error_messages):
+        self.ensure_one()
+        pop_server = None
+        try:
+            while True:
+                pop_server = self.connect()
+                (num_messages, total_size) = pop_server.stat()
+                pop_server.list()
+                for num in range(
+                        1, min(MAX_POP_MESSAGES, num_messages) + 1
+                ):
+                    (header, messages, octets) = pop_server.retr(num)
+                    message = '\n'.join(messages)
+                    if self._process_pec_message(
+                            message, additional_context, error_messages):
+                        pop_server.dele(num)
+                # See the comments in the IMAP part
+                self._cr.commit()  # pylint: disable=invalid-commit
+                if num_messages < MAX_POP_MESSAGES:
+                    break
+                pop_server.quit()
+        except Exception as e:
+            self.manage_pec_failure(e, error_messages)
+        finally:
+            if pop_server:
+                pop_server.quit()
+
     @api.multi
     def manage_pec_failure(self, exception, error_messages):
         self.ensure_one()
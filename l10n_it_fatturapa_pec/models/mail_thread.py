@@ -5,12 +5,12 @@
 
 import logging
 import re
-import base64
 import zipfile
-import io
 
 from odoo import api, models, _
 from odoo.exceptions import UserError
+from odoo.addons.l10n_it_fatturapa.models.e_invoice_file import (
+    get_file_name_key)
 
 _logger = logging.getLogger(__name__)
 
@@ -139,36 +139,16 @@ class MailThread(models.AbstractModel):
 
     def find_attachment_by_subject(self, subject):
         attachment_out_model = self.env['fatturapa.attachment.out']
-        if 'CONSEGNA: ' in subject:
-            att_name = subject.replace('CONSEGNA: ', '')
-            fatturapa_attachment_out = attachment_out_model \
-                .search([
-                    ('datas_fname', '=', att_name)
-                ])
-            if not fatturapa_attachment_out:
-                fatturapa_attachment_out = attachment_out_model \
-                    .search([
-                        ('name', '=', att_name)
-                    ])
-            if len(fatturapa_attachment_out) == 1:
-                return fatturapa_attachment_out
-        if 'ACCETTAZIONE: ' in subject:
-            att_name = subject.replace('ACCETTAZIONE: ', '')
-            fatturapa_attachment_out = attachment_out_model \
-                .search([
-                    ('datas_fname', '=', att_name)
-                ])
-            if not fatturapa_attachment_out:
-                fatturapa_attachment_out = attachment_out_model \
-                    .search([
-                        ('name', '=', att_name)
-                    ])
-            if len(fatturapa_attachment_out) == 1:
-                return fatturapa_attachment_out
+        for prefix in ('CONSEGNA: ', 'ACCETTAZIONE: '):
+            if prefix in subject:
+                att_name = subject.replace(prefix, '')
+                fatturapa_attachment_out = \
+                    attachment_out_model.get_by_file_name(att_name)
+                if len(fatturapa_attachment_out) == 1:
+                    return fatturapa_attachment_out
         return attachment_out_model.browse()
 
     def create_fatturapa_attachment_in(self, attachment, message_dict=None):
-        decoded = base64.b64decode(attachment.datas)
         fatturapa_attachment_in = self.env['fatturapa.attachment.in']
         fetchmail_server_id = self.env.context.get('fetchmail_server_id')
         received_date = False
@@ -193,28 +173,14 @@ class MailThread(models.AbstractModel):
             fatturapa_attachment_in = fatturapa_attachment_in.sudo(
                 e_invoice_user_id)
         if attachment.mimetype == 'application/zip':
-            with zipfile.ZipFile(io.BytesIO(decoded)) as zf:
-                for file_name in zf.namelist():
-                    inv_file = zf.open(file_name)
-                    if fatturapa_regex.match(file_name):
-                        # check if this invoice is already
-                        # in other fatturapa.attachment.in
-                        fatturapa_atts = fatturapa_attachment_in.search([
-                            ('name', '=', file_name)])
-                        if fatturapa_atts:
-                            _logger.info("In invoice %s already processed"
-                                         % fatturapa_atts.mapped('name'))
-                        else:
-                            fatturapa_attachment_in.create({
-                                'name': file_name,
-                                'datas_fname': file_name,
-                                'datas': base64.encodestring(inv_file.read()),
-                                'company_id': company_id,
-                                'e_invoice_received_date': received_date,
-                            })
+            self._create_fatturapa_attachment_in_from_zip(
+                fatturapa_attachment_in, attachment, {
+                    'company_id': company_id,
+                    'e_invoice_received_date': received_date,
+                })
         else:
-            fatturapa_atts = fatturapa_attachment_in.search(
-                [('name', '=', attachment.name)])
+            fatturapa_atts = fatturapa_attachment_in.get_by_file_name(
+                attachment.name)
             if fatturapa_atts:
                 _logger.info(
                     "Invoice xml already processed in %s"
@@ -225,3 +191,39 @@ class MailThread(models.AbstractModel):
                     'company_id': company_id,
                     'e_invoice_received_date': received_date,
                 })
+
+    def _create_fatturapa_attachment_in_from_zip(
+            self, fatturapa_attachment_in, attachment, values):
+        """Create the e-bills contained in the ZIP `attachment`,
+        unless they have already been received."""
+        ir_attachment = self.env['ir.attachment']
+        vals_list = []
+        file_vals_list = []
+        with attachment.sudo()._open_raw_datas() as archive, \
+                zipfile.ZipFile(archive) as zf:
+            file_names = [
+                file_name for file_name in zf.namelist()
+                if fatturapa_regex.match(file_name)]
+            # check if these invoices are already
+            # in other fatturapa.attachment.in
+            processed_keys = set(fatturapa_attachment_in.get_by_file_name(
+                file_names).mapped('file_name_key'))
+            for file_name in file_names:
+                key = get_file_name_key(file_name)
+                if key in processed_keys:
+                    _logger.info(
+                        "In invoice %s already processed" % file_name)
+                    continue
+                processed_keys.add(key)
+                with zf.open(file_name) as inv_file:
+                    file_vals = ir_attachment._prepare_raw_file_vals(
+                        inv_file)
+                vals = dict(
+                    values, name=file_name, datas_fname=file_name)
+                vals.update(file_vals)
+                vals_list.append(vals)
+                file_vals_list.append(file_vals)
+        fatturapa_atts = fatturapa_attachment_in.create(vals_list)
+        fatturapa_atts.mapped('ir_attachment_id')._write_raw_file_vals(
+            file_vals_list)
+        return fatturapa_atts
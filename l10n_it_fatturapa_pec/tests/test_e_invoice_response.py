@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 # Copyright 2018 Simone Rubino - Agile Business Group
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+import base64
+import io
+import zipfile
+
 from odoo.tools import mute_logger
 from .e_invoice_common import EInvoiceCommon
 from odoo.modules import get_module_resource
@@ -153,3 +157,81 @@ class TestEInvoiceResponse(EInvoiceCommon):
             .with_context(fetchmail_server_id=self.PEC_server.id) \
             .message_process(False, incoming_mail)
         self.assertEqual(e_invoice.state, 'recipient_error')
+
+    def test_process_response_INVIO_imap_batch(self):
+        """Messages are fetched in batches and only the processed ones
+        are flagged as seen"""
+        self.PEC_server.write({'type': 'imap', 'port': 143})
+        incoming_mail = self._get_file(
+            'POSTA CERTIFICATA: Invio File 7339338.txt').encode()
+        broken_mail = self._get_file(
+            'POSTA CERTIFICATA: Invio File 7339338 (broken XML).txt').encode()
+        e_invoices = self.attach_in_model.search([])
+
+        def imap_uid(command, *args):
+            if command == 'search':
+                return 'OK', [b'11 12']
+            if command == 'fetch':
+                return 'OK', [
+                    (b'1 (UID 11 BODY[] {%d}' % len(broken_mail),
+                     broken_mail),
+                    b')',
+                    (b'2 (UID 12 BODY[] {%d}' % len(incoming_mail),
+                     incoming_mail),
+                    b')',
+                ]
+            return 'OK', []
+
+        with mock.patch('odoo.addons.fetchmail.models.fetchmail.IMAP4') \
+                as mock_imap4:
+            instance = mock_imap4.return_value
+            instance.uid.side_effect = imap_uid
+
+            with mute_logger(
+                    'odoo.addons.l10n_it_fatturapa_pec.models.fetchmail'):
+                self.PEC_server.fetch_mail()
+
+        self.assertTrue(self.attach_in_model.search([]) - e_invoices)
+        fetch_calls = [
+            c for c in instance.uid.call_args_list if c[0][0] == 'fetch']
+        self.assertEqual(len(fetch_calls), 1)
+        self.assertEqual(fetch_calls[0][0][1], '11,12')
+        # The broken message is left unseen, to be fetched again
+        instance.uid.assert_any_call('store', '12', '+FLAGS', '\\Seen')
+
+    def test_process_zip_bundle(self):
+        """E-bills in a ZIP bundle are created once,
+        with their content in the filestore"""
+        bundle = io.BytesIO()
+        with zipfile.ZipFile(bundle, 'w') as zf:
+            for file_name in (
+                'IT02780790107_11005.xml',
+                'IT02780790107_11006.xml',
+            ):
+                path = get_module_resource(
+                    'l10n_it_fatturapa_in', 'tests', 'data', file_name)
+                zf.write(path, file_name)
+            zf.writestr('IT02780790107_11005_MT_001.xml', '<metadata/>')
+        attachment = self.env['ir.attachment'].create({
+            'name': 'IT02780790107_bundle.zip',
+            'datas_fname': 'IT02780790107_bundle.zip',
+            'datas': base64.b64encode(bundle.getvalue()),
+            'mimetype': 'application/zip',
+        })
+        mail_thread = self.env['mail.thread'].with_context(
+            fetchmail_server_id=self.PEC_server.id)
+
+        mail_thread.create_fatturapa_attachment_in(attachment)
+        e_invoices = self.attach_in_model.get_by_file_name([
+            'IT02780790107_11005.xml', 'IT02780790107_11006.xml'])
+        self.assertEqual(len(e_invoices), 2)
+        for e_invoice in e_invoices:
+            self.assertTrue(e_invoice.file_size)
+            self.assertTrue(e_invoice.checksum)
+            self.assertTrue(e_invoice.xml_supplier_id)
+
+        # Receiving the bundle again does not duplicate the e-bills
+        mail_thread.create_fatturapa_attachment_in(attachment)
+        self.assertEqual(
+            self.attach_in_model.search_count([
+                ('name', 'like', 'IT02780790107_1100')]), 2)
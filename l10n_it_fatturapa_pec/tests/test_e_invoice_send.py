@@ -5,6 +5,7 @@
 from odoo.exceptions import UserError
 from .e_invoice_common import EInvoiceCommon
 from odoo.tools import mute_logger
+import mock
 
 
 class TestEInvoiceSend(EInvoiceCommon):
@@ -119,3 +120,70 @@ class TestEInvoiceSend(EInvoiceCommon):
         # Send it again
         e_invoice.send_via_pec()
         self.assertEqual(e_invoice.state, 'sent')
+
+    def test_send_bulk(self):
+        """Sending many e-invoices uses one connection"""
+        e_invoices = self._create_e_invoice() | self._create_e_invoice()
+
+        self._create_fetchmail_pec_server()
+        mail_server_class = type(self.env['ir.mail_server'])
+        with mock.patch.object(mail_server_class, 'connect') as mock_connect:
+            e_invoices.send_via_pec()
+        self.assertEqual(mock_connect.call_count, 1)
+        mock_connect.return_value.quit.assert_called_once_with()
+        self.assertEqual(set(e_invoices.mapped('state')), {'sent'})
+
+    def test_send_bulk_mail_queue(self):
+        """Mails of e-invoices are created one at a time,
+        so that the mail queue can't send the ones waiting"""
+        e_invoices = self._create_e_invoice() | self._create_e_invoice()
+
+        self._create_fetchmail_pec_server()
+        mail_class = type(self.env['mail.mail'])
+        mail_server_class = type(self.env['ir.mail_server'])
+        original_send = mail_class._send
+        outgoing_counts = []
+
+        def _send(mail, *args, **kwargs):
+            outgoing_counts.append(self.env['mail.mail'].search_count([
+                ('model', '=', e_invoices._name),
+                ('state', '=', 'outgoing'),
+            ]))
+            return original_send(mail, *args, **kwargs)
+
+        with mock.patch.object(mail_class, '_send', _send), \
+                mock.patch.object(mail_server_class, 'connect'):
+            e_invoices.send_via_pec()
+        self.assertEqual(outgoing_counts, [1, 1])
+        self.assertEqual(set(e_invoices.mapped('state')), {'sent'})
+
+    def test_send_queued(self):
+        """With a sending rate, e-invoices are queued
+        and sent by the scheduled action, respecting the rate"""
+        e_invoices = self._create_e_invoice() | self._create_e_invoice()
+
+        self._create_fetchmail_pec_server()
+        sdi_channel = self.env.user.company_id.sdi_channel_id
+        sdi_channel.first_invoice_sent = True
+        sdi_channel.email_exchange_system = 'sdi01@pec.fatturapa.it'
+        self.env['ir.config_parameter'].set_param(
+            'fatturapa.pec.send.rate', '1')
+        e_invoices.send_via_pec()
+        self.assertEqual(set(e_invoices.mapped('state')), {'ready'})
+        self.assertTrue(all(e_invoices.mapped('pec_send_queued')))
+
+        attachment_model = self.env['fatturapa.attachment.out']
+        mail_server_class = type(self.env['ir.mail_server'])
+        with mock.patch.object(mail_server_class, 'connect') as mock_connect:
+            attachment_model.cron_send_queued_pec()
+        self.assertEqual(mock_connect.call_count, 1)
+        self.assertEqual(e_invoices[0].state, 'sent')
+        self.assertFalse(e_invoices[0].pec_send_queued)
+        self.assertEqual(e_invoices[1].state, 'ready')
+        self.assertTrue(e_invoices[1].pec_send_queued)
+
+        with mock.patch.object(mail_server_class, 'connect'):
+            attachment_model.cron_send_queued_pec()
+        self.assertEqual(set(e_invoices.mapped('state')), {'sent'})
+        self.assertEqual(
+            e_invoices.mapped('sending_user'), self.env.user)
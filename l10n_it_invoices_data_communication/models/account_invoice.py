@@ -1,6 +1,6 @@
 
 
-from odoo import fields, models, _
+from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
 
 
@@ -20,17 +20,43 @@ class AccountInvoice(models.Model):
         vals['ImponibileImporto'] = vals['ImponibileImporto'] / exchange_rate
         vals['Imposta'] = vals['Imposta'] / exchange_rate
 
-    def _get_tax_comunicazione_dati_iva(self):
+    @api.model
+    def _get_parent_taxes_comunicazione_dati_iva(self, taxes):
+        """Parent taxes of `taxes`, by child tax ID"""
+        parent_taxes = {}
+        parents = self.env['account.tax'].search([
+            ('children_tax_ids', 'in', taxes.ids)])
+        for parent in parents:
+            for child in parent.children_tax_ids:
+                parent_taxes[child.id] = parent_taxes.get(
+                    child.id, parents.browse()) | parent
+        return parent_taxes
+
+    @api.multi
+    def _get_tax_comunicazione_dati_iva_by_invoice(self):
+        """VAT summaries of the invoices, by invoice ID.
+        Tax lines and parent taxes are read once for all the invoices."""
+        parent_taxes = self._get_parent_taxes_comunicazione_dati_iva(
+            self.mapped('tax_line_ids.tax_id'))
+        return {
+            fattura.id: fattura._get_tax_comunicazione_dati_iva(
+                parent_taxes=parent_taxes)
+            for fattura in self}
+
+    def _get_tax_comunicazione_dati_iva(self, parent_taxes=None):
         self.ensure_one()
         fattura = self
         tax_model = self.env['account.tax']
+        if parent_taxes is None:
+            parent_taxes = self._get_parent_taxes_comunicazione_dati_iva(
+                fattura.mapped('tax_line_ids.tax_id'))
 
         tax_lines = []
         tax_grouped = {}
         for tax_line in fattura.tax_line_ids:
             tax = tax_line.tax_id
             aliquota = tax.amount
-            parent = tax_model.search([('children_tax_ids', 'in', [tax.id])])
+            parent = parent_taxes.get(tax.id, tax_model)
             if parent:
                 main_tax = parent
                 aliquota = parent.amount
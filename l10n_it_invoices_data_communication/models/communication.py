@@ -1,9 +1,10 @@
 
 
 from odoo import api, fields, models, _
-from odoo.exceptions import ValidationError
+from odoo.exceptions import UserError, ValidationError
 from odoo.addons.l10n_it_account.tools.account_tools import encode_for_export
 from lxml import etree
+import io
 import re
 
 
@@ -13,6 +14,17 @@ NS_MAP = {
     'ns2': NS_2,
 }
 etree.register_namespace("vi", NS_2)
+# Invoices field of the sections of each kind
+SECTION_BODY_FIELDS = {
+    'fatture_emesse_ids': 'fatture_emesse_body_ids',
+    'fatture_ricevute_ids': 'fatture_ricevute_body_ids',
+}
+# Limits of a single file
+MAX_FILE_PARTNERS = 1000
+MAX_PARTNER_INVOICES = 1000
+# Codes of the files of a communication exported in several parts,
+# 'A' is reserved to cancellations
+PART_CODES = '0123456789BCDEFGHIJKLMNOPQRSTUVWXYZ'
 
 
 def format_decimal(value=0.0):
@@ -29,10 +41,18 @@ def clear_xml(xml_root):
     xml_root = etree.iterwalk(xml_root)
     for dummy, xml_element in xml_root:
         parent = xml_element.getparent()
-        if clear_xml_element(xml_element):
+        if parent is not None and clear_xml_element(xml_element):
             parent.remove(xml_element)
 
 
+def write_xml_element(xml_file, element):
+    """Write `element` in the incremental `xml_file`,
+    without its empty nodes"""
+    clear_xml(element)
+    if not clear_xml_element(element):
+        xml_file.write(element, pretty_print=True)
+
+
 def check_normalized_string(value):
     normalized = True
     if not value:
@@ -400,14 +420,65 @@ class ComunicazioneDatiIva(models.Model):
             if comunicazione.dati_trasmissione == 'DTR':
                 comunicazione.compute_fatture_ricevute()
 
+    @api.model
+    def _group_fatture_by_partner(self, fatture):
+        """Invoices of `fatture`, by partner ID"""
+        fatture_ids_by_partner = {}
+        for fattura in fatture:
+            fatture_ids_by_partner.setdefault(
+                fattura.partner_id.id, []).append(fattura.id)
+        return {
+            partner_id: fatture.browse(fatture_ids).with_prefetch(
+                fatture._prefetch)
+            for partner_id, fatture_ids in fatture_ids_by_partner.items()}
+
+    @api.model
+    def _create_in_bulk(self, model_name, vals_list, one2many_names):
+        """Create the records of `vals_list` and, following
+        `one2many_names`, the records of their (0, 0, values) commands,
+        with one create for each model"""
+        model = self.env[model_name]
+        if not one2many_names:
+            return model.create(vals_list)
+        field = model._fields[one2many_names[0]]
+        children_vals_lists = []
+        parent_vals_list = []
+        for vals in vals_list:
+            vals = dict(vals)
+            children_vals_lists.append([
+                command[2] for command in vals.pop(field.name, [])])
+            parent_vals_list.append(vals)
+        records = model.create(parent_vals_list)
+        self._create_in_bulk(field.comodel_name, [
+            dict(child_vals, **{field.inverse_name: record.id})
+            for record, children_vals in zip(records, children_vals_lists)
+            for child_vals in children_vals
+        ], one2many_names[1:])
+        return records
+
+    def _create_sections(self, field_name, dati_fatture):
+        """Create the sections `dati_fatture` of `field_name`,
+        as returned by `_prepare_cessionari_dati_fatture` or
+        `_prepare_cedenti_dati_fatture`"""
+        self.ensure_one()
+        field = self._fields[field_name]
+        body_field_name = SECTION_BODY_FIELDS[field_name]
+        return self._create_in_bulk(field.comodel_name, [
+            dict(vals, **{field.inverse_name: self.id})
+            for dummy, dummy, vals in dati_fatture
+        ], [body_field_name, 'dati_fattura_iva_ids'])
+
     def _prepare_cessionari_dati_fatture(self, fatture_emesse, cessionari):
         dati_fatture = []
         posizione = 0
+        fatture_by_partner = self._group_fatture_by_partner(fatture_emesse)
+        partner_ids = set(cessionari.ids)
+        tax_lines_by_fattura = fatture_emesse.filtered(
+            lambda f: f.partner_id.id in partner_ids
+        )._get_tax_comunicazione_dati_iva_by_invoice()
         for cessionario in cessionari:
-            fatture = fatture_emesse.filtered(
-                lambda fe:
-                fe.partner_id.id ==
-                    cessionario.id)
+            fatture = fatture_by_partner.get(
+                cessionario.id, fatture_emesse.browse())
             vals_fatture = []
             for fattura in fatture:
                 posizione += 1
@@ -420,7 +491,7 @@ class ComunicazioneDatiIva(models.Model):
                     'dati_fattura_Numero': self._parse_fattura_numero(
                         fattura.number),
                     'dati_fattura_iva_ids':
-                        fattura._get_tax_comunicazione_dati_iva()
+                        tax_lines_by_fattura[fattura.id]
                 }
                 val = self._prepare_fattura_emessa(val, fattura)
                 vals_fatture.append((0, 0, val))
@@ -448,7 +519,8 @@ class ComunicazioneDatiIva(models.Model):
             cessionari = fatture_emesse.mapped('partner_id')
             dati_fatture = self._prepare_cessionari_dati_fatture(
                 fatture_emesse, cessionari)
-            self.fatture_emesse_ids = dati_fatture
+            self._create_sections(
+                    'fatture_emesse_ids', dati_fatture)
 
     def _get_fatture_emesse_domain(self):
         domain = [('comunicazione_dati_iva_escludi', '=', True)]
@@ -478,12 +550,15 @@ class ComunicazioneDatiIva(models.Model):
     def _prepare_cedenti_dati_fatture(self, fatture_ricevute, cedenti):
         dati_fatture = []
         posizione = 0
+        fatture_by_partner = self._group_fatture_by_partner(fatture_ricevute)
+        partner_ids = set(cedenti.ids)
+        tax_lines_by_fattura = fatture_ricevute.filtered(
+            lambda f: f.partner_id.id in partner_ids
+        )._get_tax_comunicazione_dati_iva_by_invoice()
         for cedente in cedenti:
             # Fatture
-            fatture = fatture_ricevute.filtered(
-                lambda fr:
-                fr.partner_id.id ==
-                    cedente.id)
+            fatture = fatture_by_partner.get(
+                cedente.id, fatture_ricevute.browse())
             vals_fatture = []
             for fattura in fatture:
                 posizione += 1
@@ -498,7 +573,7 @@ class ComunicazioneDatiIva(models.Model):
                     'dati_fattura_Numero': self._parse_fattura_numero(
                         fattura.reference) or '',
                     'dati_fattura_iva_ids':
-                        fattura._get_tax_comunicazione_dati_iva()
+                        tax_lines_by_fattura[fattura.id]
                 }
                 val = self._prepare_fattura_ricevuta(val, fattura)
                 vals_fatture.append((0, 0, val))
@@ -524,7 +599,8 @@ class ComunicazioneDatiIva(models.Model):
             cedenti = fatture_ricevute.mapped('partner_id')
             dati_fatture = self._prepare_cedenti_dati_fatture(
                 fatture_ricevute, cedenti)
-            self.fatture_ricevute_ids = dati_fatture
+            self._create_sections(
+                    'fatture_ricevute_ids', dati_fatture)
 
     def _get_fatture_ricevute_domain(self):
         domain = [('comunicazione_dati_iva_escludi', '=', True)]
@@ -564,8 +640,8 @@ class ComunicazioneDatiIva(models.Model):
                 fatture_emesse = self.mapped(
                     'fatture_emesse_ids.fatture_emesse_body_ids.invoice_id')
                 cessionari = fatture_emesse.mapped('partner_id')
-                first_set_ids = cessionari.ids[:len(cessionari) / 2]
-                second_set_ids = cessionari.ids[len(cessionari) / 2:]
+                first_set_ids = cessionari.ids[:len(cessionari) // 2]
+                second_set_ids = cessionari.ids[len(cessionari) // 2:]
                 first_set_cessionari = self.env['res.partner'].browse(
                     first_set_ids)
                 second_set_cessionari = self.env['res.partner'].browse(
@@ -573,7 +649,8 @@ class ComunicazioneDatiIva(models.Model):
                 self._unlink_sections()
                 dati_fatture_1 = self._prepare_cessionari_dati_fatture(
                     fatture_emesse, first_set_cessionari)
-                self.fatture_emesse_ids = dati_fatture_1
+                self._create_sections(
+                    'fatture_emesse_ids', dati_fatture_1)
                 self.splitting_note = _(
                     "Splitted considering partners\n%s"
                     % '\n'.join(first_set_cessionari.mapped('name')))
@@ -581,7 +658,8 @@ class ComunicazioneDatiIva(models.Model):
                 comm_2._unlink_sections()
                 dati_fatture_2 = self._prepare_cessionari_dati_fatture(
                     fatture_emesse, second_set_cessionari)
-                comm_2.fatture_emesse_ids = dati_fatture_2
+                comm_2._create_sections(
+                    'fatture_emesse_ids', dati_fatture_2)
                 comm_2.splitting_note = _(
                     "Splitted considering partners\n%s"
                     % '\n'.join(second_set_cessionari.mapped('name')))
@@ -589,16 +667,13 @@ class ComunicazioneDatiIva(models.Model):
             elif not self.check_fatture_emesse_body():
                 fatture_emesse = self.mapped(
                     'fatture_emesse_ids.fatture_emesse_body_ids.invoice_id')
-                cessionari = fatture_emesse.mapped('partner_id')
                 new_set = self.env['account.invoice']
                 old_set = fatture_emesse
-                for cessionario in cessionari:
-                    fatture = fatture_emesse.filtered(
-                        lambda fe:
-                        fe.partner_id.id ==
-                            cessionario.id)
+                fatture_by_partner = self._group_fatture_by_partner(
+                    fatture_emesse)
+                for fatture in fatture_by_partner.values():
                     if len(fatture) > 1000:
-                        new_set_ids = fatture.ids[:len(fatture) / 2]
+                        new_set_ids = fatture.ids[:len(fatture) // 2]
                         new_partial_set = self.env['account.invoice'].browse(
                             new_set_ids)
                         new_set |= new_partial_set
@@ -607,7 +682,8 @@ class ComunicazioneDatiIva(models.Model):
                 cessionari_1 = old_set.mapped('partner_id')
                 dati_fatture_1 = self._prepare_cessionari_dati_fatture(
                     old_set, cessionari_1)
-                self.fatture_emesse_ids = dati_fatture_1
+                self._create_sections(
+                    'fatture_emesse_ids', dati_fatture_1)
                 self.splitting_note = _(
                     "Splitted considering invoices\n%s"
                     % '\n'.join(old_set.mapped('number')))
@@ -616,7 +692,8 @@ class ComunicazioneDatiIva(models.Model):
                 cessionari_2 = new_set.mapped('partner_id')
                 dati_fatture_2 = self._prepare_cessionari_dati_fatture(
                     new_set, cessionari_2)
-                comm_2.fatture_emesse_ids = dati_fatture_2
+                comm_2._create_sections(
+                    'fatture_emesse_ids', dati_fatture_2)
                 comm_2.splitting_note = _(
                     "Splitted considering invoices\n%s"
                     % '\n'.join(new_set.mapped('number')))
@@ -628,8 +705,8 @@ class ComunicazioneDatiIva(models.Model):
                     'fatture_ricevute_ids.fatture_ricevute_body_ids.'
                     'invoice_id')
                 cedenti = fatture_ricevute.mapped('partner_id')
-                first_set_ids = cedenti.ids[:len(cedenti) / 2]
-                second_set_ids = cedenti.ids[len(cedenti) / 2:]
+                first_set_ids = cedenti.ids[:len(cedenti) // 2]
+                second_set_ids = cedenti.ids[len(cedenti) // 2:]
                 first_set_cedenti = self.env['res.partner'].browse(
                     first_set_ids)
                 second_set_cedenti = self.env['res.partner'].browse(
@@ -637,7 +714,8 @@ class ComunicazioneDatiIva(models.Model):
                 self._unlink_sections()
                 dati_fatture_1 = self._prepare_cedenti_dati_fatture(
                     fatture_ricevute, first_set_cedenti)
-                self.fatture_ricevute_ids = dati_fatture_1
+                self._create_sections(
+                    'fatture_ricevute_ids', dati_fatture_1)
                 self.splitting_note = _(
                     "Splitted considering partners\n%s"
                     % '\n'.join(first_set_cedenti.mapped('name')))
@@ -645,7 +723,8 @@ class ComunicazioneDatiIva(models.Model):
                 comm_2._unlink_sections()
                 dati_fatture_2 = self._prepare_cedenti_dati_fatture(
                     fatture_ricevute, second_set_cedenti)
-                comm_2.fatture_ricevute_ids = dati_fatture_2
+                comm_2._create_sections(
+                    'fatture_ricevute_ids', dati_fatture_2)
                 comm_2.splitting_note = _(
                     "Splitted considering partners\n%s"
                     % '\n'.join(second_set_cedenti.mapped('name')))
@@ -654,16 +733,13 @@ class ComunicazioneDatiIva(models.Model):
                 fatture_ricevute = self.mapped(
                     'fatture_ricevute_ids.fatture_ricevute_body_ids.'
                     'invoice_id')
-                cedenti = fatture_ricevute.mapped('partner_id')
                 new_set = self.env['account.invoice']
                 old_set = fatture_ricevute
-                for cedente in cedenti:
-                    fatture = fatture_ricevute.filtered(
-                        lambda fr:
-                        fr.partner_id.id ==
-                            cedente.id)
+                fatture_by_partner = self._group_fatture_by_partner(
+                    fatture_ricevute)
+                for fatture in fatture_by_partner.values():
                     if len(fatture) > 1000:
-                        new_set_ids = fatture.ids[:len(fatture) / 2]
+                        new_set_ids = fatture.ids[:len(fatture) // 2]
                         new_partial_set = self.env['account.invoice'].browse(
                             new_set_ids)
                         new_set |= new_partial_set
@@ -672,7 +748,8 @@ class ComunicazioneDatiIva(models.Model):
                 cedenti_1 = old_set.mapped('partner_id')
                 dati_fatture_1 = self._prepare_cedenti_dati_fatture(
                     old_set, cedenti_1)
-                self.fatture_ricevute_ids = dati_fatture_1
+                self._create_sections(
+                    'fatture_ricevute_ids', dati_fatture_1)
                 self.splitting_note = _(
                     "Splitted considering invoices\n%s"
                     % '\n'.join(old_set.mapped('number')))
@@ -681,7 +758,8 @@ class ComunicazioneDatiIva(models.Model):
                 cedenti_2 = new_set.mapped('partner_id')
                 dati_fatture_2 = self._prepare_cedenti_dati_fatture(
                     new_set, cedenti_2)
-                comm_2.fatture_ricevute_ids = dati_fatture_2
+                comm_2._create_sections(
+                    'fatture_ricevute_ids', dati_fatture_2)
                 comm_2.splitting_note = _(
                     "Splitted considering invoices\n%s"
                     % '\n'.join(new_set.mapped('number')))
@@ -737,18 +815,8 @@ class ComunicazioneDatiIva(models.Model):
         self.ensure_one()
         comunicazione = self
         errors = []
-        # ----- Conta il limite di partner e fatture
-        partner_limit = 0
-        for line in comunicazione.fatture_emesse_ids:
-            partner_limit += 1
-            invoices_limit = len(line.fatture_emesse_body_ids)
-            if invoices_limit > 1000:
-                errors += [
-                    _('Limit of 1000 invoices per assignee (%s) exceeded')
-                    % line.partner_id.display_name]
-        if partner_limit > 1000:
-            errors += [
-                _('Limit of 1000 assignees per communication exceeded')]
+        # Limits of partners and invoices are respected by the export,
+        # that splits the communication in several files
         # ----- Cedente
         # -----     Normalizzazione delle stringhe
         if not check_normalized_string(comunicazione.cedente_Denominazione):
@@ -930,18 +998,8 @@ class ComunicazioneDatiIva(models.Model):
         self.ensure_one()
         comunicazione = self
         errors = []
-        # ----- Conta il limite di partner e fatture
-        partner_limit = 0
-        for line in comunicazione.fatture_ricevute_ids:
-            partner_limit += 1
-            invoices_limit = len(line.fatture_ricevute_body_ids)
-            if invoices_limit > 1000:
-                errors += [
-                    _('Limit of 1000 invoices per assignee (%s) exceeded')
-                    % line.partner_id.display_name]
-        if partner_limit > 1000:
-            errors += [
-                _('Limit of 1000 assignees per communication exceeded')]
+        # Limits of partners and invoices are respected by the export,
+        # that splits the communication in several files
         # ----- Cessionario
         # -----     Normalizzazione delle stringhe
         if not check_normalized_string(
@@ -1195,13 +1253,10 @@ class ComunicazioneDatiIva(models.Model):
             self.codice_carica_id else ''
         return x_1_dati_fattura_header
 
-    def _export_xml_get_dte(self):
-        # ----- 2 - DTE
-        x_2_dte = etree.Element(
-            etree.QName("DTE"))
+    def _export_xml_get_cedente_prestatore_dte(self):
+        """Build the CedentePrestatoreDTE block of the communication"""
         # -----     2.1 - Cedente Prestatore DTE
-        x_2_1_cedente_prestatore = etree.SubElement(
-            x_2_dte,
+        x_2_1_cedente_prestatore = etree.Element(
             etree.QName("CedentePrestatoreDTE"))
         # -----         2.1.1 - IdentificativiFiscali
         x_2_1_1_identificativi_fiscali = etree.SubElement(
@@ -1349,273 +1404,288 @@ class ComunicazioneDatiIva(models.Model):
             x_2_1_2_6_rappresentante_fiscale,
             etree.QName("Cognome"))
         x_2_1_2_6_4_cognome.text = self.cedente_rf_Cognome or ''
+        return x_2_1_cedente_prestatore
 
-        for partner_invoice in self.fatture_emesse_ids:
-            # -----     2.2 - Cessionario Committente DTE
-            x_2_2_cessionario_committente = etree.SubElement(
-                x_2_dte,
-                etree.QName("CessionarioCommittenteDTE"))
-            # -----         2.2.1 - IdentificativiFiscali
-            x_2_2_1_identificativi_fiscali = etree.SubElement(
-                x_2_2_cessionario_committente,
-                etree.QName("IdentificativiFiscali"))
-            if partner_invoice.cessionario_IdFiscaleIVA_IdPaese and \
-                    partner_invoice.cessionario_IdFiscaleIVA_IdCodice:
-                # -----             2.2.1.1 - Id Fiscale IVA
-                x_2_2_1_1_id_fiscale_iva = etree.SubElement(
-                    x_2_2_1_identificativi_fiscali,
-                    etree.QName("IdFiscaleIVA"))
-                # -----                 2.2.1.1.1 - Id Paese
-                x_2_2_1_1_1_id_paese = etree.SubElement(
-                    x_2_2_1_1_id_fiscale_iva,
-                    etree.QName("IdPaese"))
-                x_2_2_1_1_1_id_paese.text = \
-                    partner_invoice.cessionario_IdFiscaleIVA_IdPaese or ''
-                # -----                 2.2.1.1.2 - Id Codice
-                x_2_2_1_1_2_id_codice = etree.SubElement(
-                    x_2_2_1_1_id_fiscale_iva,
-                    etree.QName("IdCodice"))
-                x_2_2_1_1_2_id_codice.text = \
-                    partner_invoice.cessionario_IdFiscaleIVA_IdCodice or ''
-            # -----             2.2.1.2 - Codice Fiscale
-            x_2_2_1_2_codice_fiscale = etree.SubElement(
+    def _export_xml_get_cessionario_committente_dte(
+            self, partner_invoice, invoices=None):
+        """Build the CessionarioCommittenteDTE block of a partner section.
+
+        :param invoices: invoices of the section to export,
+            all of them if None
+        """
+        if invoices is None:
+            invoices = partner_invoice.fatture_emesse_body_ids
+        # -----     2.2 - Cessionario Committente DTE
+        x_2_2_cessionario_committente = etree.Element(
+            etree.QName("CessionarioCommittenteDTE"))
+        # -----         2.2.1 - IdentificativiFiscali
+        x_2_2_1_identificativi_fiscali = etree.SubElement(
+            x_2_2_cessionario_committente,
+            etree.QName("IdentificativiFiscali"))
+        if partner_invoice.cessionario_IdFiscaleIVA_IdPaese and \
+                partner_invoice.cessionario_IdFiscaleIVA_IdCodice:
+            # -----             2.2.1.1 - Id Fiscale IVA
+            x_2_2_1_1_id_fiscale_iva = etree.SubElement(
                 x_2_2_1_identificativi_fiscali,
-                etree.QName("CodiceFiscale"))
-            x_2_2_1_2_codice_fiscale.text = \
-                partner_invoice.cessionario_CodiceFiscale or ''
-            # -----         2.2.2 - AltriDatiIdentificativi
-            x_2_2_2_altri_identificativi = etree.SubElement(
-                x_2_2_cessionario_committente,
-                etree.QName("AltriDatiIdentificativi"))
-            # -----             2.2.2.1 - Denominazione
-            x_2_2_2_1_altri_identificativi_denominazione = etree.SubElement(
-                x_2_2_2_altri_identificativi,
-                etree.QName("Denominazione"))
-            x_2_2_2_1_altri_identificativi_denominazione.text = \
-                encode_for_export(partner_invoice.cessionario_Denominazione or '', 80)
-            # -----             2.2.2.2 - Nome
-            x_2_2_2_2_nome = etree.SubElement(
-                x_2_2_2_altri_identificativi,
-                etree.QName("Nome"))
-            x_2_2_2_2_nome.text = \
-                encode_for_export(partner_invoice.cessionario_Nome or '', 60)
-            # -----             2.2.2.3 - Cognome
-            x_2_2_2_3_cognome = etree.SubElement(
-                x_2_2_2_altri_identificativi,
-                etree.QName("Cognome"))
-            x_2_2_2_3_cognome.text = \
-                encode_for_export(partner_invoice.cessionario_Cognome or '', 60)
-            # -----             2.2.2.4 - Sede
-            x_2_2_2_4_sede = etree.SubElement(
-                x_2_2_2_altri_identificativi,
-                etree.QName("Sede"))
-            # -----                 2.2.2.4.1 - Indirizzo
-            x_2_2_2_4_1_indirizzo = etree.SubElement(
-                x_2_2_2_4_sede,
-                etree.QName("Indirizzo"))
-            x_2_2_2_4_1_indirizzo.text = \
-                encode_for_export(partner_invoice.cessionario_sede_Indirizzo or '', 60)
-            # -----                 2.2.2.4.2 - Numero Civico
-            x_2_2_2_4_2_numero_civico = etree.SubElement(
-                x_2_2_2_4_sede,
-                etree.QName("NumeroCivico"))
-            x_2_2_2_4_2_numero_civico.text = \
-                encode_for_export(
-                    partner_invoice.cessionario_sede_NumeroCivico or '', 8,
-                    encoding='ascii')
-            # -----                 2.2.2.4.3 - CAP
-            x_2_2_2_4_3_cap = etree.SubElement(
-                x_2_2_2_4_sede,
-                etree.QName("CAP"))
-            x_2_2_2_4_3_cap.text = \
-                encode_for_export(partner_invoice.cessionario_sede_Cap or '', 5,
-                                  encoding='ascii')
-            # -----                 2.2.2.4.4 - Comune
-            x_2_2_2_4_4_comune = etree.SubElement(
-                x_2_2_2_4_sede,
-                etree.QName("Comune"))
-            x_2_2_2_4_4_comune.text = \
-                encode_for_export(partner_invoice.cessionario_sede_Comune or '', 60)
-            # -----                 2.2.2.4.5 - Provincia
-            x_2_2_2_4_5_provincia = etree.SubElement(
-                x_2_2_2_4_sede,
-                etree.QName("Provincia"))
-            x_2_2_2_4_5_provincia.text = \
-                partner_invoice.cessionario_sede_Provincia or ''
-            # -----                 2.2.2.4.6 - Nazione
-            x_2_2_2_4_6_nazione = etree.SubElement(
-                x_2_2_2_4_sede,
-                etree.QName("Nazione"))
-            x_2_2_2_4_6_nazione.text = \
-                partner_invoice.cessionario_sede_Nazione or ''
-            # -----             2.2.2.5 - Stabile Organizzazione
-            x_2_2_2_5_stabile_organizzazione = etree.SubElement(
-                x_2_2_2_altri_identificativi,
-                etree.QName("StabileOrganizzazione"))
-            # -----                 2.2.2.5.1 - Indirizzo
-            x_2_2_2_5_1_indirizzo = etree.SubElement(
-                x_2_2_2_5_stabile_organizzazione,
-                etree.QName("Indirizzo"))
-            x_2_2_2_5_1_indirizzo.text = \
-                encode_for_export(partner_invoice.cessionario_so_Indirizzo or '', 60)
-            # -----                 2.2.2.5.2 - Numero Civico
-            x_2_2_2_5_2_numero_civico = etree.SubElement(
-                x_2_2_2_5_stabile_organizzazione,
-                etree.QName("NumeroCivico"))
-            x_2_2_2_5_2_numero_civico.text = \
-                encode_for_export(partner_invoice.cessionario_so_NumeroCivico or '', 8,
-                                  encoding='ascii')
-            # -----                 2.2.2.5.3 - CAP
-            x_2_2_2_5_3_cap = etree.SubElement(
-                x_2_2_2_5_stabile_organizzazione,
-                etree.QName("CAP"))
-            x_2_2_2_5_3_cap.text = \
-                encode_for_export(partner_invoice.cessionario_so_Cap or '', 5,
-                                  encoding='ascii')
-            # -----                 2.2.2.5.4 - Comune
-            x_2_2_2_5_4_comune = etree.SubElement(
-                x_2_2_2_5_stabile_organizzazione,
-                etree.QName("Comune"))
-            x_2_2_2_5_4_comune.text = \
-                encode_for_export(partner_invoice.cessionario_so_Comune or '', 60)
-            # -----                 2.2.2.5.5 - Provincia
-            x_2_2_2_5_5_provincia = etree.SubElement(
-                x_2_2_2_5_stabile_organizzazione,
-                etree.QName("Provincia"))
-            x_2_2_2_5_5_provincia.text = \
-                partner_invoice.cessionario_so_Provincia or ''
-            # -----                 2.2.2.5.6 - Nazione
-            x_2_2_2_5_6_nazione = etree.SubElement(
-                x_2_2_2_5_stabile_organizzazione,
-                etree.QName("Nazione"))
-            x_2_2_2_5_6_nazione.text = \
-                partner_invoice.cessionario_so_Nazione or ''
-            # -----             2.2.2.6 - Rappresentante Fiscale
-            x_2_2_2_6_rappresentante_fiscale = etree.SubElement(
-                x_2_2_2_altri_identificativi,
-                etree.QName("RappresentanteFiscale"))
-            # -----                 2.2.2.6.1 - Id Fiscale IVA
-            x_2_2_2_6_1_id_fiscale_iva = etree.SubElement(
-                x_2_2_2_6_rappresentante_fiscale,
                 etree.QName("IdFiscaleIVA"))
-            x_2_2_2_6_rappresentante_fiscale.text = \
-                partner_invoice.cessionario_rf_IdFiscaleIVA_IdPaese or ''
-            # -----                     2.2.2.6.1.1 - Id Paese
-            x_2_2_2_6_1_1_id_paese = etree.SubElement(
-                x_2_2_2_6_1_id_fiscale_iva,
+            # -----                 2.2.1.1.1 - Id Paese
+            x_2_2_1_1_1_id_paese = etree.SubElement(
+                x_2_2_1_1_id_fiscale_iva,
                 etree.QName("IdPaese"))
-            x_2_2_2_6_1_1_id_paese.text = \
-                partner_invoice.cessionario_rf_IdFiscaleIVA_IdPaese or ''
-            # -----                     2.2.2.6.1.2 - Id Codice
-            x_2_2_2_6_1_2_id_codice = etree.SubElement(
-                x_2_2_2_6_1_id_fiscale_iva,
+            x_2_2_1_1_1_id_paese.text = \
+                partner_invoice.cessionario_IdFiscaleIVA_IdPaese or ''
+            # -----                 2.2.1.1.2 - Id Codice
+            x_2_2_1_1_2_id_codice = etree.SubElement(
+                x_2_2_1_1_id_fiscale_iva,
                 etree.QName("IdCodice"))
-            x_2_2_2_6_1_2_id_codice.text = \
-                partner_invoice.cessionario_rf_IdFiscaleIVA_IdCodice or ''
-            # -----                 2.2.2.6.2 - Denominazione
-            x_2_2_2_6_2_denominazione = etree.SubElement(
-                x_2_2_2_6_rappresentante_fiscale,
-                etree.QName("Denominazione"))
-            x_2_2_2_6_2_denominazione.text = \
-                encode_for_export(
-                    partner_invoice.cessionario_rf_Denominazione or '', 80)
-            # -----                 2.2.2.6.3 - Nome
-            x_2_2_2_6_3_nome = etree.SubElement(
-                x_2_2_2_6_rappresentante_fiscale,
-                etree.QName("Nome"))
-            x_2_2_2_6_3_nome.text = \
-                encode_for_export(partner_invoice.cessionario_rf_Nome or '', 60)
-            # -----                 2.2.2.6.4 - Cognome
-            x_2_2_2_6_4_cognome = etree.SubElement(
-                x_2_2_2_6_rappresentante_fiscale,
-                etree.QName("Cognome"))
-            x_2_2_2_6_4_cognome.text = \
-                encode_for_export(partner_invoice.cessionario_rf_Cognome or '', 60)
-
-            for invoice in partner_invoice.fatture_emesse_body_ids:
-                # -----         2.2.3 - Dati Fattura Body DTE
-                x_2_2_3_dati_fattura_body_dte = etree.SubElement(
-                    x_2_2_cessionario_committente,
-                    etree.QName("DatiFatturaBodyDTE"))
-                # -----             2.2.3.1 - Dati Generali
-                x_2_2_3_1_dati_generali = etree.SubElement(
+            x_2_2_1_1_2_id_codice.text = \
+                partner_invoice.cessionario_IdFiscaleIVA_IdCodice or ''
+        # -----             2.2.1.2 - Codice Fiscale
+        x_2_2_1_2_codice_fiscale = etree.SubElement(
+            x_2_2_1_identificativi_fiscali,
+            etree.QName("CodiceFiscale"))
+        x_2_2_1_2_codice_fiscale.text = \
+            partner_invoice.cessionario_CodiceFiscale or ''
+        # -----         2.2.2 - AltriDatiIdentificativi
+        x_2_2_2_altri_identificativi = etree.SubElement(
+            x_2_2_cessionario_committente,
+            etree.QName("AltriDatiIdentificativi"))
+        # -----             2.2.2.1 - Denominazione
+        x_2_2_2_1_altri_identificativi_denominazione = etree.SubElement(
+            x_2_2_2_altri_identificativi,
+            etree.QName("Denominazione"))
+        x_2_2_2_1_altri_identificativi_denominazione.text = \
+            encode_for_export(partner_invoice.cessionario_Denominazione or '', 80)
+        # -----             2.2.2.2 - Nome
+        x_2_2_2_2_nome = etree.SubElement(
+            x_2_2_2_altri_identificativi,
+            etree.QName("Nome"))
+        x_2_2_2_2_nome.text = \
+            encode_for_export(partner_invoice.cessionario_Nome or '', 60)
+        # -----             2.2.2.3 - Cognome
+        x_2_2_2_3_cognome = etree.SubElement(
+            x_2_2_2_altri_identificativi,
+            etree.QName("Cognome"))
+        x_2_2_2_3_cognome.text = \
+            encode_for_export(partner_invoice.cessionario_Cognome or '', 60)
+        # -----             2.2.2.4 - Sede
+        x_2_2_2_4_sede = etree.SubElement(
+            x_2_2_2_altri_identificativi,
+            etree.QName("Sede"))
+        # -----                 2.2.2.4.1 - Indirizzo
+        x_2_2_2_4_1_indirizzo = etree.SubElement(
+            x_2_2_2_4_sede,
+            etree.QName("Indirizzo"))
+        x_2_2_2_4_1_indirizzo.text = \
+            encode_for_export(partner_invoice.cessionario_sede_Indirizzo or '', 60)
+        # -----                 2.2.2.4.2 - Numero Civico
+        x_2_2_2_4_2_numero_civico = etree.SubElement(
+            x_2_2_2_4_sede,
+            etree.QName("NumeroCivico"))
+        x_2_2_2_4_2_numero_civico.text = \
+            encode_for_export(
+                partner_invoice.cessionario_sede_NumeroCivico or '', 8,
+                encoding='ascii')
+        # -----                 2.2.2.4.3 - CAP
+        x_2_2_2_4_3_cap = etree.SubElement(
+            x_2_2_2_4_sede,
+            etree.QName("CAP"))
+        x_2_2_2_4_3_cap.text = \
+            encode_for_export(partner_invoice.cessionario_sede_Cap or '', 5,
+                              encoding='ascii')
+        # -----                 2.2.2.4.4 - Comune
+        x_2_2_2_4_4_comune = etree.SubElement(
+            x_2_2_2_4_sede,
+            etree.QName("Comune"))
+        x_2_2_2_4_4_comune.text = \
+            encode_for_export(partner_invoice.cessionario_sede_Comune or '', 60)
+        # -----                 2.2.2.4.5 - Provincia
+        x_2_2_2_4_5_provincia = etree.SubElement(
+            x_2_2_2_4_sede,
+            etree.QName("Provincia"))
+        x_2_2_2_4_5_provincia.text = \
+            partner_invoice.cessionario_sede_Provincia or ''
+        # -----                 2.2.2.4.6 - Nazione
+        x_2_2_2_4_6_nazione = etree.SubElement(
+            x_2_2_2_4_sede,
+            etree.QName("Nazione"))
+        x_2_2_2_4_6_nazione.text = \
+            partner_invoice.cessionario_sede_Nazione or ''
+        # -----             2.2.2.5 - Stabile Organizzazione
+        x_2_2_2_5_stabile_organizzazione = etree.SubElement(
+            x_2_2_2_altri_identificativi,
+            etree.QName("StabileOrganizzazione"))
+        # -----                 2.2.2.5.1 - Indirizzo
+        x_2_2_2_5_1_indirizzo = etree.SubElement(
+            x_2_2_2_5_stabile_organizzazione,
+            etree.QName("Indirizzo"))
+        x_2_2_2_5_1_indirizzo.text = \
+            encode_for_export(partner_invoice.cessionario_so_Indirizzo or '', 60)
+        # -----                 2.2.2.5.2 - Numero Civico
+        x_2_2_2_5_2_numero_civico = etree.SubElement(
+            x_2_2_2_5_stabile_organizzazione,
+            etree.QName("NumeroCivico"))
+        x_2_2_2_5_2_numero_civico.text = \
+            encode_for_export(partner_invoice.cessionario_so_NumeroCivico or '', 8,
+                              encoding='ascii')
+        # -----                 2.2.2.5.3 - CAP
+        x_2_2_2_5_3_cap = etree.SubElement(
+            x_2_2_2_5_stabile_organizzazione,
+            etree.QName("CAP"))
+        x_2_2_2_5_3_cap.text = \
+            encode_for_export(partner_invoice.cessionario_so_Cap or '', 5,
+                              encoding='ascii')
+        # -----                 2.2.2.5.4 - Comune
+        x_2_2_2_5_4_comune = etree.SubElement(
+            x_2_2_2_5_stabile_organizzazione,
+            etree.QName("Comune"))
+        x_2_2_2_5_4_comune.text = \
+            encode_for_export(partner_invoice.cessionario_so_Comune or '', 60)
+        # -----                 2.2.2.5.5 - Provincia
+        x_2_2_2_5_5_provincia = etree.SubElement(
+            x_2_2_2_5_stabile_organizzazione,
+            etree.QName("Provincia"))
+        x_2_2_2_5_5_provincia.text = \
+            partner_invoice.cessionario_so_Provincia or ''
+        # -----                 2.2.2.5.6 - Nazione
+        x_2_2_2_5_6_nazione = etree.SubElement(
+            x_2_2_2_5_stabile_organizzazione,
+            etree.QName("Nazione"))
+        x_2_2_2_5_6_nazione.text = \
+            partner_invoice.cessionario_so_Nazione or ''
+        # -----             2.2.2.6 - Rappresentante Fiscale
+        x_2_2_2_6_rappresentante_fiscale = etree.SubElement(
+            x_2_2_2_altri_identificativi,
+            etree.QName("RappresentanteFiscale"))
+        # -----                 2.2.2.6.1 - Id Fiscale IVA
+        x_2_2_2_6_1_id_fiscale_iva = etree.SubElement(
+            x_2_2_2_6_rappresentante_fiscale,
+            etree.QName("IdFiscaleIVA"))
+        x_2_2_2_6_rappresentante_fiscale.text = \
+            partner_invoice.cessionario_rf_IdFiscaleIVA_IdPaese or ''
+        # -----                     2.2.2.6.1.1 - Id Paese
+        x_2_2_2_6_1_1_id_paese = etree.SubElement(
+            x_2_2_2_6_1_id_fiscale_iva,
+            etree.QName("IdPaese"))
+        x_2_2_2_6_1_1_id_paese.text = \
+            partner_invoice.cessionario_rf_IdFiscaleIVA_IdPaese or ''
+        # -----                     2.2.2.6.1.2 - Id Codice
+        x_2_2_2_6_1_2_id_codice = etree.SubElement(
+            x_2_2_2_6_1_id_fiscale_iva,
+            etree.QName("IdCodice"))
+        x_2_2_2_6_1_2_id_codice.text = \
+            partner_invoice.cessionario_rf_IdFiscaleIVA_IdCodice or ''
+        # -----                 2.2.2.6.2 - Denominazione
+        x_2_2_2_6_2_denominazione = etree.SubElement(
+            x_2_2_2_6_rappresentante_fiscale,
+            etree.QName("Denominazione"))
+        x_2_2_2_6_2_denominazione.text = \
+            encode_for_export(
+                partner_invoice.cessionario_rf_Denominazione or '', 80)
+        # -----                 2.2.2.6.3 - Nome
+        x_2_2_2_6_3_nome = etree.SubElement(
+            x_2_2_2_6_rappresentante_fiscale,
+            etree.QName("Nome"))
+        x_2_2_2_6_3_nome.text = \
+            encode_for_export(partner_invoice.cessionario_rf_Nome or '', 60)
+        # -----                 2.2.2.6.4 - Cognome
+        x_2_2_2_6_4_cognome = etree.SubElement(
+            x_2_2_2_6_rappresentante_fiscale,
+            etree.QName("Cognome"))
+        x_2_2_2_6_4_cognome.text = \
+            encode_for_export(partner_invoice.cessionario_rf_Cognome or '', 60)
+
+        for invoice in invoices:
+            # -----         2.2.3 - Dati Fattura Body DTE
+            x_2_2_3_dati_fattura_body_dte = etree.SubElement(
+                x_2_2_cessionario_committente,
+                etree.QName("DatiFatturaBodyDTE"))
+            # -----             2.2.3.1 - Dati Generali
+            x_2_2_3_1_dati_generali = etree.SubElement(
+                x_2_2_3_dati_fattura_body_dte,
+                etree.QName("DatiGenerali"))
+            # -----                 2.2.3.1.1 - Tipo Documento
+            x_2_2_3_1_1_tipo_documento = etree.SubElement(
+                x_2_2_3_1_dati_generali,
+                etree.QName("TipoDocumento"))
+            x_2_2_3_1_1_tipo_documento.text = \
+                invoice.dati_fattura_TipoDocumento.code or ''
+            # -----                 2.2.3.1.2 - Data
+            x_2_2_3_1_2_data = etree.SubElement(
+                x_2_2_3_1_dati_generali,
+                etree.QName("Data"))
+            x_2_2_3_1_2_data.text = \
+                fields.Date.to_string(invoice.dati_fattura_Data) or ''
+            # -----                 2.2.3.1.3 - Numero
+            x_2_2_3_1_2_numero = etree.SubElement(
+                x_2_2_3_1_dati_generali,
+                etree.QName("Numero"))
+            x_2_2_3_1_2_numero.text = invoice.dati_fattura_Numero or ''
+
+            for tax in invoice.dati_fattura_iva_ids:
+                # -----             2.2.3.2 - Dati Riepilogo
+                x_2_2_3_2_riepilogo = etree.SubElement(
                     x_2_2_3_dati_fattura_body_dte,
-                    etree.QName("DatiGenerali"))
-                # -----                 2.2.3.1.1 - Tipo Documento
-                x_2_2_3_1_1_tipo_documento = etree.SubElement(
-                    x_2_2_3_1_dati_generali,
-                    etree.QName("TipoDocumento"))
-                x_2_2_3_1_1_tipo_documento.text = \
-                    invoice.dati_fattura_TipoDocumento.code or ''
-                # -----                 2.2.3.1.2 - Data
-                x_2_2_3_1_2_data = etree.SubElement(
-                    x_2_2_3_1_dati_generali,
-                    etree.QName("Data"))
-                x_2_2_3_1_2_data.text = \
-                    fields.Date.to_string(invoice.dati_fattura_Data) or ''
-                # -----                 2.2.3.1.3 - Numero
-                x_2_2_3_1_2_numero = etree.SubElement(
-                    x_2_2_3_1_dati_generali,
-                    etree.QName("Numero"))
-                x_2_2_3_1_2_numero.text = invoice.dati_fattura_Numero or ''
-
-                for tax in invoice.dati_fattura_iva_ids:
-                    # -----             2.2.3.2 - Dati Riepilogo
-                    x_2_2_3_2_riepilogo = etree.SubElement(
-                        x_2_2_3_dati_fattura_body_dte,
-                        etree.QName("DatiRiepilogo"))
-                    # -----                 2.2.3.2.1 - Imponibile Importo
-                    x_2_2_3_2_1_imponibile_importo = etree.SubElement(
-                        x_2_2_3_2_riepilogo,
-                        etree.QName("ImponibileImporto"))
-                    x_2_2_3_2_1_imponibile_importo.text = \
-                        format_decimal(tax.ImponibileImporto)
-                    # -----                 2.2.3.2.2 - Dati IVA
-                    x_2_2_3_2_2_dati_iva = etree.SubElement(
-                        x_2_2_3_2_riepilogo,
-                        etree.QName("DatiIVA"))
-                    # -----                     2.2.3.2.2.1 - Imposta
-                    x_2_2_3_2_2_1_imposta = etree.SubElement(
-                        x_2_2_3_2_2_dati_iva,
-                        etree.QName("Imposta"))
-                    x_2_2_3_2_2_1_imposta.text = format_decimal(tax.Imposta)
-                    # -----                     2.2.3.2.2.2 - Aliquota
-                    x_2_2_3_2_2_2_aliquota = etree.SubElement(
-                        x_2_2_3_2_2_dati_iva,
-                        etree.QName("Aliquota"))
-                    x_2_2_3_2_2_2_aliquota.text = format_decimal(tax.Aliquota)
-                    # -----                 2.2.3.2.3 - Natura
-                    x_2_2_3_2_3_natura = etree.SubElement(
-                        x_2_2_3_2_riepilogo,
-                        etree.QName("Natura"))
-                    x_2_2_3_2_3_natura.text = \
-                        tax.Natura_id.code if tax.Natura_id else ''
-                    # -----                 2.2.3.2.4 - Detraibile
-                    x_2_2_3_2_4_detraibile = etree.SubElement(
-                        x_2_2_3_2_riepilogo,
-                        etree.QName("Detraibile"))
-                    x_2_2_3_2_4_detraibile.text = format_decimal(
-                        tax.Detraibile)
-                    # -----                 2.2.3.2.5 - Deducibile
-                    x_2_2_3_2_5_deducibile = etree.SubElement(
-                        x_2_2_3_2_riepilogo,
-                        etree.QName("Deducibile"))
-                    x_2_2_3_2_5_deducibile.text = tax.Deducibile or ''
-                    # -----                 2.2.3.2.6 - Esigibilita IVA
-                    x_2_2_3_2_6_esagibilita_iva = etree.SubElement(
-                        x_2_2_3_2_riepilogo,
-                        etree.QName("EsigibilitaIVA"))
-                    x_2_2_3_2_6_esagibilita_iva.text = tax.EsigibilitaIVA or ''
+                    etree.QName("DatiRiepilogo"))
+                # -----                 2.2.3.2.1 - Imponibile Importo
+                x_2_2_3_2_1_imponibile_importo = etree.SubElement(
+                    x_2_2_3_2_riepilogo,
+                    etree.QName("ImponibileImporto"))
+                x_2_2_3_2_1_imponibile_importo.text = \
+                    format_decimal(tax.ImponibileImporto)
+                # -----                 2.2.3.2.2 - Dati IVA
+                x_2_2_3_2_2_dati_iva = etree.SubElement(
+                    x_2_2_3_2_riepilogo,
+                    etree.QName("DatiIVA"))
+                # -----                     2.2.3.2.2.1 - Imposta
+                x_2_2_3_2_2_1_imposta = etree.SubElement(
+                    x_2_2_3_2_2_dati_iva,
+                    etree.QName("Imposta"))
+                x_2_2_3_2_2_1_imposta.text = format_decimal(tax.Imposta)
+                # -----                     2.2.3.2.2.2 - Aliquota
+                x_2_2_3_2_2_2_aliquota = etree.SubElement(
+                    x_2_2_3_2_2_dati_iva,
+                    etree.QName("Aliquota"))
+                x_2_2_3_2_2_2_aliquota.text = format_decimal(tax.Aliquota)
+                # -----                 2.2.3.2.3 - Natura
+                x_2_2_3_2_3_natura = etree.SubElement(
+                    x_2_2_3_2_riepilogo,
+                    etree.QName("Natura"))
+                x_2_2_3_2_3_natura.text = \
+                    tax.Natura_id.code if tax.Natura_id else ''
+                # -----                 2.2.3.2.4 - Detraibile
+                x_2_2_3_2_4_detraibile = etree.SubElement(
+                    x_2_2_3_2_riepilogo,
+                    etree.QName("Detraibile"))
+                x_2_2_3_2_4_detraibile.text = format_decimal(
+                    tax.Detraibile)
+                # -----                 2.2.3.2.5 - Deducibile
+                x_2_2_3_2_5_deducibile = etree.SubElement(
+                    x_2_2_3_2_riepilogo,
+                    etree.QName("Deducibile"))
+                x_2_2_3_2_5_deducibile.text = tax.Deducibile or ''
+                # -----                 2.2.3.2.6 - Esigibilita IVA
+                x_2_2_3_2_6_esagibilita_iva = etree.SubElement(
+                    x_2_2_3_2_riepilogo,
+                    etree.QName("EsigibilitaIVA"))
+                x_2_2_3_2_6_esagibilita_iva.text = tax.EsigibilitaIVA or ''
+        return x_2_2_cessionario_committente
 
+    def _export_xml_get_dte(self):
+        # ----- 2 - DTE
+        x_2_dte = etree.Element(
+            etree.QName("DTE"))
+        x_2_dte.append(self._export_xml_get_cedente_prestatore_dte())
+        for partner_invoice in self.fatture_emesse_ids:
+            x_2_dte.append(
+                self._export_xml_get_cessionario_committente_dte(
+                    partner_invoice))
         return x_2_dte
 
-    def _export_xml_get_dtr(self):
-        # ----- 3 - DTR
-        x_3_dtr = etree.Element(
-            etree.QName("DTR"))
+    def _export_xml_get_cessionario_committente_dtr(self):
+        """Build the CessionarioCommittenteDTR block of the communication"""
         # -----     2.1 - Cessionario Committente DTR
-        x_3_1_cessionario_committente = etree.SubElement(
-            x_3_dtr,
+        x_3_1_cessionario_committente = etree.Element(
             etree.QName("CessionarioCommittenteDTR"))
         # -----         2.1.1 - IdentificativiFiscali
         x_3_1_1_identificativi_fiscali = etree.SubElement(
@@ -1765,267 +1835,285 @@ class ComunicazioneDatiIva(models.Model):
             x_3_1_2_6_rappresentante_fiscale,
             etree.QName("Cognome"))
         x_3_1_2_6_4_cognome.text = self.cessionario_rf_Cognome or ''
+        return x_3_1_cessionario_committente
 
-        for partner_invoice in self.fatture_ricevute_ids:
-            # -----     2.2 - Cessionario Committente DTE
-            x_3_2_cedente_prestatore = etree.SubElement(
-                x_3_dtr,
-                etree.QName("CedentePrestatoreDTR"))
-            # -----         2.2.1 - IdentificativiFiscali
-            x_3_2_1_identificativi_fiscali = etree.SubElement(
-                x_3_2_cedente_prestatore,
-                etree.QName("IdentificativiFiscali"))
-            if partner_invoice.cedente_IdFiscaleIVA_IdPaese and \
-                    partner_invoice.cedente_IdFiscaleIVA_IdCodice:
-                # -----             2.2.1.1 - Id Fiscale IVA
-                x_3_2_1_1_id_fiscale_iva = etree.SubElement(
-                    x_3_2_1_identificativi_fiscali,
-                    etree.QName("IdFiscaleIVA"))
-                # -----                 2.2.1.1.1 - Id Paese
-                x_3_2_1_1_1_id_paese = etree.SubElement(
-                    x_3_2_1_1_id_fiscale_iva,
-                    etree.QName("IdPaese"))
-                x_3_2_1_1_1_id_paese.text = \
-                    partner_invoice.cedente_IdFiscaleIVA_IdPaese or ''
-                # -----                 2.2.1.1.2 - Id Codice
-                x_3_2_1_1_2_id_codice = etree.SubElement(
-                    x_3_2_1_1_id_fiscale_iva,
-                    etree.QName("IdCodice"))
-                x_3_2_1_1_2_id_codice.text = \
-                    partner_invoice.cedente_IdFiscaleIVA_IdCodice or ''
-            # -----             2.2.1.2 - Codice Fiscale
-            x_3_2_1_2_codice_fiscale = etree.SubElement(
+    def _export_xml_get_cedente_prestatore_dtr(
+            self, partner_invoice, invoices=None):
+        """Build the CedentePrestatoreDTR block of a partner section.
+
+        :param invoices: invoices of the section to export,
+            all of them if None
+        """
+        if invoices is None:
+            invoices = partner_invoice.fatture_ricevute_body_ids
+        # -----     2.2 - Cessionario Committente DTE
+        x_3_2_cedente_prestatore = etree.Element(
+            etree.QName("CedentePrestatoreDTR"))
+        # -----         2.2.1 - IdentificativiFiscali
+        x_3_2_1_identificativi_fiscali = etree.SubElement(
+            x_3_2_cedente_prestatore,
+            etree.QName("IdentificativiFiscali"))
+        if partner_invoice.cedente_IdFiscaleIVA_IdPaese and \
+                partner_invoice.cedente_IdFiscaleIVA_IdCodice:
+            # -----             2.2.1.1 - Id Fiscale IVA
+            x_3_2_1_1_id_fiscale_iva = etree.SubElement(
                 x_3_2_1_identificativi_fiscali,
-                etree.QName("CodiceFiscale"))
-            x_3_2_1_2_codice_fiscale.text = \
-                partner_invoice.cedente_CodiceFiscale or ''
-            # -----         2.2.2 - AltriDatiIdentificativi
-            x_3_2_2_altri_identificativi = etree.SubElement(
-                x_3_2_cedente_prestatore,
-                etree.QName("AltriDatiIdentificativi"))
-            # -----             2.2.2.1 - Denominazione
-            x_3_2_2_1_altri_identificativi_denominazione = etree.SubElement(
-                x_3_2_2_altri_identificativi,
-                etree.QName("Denominazione"))
-            x_3_2_2_1_altri_identificativi_denominazione.text = \
-                encode_for_export(partner_invoice.cedente_Denominazione or '', 80)
-            # -----             2.2.2.2 - Nome
-            x_3_2_2_2_nome = etree.SubElement(
-                x_3_2_2_altri_identificativi,
-                etree.QName("Nome"))
-            x_3_2_2_2_nome.text = \
-                encode_for_export(partner_invoice.cedente_Nome or '', 60)
-            # -----             2.2.2.3 - Cognome
-            x_3_2_2_3_cognome = etree.SubElement(
-                x_3_2_2_altri_identificativi,
-                etree.QName("Cognome"))
-            x_3_2_2_3_cognome.text = \
-                encode_for_export(partner_invoice.cedente_Cognome or '', 60)
-            # -----             2.2.2.4 - Sede
-            x_3_2_2_4_sede = etree.SubElement(
-                x_3_2_2_altri_identificativi,
-                etree.QName("Sede"))
-            # -----                 2.2.2.4.1 - Indirizzo
-            x_3_2_2_4_1_indirizzo = etree.SubElement(
-                x_3_2_2_4_sede,
-                etree.QName("Indirizzo"))
-            x_3_2_2_4_1_indirizzo.text = \
-                encode_for_export(partner_invoice.cedente_sede_Indirizzo or '', 60)
-            # -----                 2.2.2.4.2 - Numero Civico
-            x_3_2_2_4_2_numero_civico = etree.SubElement(
-                x_3_2_2_4_sede,
-                etree.QName("NumeroCivico"))
-            x_3_2_2_4_2_numero_civico.text = \
-                encode_for_export(partner_invoice.cedente_sede_NumeroCivico or '', 8,
-                                  encoding='ascii')
-            # -----                 2.2.2.4.3 - CAP
-            x_3_2_2_4_3_cap = etree.SubElement(
-                x_3_2_2_4_sede,
-                etree.QName("CAP"))
-            x_3_2_2_4_3_cap.text = \
-                encode_for_export(partner_invoice.cedente_sede_Cap or '', 5,
-                                  encoding='ascii')
-            # -----                 2.2.2.4.4 - Comune
-            x_3_2_2_4_4_comune = etree.SubElement(
-                x_3_2_2_4_sede,
-                etree.QName("Comune"))
-            x_3_2_2_4_4_comune.text = \
-                encode_for_export(partner_invoice.cedente_sede_Comune or '', 60)
-            # -----                 2.2.2.4.5 - Provincia
-            x_3_2_2_4_5_provincia = etree.SubElement(
-                x_3_2_2_4_sede,
-                etree.QName("Provincia"))
-            x_3_2_2_4_5_provincia.text = \
-                partner_invoice.cedente_sede_Provincia or ''
-            # -----                 2.2.2.4.6 - Nazione
-            x_3_2_2_4_6_nazione = etree.SubElement(
-                x_3_2_2_4_sede,
-                etree.QName("Nazione"))
-            x_3_2_2_4_6_nazione.text = \
-                partner_invoice.cedente_sede_Nazione or ''
-            # -----             2.2.2.5 - Stabile Organizzazione
-            x_3_2_2_5_stabile_organizzazione = etree.SubElement(
-                x_3_2_2_altri_identificativi,
-                etree.QName("StabileOrganizzazione"))
-            # -----                 2.2.2.5.1 - Indirizzo
-            x_3_2_2_5_1_indirizzo = etree.SubElement(
-                x_3_2_2_5_stabile_organizzazione,
-                etree.QName("Indirizzo"))
-            x_3_2_2_5_1_indirizzo.text = \
-                encode_for_export(partner_invoice.cedente_so_Indirizzo or '', 60)
-            # -----                 2.2.2.5.2 - Numero Civico
-            x_3_2_2_5_2_numero_civico = etree.SubElement(
-                x_3_2_2_5_stabile_organizzazione,
-                etree.QName("NumeroCivico"))
-            x_3_2_2_5_2_numero_civico.text = \
-                encode_for_export(partner_invoice.cedente_so_NumeroCivico or '', 8,
-                                  encoding='ascii')
-            # -----                 2.2.2.5.3 - CAP
-            x_3_2_2_5_3_cap = etree.SubElement(
-                x_3_2_2_5_stabile_organizzazione,
-                etree.QName("CAP"))
-            x_3_2_2_5_3_cap.text = \
-                encode_for_export(partner_invoice.cedente_so_Cap or '', 5,
-                                  encoding='ascii')
-            # -----                 2.2.2.5.4 - Comune
-            x_3_2_2_5_4_comune = etree.SubElement(
-                x_3_2_2_5_stabile_organizzazione,
-                etree.QName("Comune"))
-            x_3_2_2_5_4_comune.text = \
-                encode_for_export(partner_invoice.cedente_so_Comune or '', 60)
-            # -----                 2.2.2.5.5 - Provincia
-            x_3_2_2_5_5_provincia = etree.SubElement(
-                x_3_2_2_5_stabile_organizzazione,
-                etree.QName("Provincia"))
-            x_3_2_2_5_5_provincia.text = \
-                partner_invoice.cedente_so_Provincia or ''
-            # -----                 2.2.2.5.6 - Nazione
-            x_3_2_2_5_6_nazione = etree.SubElement(
-                x_3_2_2_5_stabile_organizzazione,
-                etree.QName("Nazione"))
-            x_3_2_2_5_6_nazione.text = \
-                partner_invoice.cedente_so_Nazione or ''
-            # -----             2.2.2.6 - Rappresentante Fiscale
-            x_3_2_2_6_rappresentante_fiscale = etree.SubElement(
-                x_3_2_2_altri_identificativi,
-                etree.QName("RappresentanteFiscale"))
-            # -----                 2.2.2.6.1 - Id Fiscale IVA
-            x_3_2_2_6_1_id_fiscale_iva = etree.SubElement(
-                x_3_2_2_6_rappresentante_fiscale,
                 etree.QName("IdFiscaleIVA"))
-            x_3_2_2_6_rappresentante_fiscale.text = \
-                partner_invoice.cedente_rf_IdFiscaleIVA_IdPaese or ''
-            # -----                     2.2.2.6.1.1 - Id Paese
-            x_3_2_2_6_1_1_id_paese = etree.SubElement(
-                x_3_2_2_6_1_id_fiscale_iva,
+            # -----                 2.2.1.1.1 - Id Paese
+            x_3_2_1_1_1_id_paese = etree.SubElement(
+                x_3_2_1_1_id_fiscale_iva,
                 etree.QName("IdPaese"))
-            x_3_2_2_6_1_1_id_paese.text = \
-                partner_invoice.cedente_rf_IdFiscaleIVA_IdPaese or ''
-            # -----                     2.2.2.6.1.2 - Id Codice
-            x_3_2_2_6_1_2_id_codice = etree.SubElement(
-                x_3_2_2_6_1_id_fiscale_iva,
+            x_3_2_1_1_1_id_paese.text = \
+                partner_invoice.cedente_IdFiscaleIVA_IdPaese or ''
+            # -----                 2.2.1.1.2 - Id Codice
+            x_3_2_1_1_2_id_codice = etree.SubElement(
+                x_3_2_1_1_id_fiscale_iva,
                 etree.QName("IdCodice"))
-            x_3_2_2_6_1_2_id_codice.text = \
-                partner_invoice.cedente_rf_IdFiscaleIVA_IdCodice or ''
-            # -----                 2.2.2.6.2 - Denominazione
-            x_3_2_2_6_2_denominazione = etree.SubElement(
-                x_3_2_2_6_rappresentante_fiscale,
-                etree.QName("Denominazione"))
-            x_3_2_2_6_2_denominazione.text = \
-                encode_for_export(partner_invoice.cedente_rf_Denominazione or '', 80)
-            # -----                 2.2.2.6.3 - Nome
-            x_3_2_2_6_3_nome = etree.SubElement(
-                x_3_2_2_6_rappresentante_fiscale,
-                etree.QName("Nome"))
-            x_3_2_2_6_3_nome.text = \
-                encode_for_export(partner_invoice.cedente_rf_Nome or '', 60)
-            # -----                 2.2.2.6.4 - Cognome
-            x_3_2_2_6_4_cognome = etree.SubElement(
-                x_3_2_2_6_rappresentante_fiscale,
-                etree.QName("Cognome"))
-            x_3_2_2_6_4_cognome.text = \
-                encode_for_export(partner_invoice.cedente_rf_Cognome or '', 60)
-
-            for invoice in partner_invoice.fatture_ricevute_body_ids:
-                # -----         2.2.3 - Dati Fattura Body DTE
-                x_3_2_3_dati_fattura_body_dte = etree.SubElement(
-                    x_3_2_cedente_prestatore,
-                    etree.QName("DatiFatturaBodyDTR"))
-                # -----             2.2.3.1 - Dati Generali
-                x_3_2_3_1_dati_generali = etree.SubElement(
+            x_3_2_1_1_2_id_codice.text = \
+                partner_invoice.cedente_IdFiscaleIVA_IdCodice or ''
+        # -----             2.2.1.2 - Codice Fiscale
+        x_3_2_1_2_codice_fiscale = etree.SubElement(
+            x_3_2_1_identificativi_fiscali,
+            etree.QName("CodiceFiscale"))
+        x_3_2_1_2_codice_fiscale.text = \
+            partner_invoice.cedente_CodiceFiscale or ''
+        # -----         2.2.2 - AltriDatiIdentificativi
+        x_3_2_2_altri_identificativi = etree.SubElement(
+            x_3_2_cedente_prestatore,
+            etree.QName("AltriDatiIdentificativi"))
+        # -----             2.2.2.1 - Denominazione
+        x_3_2_2_1_altri_identificativi_denominazione = etree.SubElement(
+            x_3_2_2_altri_identificativi,
+            etree.QName("Denominazione"))
+        x_3_2_2_1_altri_identificativi_denominazione.text = \
+            encode_for_export(partner_invoice.cedente_Denominazione or '', 80)
+        # -----             2.2.2.2 - Nome
+        x_3_2_2_2_nome = etree.SubElement(
+            x_3_2_2_altri_identificativi,
+            etree.QName("Nome"))
+        x_3_2_2_2_nome.text = \
+            encode_for_export(partner_invoice.cedente_Nome or '', 60)
+        # -----             2.2.2.3 - Cognome
+        x_3_2_2_3_cognome = etree.SubElement(
+            x_3_2_2_altri_identificativi,
+            etree.QName("Cognome"))
+        x_3_2_2_3_cognome.text = \
+            encode_for_export(partner_invoice.cedente_Cognome or '', 60)
+        # -----             2.2.2.4 - Sede
+        x_3_2_2_4_sede = etree.SubElement(
+            x_3_2_2_altri_identificativi,
+            etree.QName("Sede"))
+        # -----                 2.2.2.4.1 - Indirizzo
+        x_3_2_2_4_1_indirizzo = etree.SubElement(
+            x_3_2_2_4_sede,
+            etree.QName("Indirizzo"))
+        x_3_2_2_4_1_indirizzo.text = \
+            encode_for_export(partner_invoice.cedente_sede_Indirizzo or '', 60)
+        # -----                 2.2.2.4.2 - Numero Civico
+        x_3_2_2_4_2_numero_civico = etree.SubElement(
+            x_3_2_2_4_sede,
+            etree.QName("NumeroCivico"))
+        x_3_2_2_4_2_numero_civico.text = \
+            encode_for_export(partner_invoice.cedente_sede_NumeroCivico or '', 8,
+                              encoding='ascii')
+        # -----                 2.2.2.4.3 - CAP
+        x_3_2_2_4_3_cap = etree.SubElement(
+            x_3_2_2_4_sede,
+            etree.QName("CAP"))
+        x_3_2_2_4_3_cap.text = \
+            encode_for_export(partner_invoice.cedente_sede_Cap or '', 5,
+                              encoding='ascii')
+        # -----                 2.2.2.4.4 - Comune
+        x_3_2_2_4_4_comune = etree.SubElement(
+            x_3_2_2_4_sede,
+            etree.QName("Comune"))
+        x_3_2_2_4_4_comune.text = \
+            encode_for_export(partner_invoice.cedente_sede_Comune or '', 60)
+        # -----                 2.2.2.4.5 - Provincia
+        x_3_2_2_4_5_provincia = etree.SubElement(
+            x_3_2_2_4_sede,
+            etree.QName("Provincia"))
+        x_3_2_2_4_5_provincia.text = \
+            partner_invoice.cedente_sede_Provincia or ''
+        # -----                 2.2.2.4.6 - Nazione
+        x_3_2_2_4_6_nazione = etree.SubElement(
+            x_3_2_2_4_sede,
+            etree.QName("Nazione"))
+        x_3_2_2_4_6_nazione.text = \
+            partner_invoice.cedente_sede_Nazione or ''
+        # -----             2.2.2.5 - Stabile Organizzazione
+        x_3_2_2_5_stabile_organizzazione = etree.SubElement(
+            x_3_2_2_altri_identificativi,
+            etree.QName("StabileOrganizzazione"))
+        # -----                 2.2.2.5.1 - Indirizzo
+        x_3_2_2_5_1_indirizzo = etree.SubElement(
+            x_3_2_2_5_stabile_organizzazione,
+            etree.QName("Indirizzo"))
+        x_3_2_2_5_1_indirizzo.text = \
+            encode_for_export(partner_invoice.cedente_so_Indirizzo or '', 60)
+        # -----                 2.2.2.5.2 - Numero Civico
+        x_3_2_2_5_2_numero_civico = etree.SubElement(
+            x_3_2_2_5_stabile_organizzazione,
+            etree.QName("NumeroCivico"))
+        x_3_2_2_5_2_numero_civico.text = \
+            encode_for_export(partner_invoice.cedente_so_NumeroCivico or '', 8,
+                              encoding='ascii')
+        # -----                 2.2.2.5.3 - CAP
+        x_3_2_2_5_3_cap = etree.SubElement(
+            x_3_2_2_5_stabile_organizzazione,
+            etree.QName("CAP"))
+        x_3_2_2_5_3_cap.text = \
+            encode_for_export(partner_invoice.cedente_so_Cap or '', 5,
+                              encoding='ascii')
+        # -----                 2.2.2.5.4 - Comune
+        x_3_2_2_5_4_comune = etree.SubElement(
+            x_3_2_2_5_stabile_organizzazione,
+            etree.QName("Comune"))
+        x_3_2_2_5_4_comune.text = \
+            encode_for_export(partner_invoice.cedente_so_Comune or '', 60)
+        # -----                 2.2.2.5.5 - Provincia
+        x_3_2_2_5_5_provincia = etree.SubElement(
+            x_3_2_2_5_stabile_organizzazione,
+            etree.QName("Provincia"))
+        x_3_2_2_5_5_provincia.text = \
+            partner_invoice.cedente_so_Provincia or ''
+        # -----                 2.2.2.5.6 - Nazione
+        x_3_2_2_5_6_nazione = etree.SubElement(
+            x_3_2_2_5_stabile_organizzazione,
+            etree.QName("Nazione"))
+        x_3_2_2_5_6_nazione.text = \
+            partner_invoice.cedente_so_Nazione or ''
+        # -----             2.2.2.6 - Rappresentante Fiscale
+        x_3_2_2_6_rappresentante_fiscale = etree.SubElement(
+            x_3_2_2_altri_identificativi,
+            etree.QName("RappresentanteFiscale"))
+        # -----                 2.2.2.6.1 - Id Fiscale IVA
+        x_3_2_2_6_1_id_fiscale_iva = etree.SubElement(
+            x_3_2_2_6_rappresentante_fiscale,
+            etree.QName("IdFiscaleIVA"))
+        x_3_2_2_6_rappresentante_fiscale.text = \
+            partner_invoice.cedente_rf_IdFiscaleIVA_IdPaese or ''
+        # -----                     2.2.2.6.1.1 - Id Paese
+        x_3_2_2_6_1_1_id_paese = etree.SubElement(
+            x_3_2_2_6_1_id_fiscale_iva,
+            etree.QName("IdPaese"))
+        x_3_2_2_6_1_1_id_paese.text = \
+            partner_invoice.cedente_rf_IdFiscaleIVA_IdPaese or ''
+        # -----                     2.2.2.6.1.2 - Id Codice
+        x_3_2_2_6_1_2_id_codice = etree.SubElement(
+            x_3_2_2_6_1_id_fiscale_iva,
+            etree.QName("IdCodice"))
+        x_3_2_2_6_1_2_id_codice.text = \
+            partner_invoice.cedente_rf_IdFiscaleIVA_IdCodice or ''
+        # -----                 2.2.2.6.2 - Denominazione
+        x_3_2_2_6_2_denominazione = etree.SubElement(
+            x_3_2_2_6_rappresentante_fiscale,
+            etree.QName("Denominazione"))
+        x_3_2_2_6_2_denominazione.text = \
+            encode_for_export(partner_invoice.cedente_rf_Denominazione or '', 80)
+        # -----                 2.2.2.6.3 - Nome
+        x_3_2_2_6_3_nome = etree.SubElement(
+            x_3_2_2_6_rappresentante_fiscale,
+            etree.QName("Nome"))
+        x_3_2_2_6_3_nome.text = \
+            encode_for_export(partner_invoice.cedente_rf_Nome or '', 60)
+        # -----                 2.2.2.6.4 - Cognome
+        x_3_2_2_6_4_cognome = etree.SubElement(
+            x_3_2_2_6_rappresentante_fiscale,
+            etree.QName("Cognome"))
+        x_3_2_2_6_4_cognome.text = \
+            encode_for_export(partner_invoice.cedente_rf_Cognome or '', 60)
+
+        for invoice in invoices:
+            # -----         2.2.3 - Dati Fattura Body DTE
+            x_3_2_3_dati_fattura_body_dte = etree.SubElement(
+                x_3_2_cedente_prestatore,
+                etree.QName("DatiFatturaBodyDTR"))
+            # -----             2.2.3.1 - Dati Generali
+            x_3_2_3_1_dati_generali = etree.SubElement(
+                x_3_2_3_dati_fattura_body_dte,
+                etree.QName("DatiGenerali"))
+            # -----                 2.2.3.1.1 - Tipo Documento
+            x_3_2_3_1_1_tipo_documento = etree.SubElement(
+                x_3_2_3_1_dati_generali,
+                etree.QName("TipoDocumento"))
+            x_3_2_3_1_1_tipo_documento.text = \
+                invoice.dati_fattura_TipoDocumento.code or ''
+            # -----                 2.2.3.1.2 - Data
+            x_3_2_3_1_2_data = etree.SubElement(
+                x_3_2_3_1_dati_generali,
+                etree.QName("Data"))
+            x_3_2_3_1_2_data.text = fields.Date.to_string(
+                invoice.dati_fattura_Data) or ''
+            # -----                 2.2.3.1.3 - Numero
+            x_3_2_3_1_3_numero = etree.SubElement(
+                x_3_2_3_1_dati_generali,
+                etree.QName("Numero"))
+            x_3_2_3_1_3_numero.text = invoice.dati_fattura_Numero or ''
+            # -----                 2.2.3.1.4 - Data Registrazione
+            x_3_2_3_1_4_data_registrazione = etree.SubElement(
+                x_3_2_3_1_dati_generali,
+                etree.QName("DataRegistrazione"))
+            x_3_2_3_1_4_data_registrazione.text = fields.Date.to_string(
+                invoice.dati_fattura_DataRegistrazione) or ''
+            for tax in invoice.dati_fattura_iva_ids:
+                # -----             2.2.3.2 - Dati Riepilogo
+                x_3_2_3_2_riepilogo = etree.SubElement(
                     x_3_2_3_dati_fattura_body_dte,
-                    etree.QName("DatiGenerali"))
-                # -----                 2.2.3.1.1 - Tipo Documento
-                x_3_2_3_1_1_tipo_documento = etree.SubElement(
-                    x_3_2_3_1_dati_generali,
-                    etree.QName("TipoDocumento"))
-                x_3_2_3_1_1_tipo_documento.text = \
-                    invoice.dati_fattura_TipoDocumento.code or ''
-                # -----                 2.2.3.1.2 - Data
-                x_3_2_3_1_2_data = etree.SubElement(
-                    x_3_2_3_1_dati_generali,
-                    etree.QName("Data"))
-                x_3_2_3_1_2_data.text = fields.Date.to_string(
-                    invoice.dati_fattura_Data) or ''
-                # -----                 2.2.3.1.3 - Numero
-                x_3_2_3_1_3_numero = etree.SubElement(
-                    x_3_2_3_1_dati_generali,
-                    etree.QName("Numero"))
-                x_3_2_3_1_3_numero.text = invoice.dati_fattura_Numero or ''
-                # -----                 2.2.3.1.4 - Data Registrazione
-                x_3_2_3_1_4_data_registrazione = etree.SubElement(
-                    x_3_2_3_1_dati_generali,
-                    etree.QName("DataRegistrazione"))
-                x_3_2_3_1_4_data_registrazione.text = fields.Date.to_string(
-                    invoice.dati_fattura_DataRegistrazione) or ''
-                for tax in invoice.dati_fattura_iva_ids:
-                    # -----             2.2.3.2 - Dati Riepilogo
-                    x_3_2_3_2_riepilogo = etree.SubElement(
-                        x_3_2_3_dati_fattura_body_dte,
-                        etree.QName("DatiRiepilogo"))
-                    # -----                 2.2.3.2.1 - Imponibile Importo
-                    x_3_2_3_2_1_imponibile_importo = etree.SubElement(
-                        x_3_2_3_2_riepilogo,
-                        etree.QName("ImponibileImporto"))
-                    x_3_2_3_2_1_imponibile_importo.text = \
-                        format_decimal(tax.ImponibileImporto)
-                    # -----                 2.2.3.2.2 - Dati IVA
-                    x_3_2_3_2_2_dati_iva = etree.SubElement(
-                        x_3_2_3_2_riepilogo,
-                        etree.QName("DatiIVA"))
-                    # -----                     2.2.3.2.2.1 - Imposta
-                    x_3_2_3_2_2_1_imposta = etree.SubElement(
-                        x_3_2_3_2_2_dati_iva,
-                        etree.QName("Imposta"))
-                    x_3_2_3_2_2_1_imposta.text = format_decimal(tax.Imposta)
-                    # -----                     2.2.3.2.2.2 - Aliquota
-                    x_3_2_3_2_2_2_aliquota = etree.SubElement(
-                        x_3_2_3_2_2_dati_iva,
-                        etree.QName("Aliquota"))
-                    x_3_2_3_2_2_2_aliquota.text = format_decimal(tax.Aliquota)
-                    # -----                 2.2.3.2.3 - Natura
-                    x_3_2_3_2_3_natura = etree.SubElement(
-                        x_3_2_3_2_riepilogo,
-                        etree.QName("Natura"))
-                    x_3_2_3_2_3_natura.text = \
-                        tax.Natura_id.code if tax.Natura_id else ''
-                    # -----                 2.2.3.2.4 - Detraibile
-                    x_3_2_3_2_4_detraibile = etree.SubElement(
-                        x_3_2_3_2_riepilogo,
-                        etree.QName("Detraibile"))
-                    x_3_2_3_2_4_detraibile.text = format_decimal(
-                        tax.Detraibile)
-                    # -----                 2.2.3.2.5 - Deducibile
-                    x_3_2_3_2_5_deducibile = etree.SubElement(
-                        x_3_2_3_2_riepilogo,
-                        etree.QName("Deducibile"))
-                    x_3_2_3_2_5_deducibile.text = tax.Deducibile or ''
-                    # -----                 2.2.3.2.6 - Esigibilita IVA
-                    x_3_2_3_2_6_esagibilita_iva = etree.SubElement(
-                        x_3_2_3_2_riepilogo,
-                        etree.QName("EsigibilitaIVA"))
-                    x_3_2_3_2_6_esagibilita_iva.text = tax.EsigibilitaIVA or ''
+                    etree.QName("DatiRiepilogo"))
+                # -----                 2.2.3.2.1 - Imponibile Importo
+                x_3_2_3_2_1_imponibile_importo = etree.SubElement(
+                    x_3_2_3_2_riepilogo,
+                    etree.QName("ImponibileImporto"))
+                x_3_2_3_2_1_imponibile_importo.text = \
+                    format_decimal(tax.ImponibileImporto)
+                # -----                 2.2.3.2.2 - Dati IVA
+                x_3_2_3_2_2_dati_iva = etree.SubElement(
+                    x_3_2_3_2_riepilogo,
+                    etree.QName("DatiIVA"))
+                # -----                     2.2.3.2.2.1 - Imposta
+                x_3_2_3_2_2_1_imposta = etree.SubElement(
+                    x_3_2_3_2_2_dati_iva,
+                    etree.QName("Imposta"))
+                x_3_2_3_2_2_1_imposta.text = format_decimal(tax.Imposta)
+                # -----                     2.2.3.2.2.2 - Aliquota
+                x_3_2_3_2_2_2_aliquota = etree.SubElement(
+                    x_3_2_3_2_2_dati_iva,
+                    etree.QName("Aliquota"))
+                x_3_2_3_2_2_2_aliquota.text = format_decimal(tax.Aliquota)
+                # -----                 2.2.3.2.3 - Natura
+                x_3_2_3_2_3_natura = etree.SubElement(
+                    x_3_2_3_2_riepilogo,
+                    etree.QName("Natura"))
+                x_3_2_3_2_3_natura.text = \
+                    tax.Natura_id.code if tax.Natura_id else ''
+                # -----                 2.2.3.2.4 - Detraibile
+                x_3_2_3_2_4_detraibile = etree.SubElement(
+                    x_3_2_3_2_riepilogo,
+                    etree.QName("Detraibile"))
+                x_3_2_3_2_4_detraibile.text = format_decimal(
+                    tax.Detraibile)
+                # -----                 2.2.3.2.5 - Deducibile
+                x_3_2_3_2_5_deducibile = etree.SubElement(
+                    x_3_2_3_2_riepilogo,
+                    etree.QName("Deducibile"))
+                x_3_2_3_2_5_deducibile.text = tax.Deducibile or ''
+                # -----                 2.2.3.2.6 - Esigibilita IVA
+                x_3_2_3_2_6_esagibilita_iva = etree.SubElement(
+                    x_3_2_3_2_riepilogo,
+                    etree.QName("EsigibilitaIVA"))
+                x_3_2_3_2_6_esagibilita_iva.text = tax.EsigibilitaIVA or ''
+        return x_3_2_cedente_prestatore
 
+    def _export_xml_get_dtr(self):
+        # ----- 3 - DTR
+        x_3_dtr = etree.Element(
+            etree.QName("DTR"))
+        x_3_dtr.append(self._export_xml_get_cessionario_committente_dtr())
+        for partner_invoice in self.fatture_ricevute_ids:
+            x_3_dtr.append(
+                self._export_xml_get_cedente_prestatore_dtr(
+                    partner_invoice))
         return x_3_dtr
 
     def _export_xml_get_ann(self):
@@ -2046,46 +2134,148 @@ class ComunicazioneDatiIva(models.Model):
         return x_4_ann
 
     @api.multi
-    def get_export_xml_filename(self):
+    def get_export_xml_filename(self, part=0):
         self.ensure_one()
+        if part >= len(PART_CODES):
+            raise UserError(_(
+                "Communication %s cannot be exported in more than %d files."
+            ) % (self.identificativo, len(PART_CODES)))
         filename = '{id}_{type}_{ann}{number}.{ext}'.format(
             id=self.company_id.vat or '',
             type='DF',
-            ann='A' if self.dati_trasmissione == 'ANN' else '0',
+            ann='A' if self.dati_trasmissione == 'ANN' else PART_CODES[part],
             number=str(self.identificativo or 0).rjust(4, '0'),
             ext='xml',
         )
         return filename
 
-    @api.multi
-    def get_export_xml(self):
+    def _get_export_xml_parts(self):
+        """Split the partner sections in parts that can be sent
+        in a single file: at most MAX_FILE_PARTNERS sections per file
+        and MAX_PARTNER_INVOICES invoices per section.
+        Invoices of the same section in excess are moved to the following
+        parts, so that a partner is never repeated in a file.
+
+        :return: list of parts, each one is a list of
+            (section, invoices) tuples
+        """
+        self.ensure_one()
+        if self.dati_trasmissione == 'DTE':
+            field_name = 'fatture_emesse_ids'
+        elif self.dati_trasmissione == 'DTR':
+            field_name = 'fatture_ricevute_ids'
+        else:
+            return [[]]
+        layers = []
+        for section in self[field_name]:
+            invoices = section[SECTION_BODY_FIELDS[field_name]]
+            for layer_index, invoice_index in enumerate(range(
+                    0, len(invoices) or 1, MAX_PARTNER_INVOICES)):
+                if layer_index == len(layers):
+                    layers.append([])
+                layers[layer_index].append((
+                    section,
+                    invoices[invoice_index:
+                             invoice_index + MAX_PARTNER_INVOICES]))
+        parts = []
+        for layer in layers:
+            for index in range(0, len(layer), MAX_FILE_PARTNERS):
+                parts.append(layer[index:index + MAX_FILE_PARTNERS])
+        return parts or [[]]
+
+    def _write_export_xml(self, output, blocks=None, progressivo_invio=None):
+        """Write the XML file of the communication in `output`,
+        one partner section at a time.
+
+        :param output: file object the XML is written into
+        :param blocks: list of (section, invoices) tuples to be exported,
+            all the sections of the communication if None
+        :param progressivo_invio: value of ProgressivoInvio,
+            the identifier of the communication if None
+        """
         self.ensure_one()
         self._validate()
         # ----- 0 - Dati Fattura
         x_0_dati_fattura = self._export_xml_get_dati_fattura()
-        # ----- 1 - Dati Fattura header
-        if self.dati_trasmissione in ('DTE', 'DTR'):
-            x_1_dati_fattura_header = (
-                self._export_xml_get_dati_fattura_header())
-            x_0_dati_fattura.append(x_1_dati_fattura_header)
-        # ----- 2 - DTE
-        if self.dati_trasmissione == 'DTE':
-            x_2_dte = self._export_xml_get_dte()
-            x_0_dati_fattura.append(x_2_dte)
-        # ----- 3 - DTR
-        elif self.dati_trasmissione == 'DTR':
-            x_3_dtr = self._export_xml_get_dtr()
-            x_0_dati_fattura.append(x_3_dtr)
-        # ----- 4 - ANN
-        elif self.dati_trasmissione == 'ANN':
-            x_4_ann = self._export_xml_get_ann()
-            x_0_dati_fattura.append(x_4_ann)
-        # ----- Remove empty nodes
-        clear_xml(x_0_dati_fattura)
-        # ----- Create XML
-        xml_string = etree.tostring(
-            x_0_dati_fattura, encoding='latin1', method='xml', pretty_print=True)
-        return xml_string
+        with etree.xmlfile(output, encoding='latin1') as xml_file:
+            xml_file.write_declaration()
+            with xml_file.element(
+                    x_0_dati_fattura.tag, attrib=x_0_dati_fattura.attrib,
+                    nsmap=x_0_dati_fattura.nsmap):
+                xml_file.write('\n')
+                # ----- 1 - Dati Fattura header
+                if self.dati_trasmissione in ('DTE', 'DTR'):
+                    x_1_dati_fattura_header = (
+                        self._export_xml_get_dati_fattura_header())
+                    if progressivo_invio:
+                        x_1_dati_fattura_header.find(
+                            'ProgressivoInvio').text = progressivo_invio
+                    write_xml_element(xml_file, x_1_dati_fattura_header)
+                # ----- 2 - DTE
+                if self.dati_trasmissione == 'DTE':
+                    if blocks is None:
+                        blocks = [
+                            (section, None)
+                            for section in self.fatture_emesse_ids]
+                    with xml_file.element('DTE'):
+                        xml_file.write('\n')
+                        write_xml_element(
+                            xml_file,
+                            self._export_xml_get_cedente_prestatore_dte())
+                        for section, invoices in blocks:
+                            write_xml_element(
+                                xml_file,
+                                self._export_xml_get_cessionario_committente_dte(
+                                    section, invoices))
+                # ----- 3 - DTR
+                elif self.dati_trasmissione == 'DTR':
+                    if blocks is None:
+                        blocks = [
+                            (section, None)
+                            for section in self.fatture_ricevute_ids]
+                    with xml_file.element('DTR'):
+                        xml_file.write('\n')
+                        write_xml_element(
+                            xml_file,
+                            self._export_xml_get_cessionario_committente_dtr())
+                        for section, invoices in blocks:
+                            write_xml_element(
+                                xml_file,
+                                self._export_xml_get_cedente_prestatore_dtr(
+                                    section, invoices))
+                # ----- 4 - ANN
+                elif self.dati_trasmissione == 'ANN':
+                    write_xml_element(xml_file, self._export_xml_get_ann())
+                xml_file.write('\n')
+
+    @api.multi
+    def get_export_xml(self):
+        self.ensure_one()
+        output = io.BytesIO()
+        self._write_export_xml(output)
+        return output.getvalue()
+
+    @api.multi
+    def get_export_xml_files(self):
+        """Export the communication in files that respect the limits
+        of partners and invoices per file, without splitting
+        the communication.
+
+        :return: list of (file name, XML content) tuples
+        """
+        self.ensure_one()
+        parts = self._get_export_xml_parts()
+        if len(parts) == 1:
+            return [(self.get_export_xml_filename(), self.get_export_xml())]
+        files = []
+        for part, blocks in enumerate(parts):
+            filename = self.get_export_xml_filename(part=part)
+            output = io.BytesIO()
+            self._write_export_xml(
+                output, blocks=blocks,
+                progressivo_invio='%s-%d' % (self.identificativo, part + 1))
+            files.append((filename, output.getvalue()))
+        return files
 
 
 class ComunicazioneDatiIvaFattureEmesse(models.Model):
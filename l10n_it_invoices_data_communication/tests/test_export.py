@@ -0,0 +1,74 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import mock
+from lxml import etree
+
+from odoo.tests.common import TransactionCase
+
+COMMUNICATION_MODULE = \
+    'odoo.addons.l10n_it_invoices_data_communication.models.communication'
+
+
+class TestExport(TransactionCase):
+
+    def setUp(self):
+        super(TestExport, self).setUp()
+        document_type = self.env['fiscal.document.type'].search([], limit=1)
+        sections = []
+        # Partner A has 3 invoices, partners B and C have 1 invoice
+        for partner_name, invoices_count in (('A', 3), ('B', 1), ('C', 1)):
+            sections.append((0, 0, {
+                'cessionario_Denominazione': partner_name,
+                'fatture_emesse_body_ids': [(0, 0, {
+                    'posizione': index + 1,
+                    'dati_fattura_TipoDocumento': document_type.id,
+                    'dati_fattura_Data': '2019-01-01',
+                    'dati_fattura_Numero': '%s/%d' % (partner_name, index),
+                }) for index in range(invoices_count)],
+            }))
+        self.communication = self.env['comunicazione.dati.iva'].create({
+            'date_start': '2019-01-01',
+            'date_end': '2019-03-31',
+            'dati_trasmissione': 'DTE',
+            'fatture_emesse': True,
+            'fatture_emesse_ids': sections,
+        })
+
+    def test_export_single_file(self):
+        files = self.communication.get_export_xml_files()
+        self.assertEqual(len(files), 1)
+        self.assertEqual(
+            files[0][0], self.communication.get_export_xml_filename())
+
+    def test_export_parts(self):
+        with mock.patch(COMMUNICATION_MODULE + '.MAX_FILE_PARTNERS', 2), \
+                mock.patch(COMMUNICATION_MODULE + '.MAX_PARTNER_INVOICES', 2):
+            files = self.communication.get_export_xml_files()
+        # A (2 invoices) and B, then C, then A (1 invoice)
+        self.assertEqual(len(files), 3)
+        file_names = [file_name for file_name, content in files]
+        self.assertEqual(len(set(file_names)), len(files))
+        progressivi = set()
+        exported_numbers = []
+        for file_name, content in files:
+            root = etree.fromstring(content)
+            progressivi.add(root.findtext('.//ProgressivoInvio'))
+            sections = root.findall('.//CessionarioCommittenteDTE')
+            self.assertLessEqual(len(sections), 2)
+            partner_names = [
+                section.findtext('AltriDatiIdentificativi/Denominazione')
+                for section in sections]
+            # A partner is never repeated in a file
+            self.assertEqual(
+                len(set(partner_names)), len(partner_names), file_name)
+            for section in sections:
+                numbers = [
+                    element.text for element in section.iterfind(
+                        'DatiFatturaBodyDTE/DatiGenerali/Numero')]
+                self.assertLessEqual(len(numbers), 2)
+                exported_numbers.extend(numbers)
+        self.assertEqual(len(progressivi), len(files))
+        # Every invoice is exported once
+        self.assertEqual(
+            sorted(exported_numbers),
+            ['A/0', 'A/1', 'A/2', 'B/0', 'C/0'])
@@ -1,5 +1,8 @@
 
 import base64
+import io
+import os
+import zipfile
 from odoo import api, fields, models, exceptions, _
 
 
@@ -27,8 +30,19 @@ class ComunicazioneDatiIvaExportFile(models.TransientModel):
         for wizard in self:
             for comunicazione in self.env['comunicazione.dati.iva'].\
                     browse(comunicazione_ids):
-                out = base64.encodebytes(comunicazione.get_export_xml())
-                filename = comunicazione.get_export_xml_filename()
+                files = comunicazione.get_export_xml_files()
+                if len(files) == 1:
+                    filename, content = files[0]
+                else:
+                    # Communication exceeding the limits of a single file
+                    filename = '%s.zip' % os.path.splitext(files[0][0])[0]
+                    output = io.BytesIO()
+                    with zipfile.ZipFile(
+                            output, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                        for part_filename, part_content in files:
+                            zip_file.writestr(part_filename, part_content)
+                    content = output.getvalue()
+                out = base64.encodebytes(content)
                 wizard.sudo().file_export = out
                 wizard.filename = filename
             model_data_obj = self.env['ir.model.data']
@@ -10,6 +10,7 @@ import time
 
 class ReportRegistroIva(models.AbstractModel):
     _name = 'report.l10n_it_vat_registries.report_registro_iva'
+    _inherit = 'l10n_it.chunked.report.mixin'
     _description = 'Report VAT registry'
 
     @api.model
@@ -25,6 +26,8 @@ class ReportRegistroIva(models.AbstractModel):
             'data': data['form'],
             'docs': self.env['account.move'].browse(data['ids']),
             'get_move': self._get_move,
+            'registry_rows': self._get_registry_rows(
+                data['ids'], data['form']),
             'tax_lines': self._get_tax_lines,
             'format_date': self._format_date,
             'from_date': self._format_date(
@@ -37,6 +40,7 @@ class ReportRegistroIva(models.AbstractModel):
             'env': self.env,
             'formatLang': formatLang,
             'compute_totals_tax': self._compute_totals_tax,
+            'compute_totals_taxes': self._compute_totals_taxes,
             'l10n_it_count_fiscal_page_base': data['form']['fiscal_page_base'],
             'only_totals': data['form']['only_totals'],
             'date_format': date_format,
@@ -61,44 +65,115 @@ class ReportRegistroIva(models.AbstractModel):
         return self.env['account.invoice'].search([
             ('move_id', '=', move.id)])
 
+    def _get_invoices_by_move(self, moves):
+        invoices = self.env['account.invoice'].search([
+            ('move_id', 'in', moves.ids)])
+        res = {}
+        for invoice in invoices:
+            res[invoice.move_id.id] = res.get(
+                invoice.move_id.id, self.env['account.invoice']) | invoice
+        return res
+
+    def _prefetch_moves(self, moves):
+        """Load in cache, with a few queries for all the moves,
+        the records used to print them"""
+        moves.mapped('partner_id.vat')
+        moves.mapped('journal_id.type')
+        move_lines = moves.mapped('line_ids')
+        move_lines.mapped('account_id.internal_type')
+        taxes = move_lines.mapped('tax_ids') | move_lines.mapped('tax_line_id')
+        taxes.mapped('parent_tax_ids.name')
+
+    def _get_registry_rows(self, move_ids, data):
+        """Compute all the data of the moves to be printed in the registry.
+
+        Returns:
+            A list of dict, one for each move, with the move itself,
+            its taxes as returned by _get_tax_lines and its total
+
+        """
+        moves = self._get_move(move_ids)
+        self._prefetch_moves(moves)
+        invoices_by_move = self._get_invoices_by_move(moves)
+        rows = []
+        for move in moves:
+            inv_taxes, used_taxes = self._get_tax_lines(
+                move, data,
+                invoice=invoices_by_move.get(
+                    move.id, self.env['account.invoice']))
+            rows.append({
+                'move': move,
+                'inv_taxes': inv_taxes,
+                'used_taxes': used_taxes,
+                'total': self._get_move_total(move),
+            })
+        return rows
+
+    def _get_used_taxes(self, move_ids, data):
+        """Taxes printed for the moves, i.e. the TAXES_USED
+        returned by _get_tax_lines, without computing the amounts"""
+        tax_ids = set()
+        for move in self._get_move(move_ids):
+            for move_line in self._get_move_line(move, data):
+                registry_tax = self._get_registry_tax(
+                    move_line, data['registry_type'])
+                if registry_tax is not None:
+                    tax_ids.add(registry_tax[0].id)
+        return self.env['account.tax'].browse(tax_ids)
+
     def _get_move_line(self, move, data):
         return [move_line for move_line in move.line_ids]
 
-    def _tax_amounts_by_tax_id(self, move, move_lines, registry_type):
-        res = {}
+    def _get_registry_tax(self, move_line, registry_type):
+        """
+        Returns:
+            A tuple (tax, is_base, set_cee_absolute_value) where tax is
+            the account.tax `move_line` is printed under,
+            None if `move_line` is not printed in the registry
 
-        for move_line in move_lines:
-            set_cee_absolute_value = False
-            if not(move_line.tax_line_id or move_line.tax_ids):
-                continue
+        """
+        set_cee_absolute_value = False
+        if not (move_line.tax_line_id or move_line.tax_ids):
+            return None
+
+        if move_line.tax_ids and len(move_line.tax_ids) != 1:
+            raise UserError(
+                _("Move line %s has too many base taxes")
+                % move_line.name)
+
+        if move_line.tax_ids:
+            tax = move_line.tax_ids[0]
+            is_base = True
+        else:
+            tax = move_line.tax_line_id
+            is_base = False
 
-            if move_line.tax_ids and len(move_line.tax_ids) != 1:
-                    raise UserError(
-                        _("Move line %s has too many base taxes")
-                        % move_line.name)
+        if (
+            (registry_type == 'customer' and tax.cee_type == 'sale') or
+            (registry_type == 'supplier' and tax.cee_type == 'purchase')
+        ):
+            set_cee_absolute_value = True
 
-            if move_line.tax_ids:
-                tax = move_line.tax_ids[0]
-                is_base = True
-            else:
-                tax = move_line.tax_line_id
-                is_base = False
+        elif tax.cee_type:
+            return None
 
-            if (
-                (registry_type == 'customer' and tax.cee_type == 'sale') or
-                (registry_type == 'supplier' and tax.cee_type == 'purchase')
-            ):
-                set_cee_absolute_value = True
+        if tax.parent_tax_ids and len(tax.parent_tax_ids) == 1:
+            # we group by main tax
+            tax = tax.parent_tax_ids[0]
 
-            elif tax.cee_type:
-                continue
+        if tax.exclude_from_registries:
+            return None
 
-            if tax.parent_tax_ids and len(tax.parent_tax_ids) == 1:
-                # we group by main tax
-                tax = tax.parent_tax_ids[0]
+        return tax, is_base, set_cee_absolute_value
 
-            if tax.exclude_from_registries:
+    def _tax_amounts_by_tax_id(self, move, move_lines, registry_type):
+        res = {}
+
+        for move_line in move_lines:
+            registry_tax = self._get_registry_tax(move_line, registry_type)
+            if registry_tax is None:
                 continue
+            tax, is_base, set_cee_absolute_value = registry_tax
 
             if not res.get(tax.id):
                 res[tax.id] = {
@@ -130,12 +205,14 @@ class ReportRegistroIva(models.AbstractModel):
 
         return res
 
-    def _get_tax_lines(self, move, data):
+    def _get_tax_lines(self, move, data, invoice=None):
 
         """
 
         Args:
             move: the account.move representing the invoice
+            invoice: the account.invoice of the move,
+                searched if not given
 
         Returns:
             A tuple of lists: (INVOICE_TAXES, TAXES_USED)
@@ -149,7 +226,8 @@ class ReportRegistroIva(models.AbstractModel):
         # index è usato per non ripetere la stampa dei dati fattura quando ci
         # sono più codici IVA
         index = 0
-        invoice = self._get_invoice_from_move(move)
+        if invoice is None:
+            invoice = self._get_invoice_from_move(move)
         if 'refund' in move.move_type:
             invoice_type = "NC"
         else:
@@ -211,10 +289,43 @@ class ReportRegistroIva(models.AbstractModel):
             total = -total
         return total
 
+    @api.model
+    def _use_pdf_chunks(self, data):
+        # Chunks without rows would only print the header
+        return not data['form'].get('only_totals') and \
+            super()._use_pdf_chunks(data)
+
+    @api.model
+    def _prepare_chunk_form(self, form, chunk_ids, last):
+        form = super()._prepare_chunk_form(form, chunk_ids, last)
+        # Totals are printed once, after the last move
+        form['print_totals'] = last
+        return form
+
+    @api.model
+    def _prepare_next_chunk_form(self, form, chunk_ids, page_count):
+        form = super()._prepare_next_chunk_form(form, chunk_ids, page_count)
+        used_tax_ids = set(form.get('used_tax_ids', []))
+        used_tax_ids.update(self._get_used_taxes(chunk_ids, form).ids)
+        form['used_tax_ids'] = sorted(used_tax_ids)
+        return form
+
+    def _compute_totals_taxes(self, taxes, data):
+        """
+        Returns:
+            A dictionary {tax_id: (tax_name, base, tax, deductible,
+            undeductible)}
+
+        """
+        return {
+            tax_id: totals[0]
+            for tax_id, totals in taxes._compute_totals_taxes(data).items()
+        }
+
     def _compute_totals_tax(self, tax, data):
         """
         Returns:
             A tuple: (tax_name, base, tax, deductible, undeductible)
 
         """
-        return tax._compute_totals_tax(data)
+        return self._compute_totals_taxes(tax, data)[tax.id]
@@ -76,3 +76,36 @@ class TestRegistry(AccountingTestCase):
         html = report.render_qweb_html(res['data']['ids'], res['data'])
 
         self.assertTrue(b'Tax 10.0' in html[0])
+
+        rows = self.env[
+            'report.l10n_it_vat_registries.report_registro_iva'
+        ]._get_registry_rows(res['data']['ids'], res['data']['form'])
+        invoice_row = [
+            row for row in rows if row['move'] == invoice.move_id][0]
+        self.assertEqual(invoice_row['total'], 110)
+        self.assertEqual(invoice_row['used_taxes'], tax)
+        self.assertEqual(len(invoice_row['inv_taxes']), 1)
+        self.assertEqual(invoice_row['inv_taxes'][0]['invoice_rec'], invoice)
+        self.assertEqual(invoice_row['inv_taxes'][0]['tax'], 10)
+
+        report_model = self.env[
+            'report.l10n_it_vat_registries.report_registro_iva']
+        rows_used_taxes = self.env['account.tax']
+        for row in rows:
+            rows_used_taxes |= row['used_taxes']
+        self.assertEqual(
+            report_model._get_used_taxes(
+                res['data']['ids'], res['data']['form']),
+            rows_used_taxes)
+        form = report_model._prepare_chunk_form(
+            res['data']['form'], [invoice.move_id.id], False)
+        self.assertFalse(form['print_totals'])
+        next_form = report_model._prepare_next_chunk_form(
+            form, [invoice.move_id.id], 3)
+        self.assertEqual(
+            next_form['fiscal_page_base'], form['fiscal_page_base'] + 3)
+        self.assertEqual(next_form['used_tax_ids'], tax.ids)
+        self.assertTrue(report_model._use_pdf_chunks(res['data']))
+        only_totals_data = dict(
+            res['data'], form=dict(res['data']['form'], only_totals=True))
+        self.assertFalse(report_model._use_pdf_chunks(only_totals_data))
@@ -8,14 +8,15 @@ class ReportVatRegistry(models.AbstractModel):
     _inherit = 'report.l10n_it_vat_registries.report_registro_iva'
 
     @api.model
-    def _compute_totals_tax(self, tax, data):
-        res = super()._compute_totals_tax(tax, data)
+    def _compute_totals_taxes(self, taxes, data):
+        res = super()._compute_totals_taxes(taxes, data)
 
-        if tax.is_split_payment:
-            # res = (tax_name, base, tax, deductible, undeductible)
+        for tax in taxes.filtered('is_split_payment'):
+            # res[tax.id] = (tax_name, base, tax, deductible, undeductible)
             #
             # In case of SP tax, SP VAT must not appear as deductible.
             #
-            return (res[0], res[1], res[2], 0.0, res[4])
+            totals = res[tax.id]
+            res[tax.id] = (totals[0], totals[1], totals[2], 0.0, totals[4])
 
         return res
@@ -556,37 +556,40 @@ class ComunicazioneLiquidazioneVp(models.Model):
             quadro.accounto_dovuto = 0
             quadro.metodo_calcolo_acconto = False
 
-    def _get_tax_context(self, period):
+    def _get_base_balances(self, liq):
+        """Base balances of the taxes of the VAT statement `liq`,
+        for all its periods at once"""
+        taxes = (
+            liq.debit_vat_account_line_ids.mapped('tax_id') |
+            liq.credit_vat_account_line_ids.mapped('tax_id')
+        ).filtered(lambda t: not t.vsc_exclude_operation)
+        periods = [
+            (period.date_start, period.date_end)
+            for period in liq.date_range_ids]
+        balances = taxes._get_totals_balances(periods)
         return {
-            'from_date': period.date_start,
-            'to_date': period.date_end,
-        }
+            tax.id: sum(
+                balances[('base', tax.id, period_index)]
+                for period_index in range(len(periods)))
+            for tax in taxes}
 
-    def _compute_imponibile_operazioni_attive(self, liq, period):
+    def _compute_imponibile_operazioni_attive(self, liq, base_balances):
         self.ensure_one()
-        debit_taxes = self.env['account.tax']
-        for debit in liq.debit_vat_account_line_ids:
-            debit_taxes |= debit.tax_id
+        debit_taxes = liq.debit_vat_account_line_ids.mapped('tax_id')
         for debit_tax in debit_taxes:
             if debit_tax.vsc_exclude_operation:
                 continue
-            tax = debit_taxes.with_context(
-                self._get_tax_context(period)).browse(debit_tax.id)
             self.imponibile_operazioni_attive += (
-                tax.base_balance)
+                base_balances[debit_tax.id])
 
-    def _compute_imponibile_operazioni_passive(self, liq, period):
+    def _compute_imponibile_operazioni_passive(self, liq, base_balances):
         self.ensure_one()
-        credit_taxes = self.env['account.tax']
-        for credit in liq.credit_vat_account_line_ids:
-            credit_taxes |= credit.tax_id
+        credit_taxes = liq.credit_vat_account_line_ids.mapped('tax_id')
         for credit_tax in credit_taxes:
             if credit_tax.vsc_exclude_operation:
                 continue
-            tax = credit_taxes.with_context(
-                self._get_tax_context(period)).browse(credit_tax.id)
             self.imponibile_operazioni_passive -= (
-                tax.base_balance)
+                base_balances[credit_tax.id])
 
     @api.multi
     @api.onchange('liquidazioni_ids')
@@ -598,9 +601,11 @@ class ComunicazioneLiquidazioneVp(models.Model):
 
             for liq in quadro.liquidazioni_ids:
 
-                for period in liq.date_range_ids:
-                    quadro._compute_imponibile_operazioni_attive(liq, period)
-                    quadro._compute_imponibile_operazioni_passive(liq, period)
+                base_balances = quadro._get_base_balances(liq)
+                quadro._compute_imponibile_operazioni_attive(
+                    liq, base_balances)
+                quadro._compute_imponibile_operazioni_passive(
+                    liq, base_balances)
 
                 # Iva esigibile
                 for vat_amount in liq.debit_vat_account_line_ids: